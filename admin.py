@@ -3,9 +3,12 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from config import ADMIN_IDS
 import database as db
+from broadcast import start_broadcast
+from metrics import timed_handler
 
 logger = logging.getLogger(__name__)
 
+@timed_handler
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to view bot statistics."""
     user_id = update.effective_user.id
@@ -19,13 +22,17 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = (
         f"📊 **Bot Statistics**\n\n"
         f"👥 Total Users: {stats['total_users']}\n"
+        f"✅ Reachable: {stats['reachable_users']} | 💀 Unreachable: {stats['unreachable_users']}\n"
         f"💬 Active Chats: {stats['active_chats']}\n"
-        f"🔍 In Queue: {stats['in_queue']}"
+        f"🔍 In Queue: {stats['in_queue']}\n"
+        f"🤝 Matches Made: {stats['matches_made']}\n"
+        f"✉️ Messages Relayed: {stats['messages_relayed']}"
     )
     
     await update.message.reply_text(message, parse_mode='Markdown')
 
 
+@timed_handler
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Admin command to broadcast a message to all users.
@@ -39,27 +46,8 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized to use this command.")
         return
     
-    # Get target users (in production, fetch from DB)
-    # For now, we'll just simulate or use a small list if available
-    # Since we don't have a 'all_users' table easily accessible in this snippet, 
-    # we'll assume the admin knows what they are doing or we fetch from stats
-    
-    # Fetch all users from user_settings (best approximation of total users)
-    # Note: This might be slow if there are many users. In prod, use a generator or batching.
-    try:
-        if db.DB_TYPE == "sqlite":
-            async with db.aiosqlite.connect(db.DB_PATH) as conn:
-                async with conn.execute("SELECT user_id FROM user_settings") as cursor:
-                    users = [row[0] for row in await cursor.fetchall()]
-        else:
-            # Supabase
-            resp = db.supabase.table('user_settings').select('user_id').execute()
-            users = [row['user_id'] for row in resp.data]
-    except Exception as e:
-        await update.message.reply_text(f"⚠️ Failed to fetch users: {e}")
-        return
-
-    if not users:
+    total_users = (await db.get_stats())['reachable_users']
+    if not total_users:
         await update.message.reply_text("⚠️ No users found to broadcast to.")
         return
 
@@ -81,26 +69,14 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    await update.message.reply_text(f"📢 Starting broadcast to {len(users)} users...\nContent: {confirm_msg}")
-    
-    success_count = 0
-    fail_count = 0
-    
-    for uid in users:
-        try:
-            if is_reply:
-                await message_to_send.copy(chat_id=uid)
-            else:
-                await context.bot.send_message(chat_id=uid, text=message_to_send, parse_mode='Markdown')
-            success_count += 1
-        except Exception as e:
-            fail_count += 1
-            # logger.error(f"Failed to broadcast to {uid}: {e}")
-            
-    await update.message.reply_text(
-        f"✅ Broadcast complete!\n"
-        f"Success: {success_count}\n"
-        f"Failed: {fail_count}"
-    )
-    
-    logger.info(f"Admin {user_id} broadcasted to {success_count} users (failed {fail_count})")
+    status = await update.message.reply_text(f"📢 Starting broadcast to {total_users} users...\nContent: {confirm_msg}")
+
+    # Delivery runs in the background; progress is edited into the status message
+    if is_reply:
+        broadcast = await db.create_broadcast(update.effective_chat.id, status.message_id,
+                                              from_chat_id=message_to_send.chat_id, message_id=message_to_send.message_id)
+    else:
+        broadcast = await db.create_broadcast(update.effective_chat.id, status.message_id, text=message_to_send)
+    start_broadcast(context.application, broadcast)
+
+    logger.info(f"Admin {user_id} started broadcast {broadcast['id']} to {total_users} users")
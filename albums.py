@@ -0,0 +1,89 @@
+"""
+Collects the messages of a media group (album) so they can be relayed together.
+
+Telegram delivers each item of an album as its own update, usually within a
+few hundred milliseconds of each other. An album is flushed as soon as one of
+these happens:
+
+- no new item arrived for `quiet` seconds (debounce),
+- it reached `max_items` items (Telegram's limit for one album),
+- `deadline` seconds passed since its first item, however busy it still is.
+
+At most `max_albums` albums are held at once; adding one more flushes the
+oldest early, so memory stays bounded.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram sends at most this many items in one album
+MAX_ALBUM_ITEMS = 10
+
+
+class _Album:
+    __slots__ = ('items', 'data', 'started', 'timer')
+
+    def __init__(self, data, started):
+        self.items = []
+        self.data = data
+        self.started = started
+        self.timer = None
+
+
+class AlbumAggregator:
+    def __init__(self, flush, quiet=0.5, deadline=2.0, max_items=MAX_ALBUM_ITEMS, max_albums=1000):
+        self._flush = flush  # async callable(items, data)
+        self.quiet = quiet
+        self.deadline = deadline
+        self.max_items = max_items
+        self.max_albums = max_albums
+        self._albums = {}  # key -> _Album, oldest first
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._albums)
+
+    def add(self, key, item, data=None):
+        """
+        Add an item to the album `key`. `data` is kept from the album's first
+        item and handed to the flush callable along with the items.
+        """
+        loop = asyncio.get_running_loop()
+        album = self._albums.get(key)
+        if album is None:
+            if len(self._albums) >= self.max_albums:
+                self._flush_now(next(iter(self._albums)))
+            album = self._albums[key] = _Album(data, loop.time())
+        album.items.append(item)
+
+        if album.timer is not None:
+            album.timer.cancel()
+        if len(album.items) >= self.max_items:
+            self._flush_now(key)
+            return
+        delay = min(self.quiet, album.started + self.deadline - loop.time())
+        album.timer = loop.call_later(max(delay, 0), self._flush_now, key)
+
+    def _flush_now(self, key):
+        album = self._albums.pop(key, None)
+        if album is None:
+            return
+        if album.timer is not None:
+            album.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._run_flush(album))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_flush(self, album):
+        try:
+            await self._flush(album.items, album.data)
+        except Exception as e:
+            logger.error(f"Failed to flush album of {len(album.items)} items: {e}")
+
+    async def close(self):
+        """Flush every album still collecting and wait for all flushes to finish."""
+        for key in list(self._albums):
+            self._flush_now(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,21 +1,10 @@
-from http.server import BaseHTTPRequestHandler
-import asyncio
-import json
-from telegram import Update
-from bot import create_app
+"""
+Vercel entry point: the ASGI app from app.py, which serves the webhook when
+WEBHOOK_URL is set.
+"""
+import os
+import sys
 
-app = create_app()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
-        
-        update = Update.de_json(data, app.bot)
-        
-        asyncio.run(app.process_update(update))
-        
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"OK")
+from app import app  # noqa: E402,F401
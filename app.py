@@ -1,39 +1,128 @@
 """
-Health check server for Hugging Face Spaces.
-This runs alongside the bot to satisfy HF's port 7860 requirement.
+Health check server for Hugging Face Spaces, running the bot in the same
+process and event loop.
+
+The lifespan hook starts one Application on uvicorn's loop and stops it when
+the server shuts down. Without WEBHOOK_URL it polls Telegram for updates. With
+WEBHOOK_URL set it registers the webhook instead; every POST to WEBHOOK_PATH
+is checked against the secret token, queued and acknowledged straight away,
+and the Application works through the queue, up to CONCURRENT_UPDATES updates
+at a time. GET /health reports the bot's state and GET /metrics its latencies
+for Prometheus.
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from telegram import Update
+import hashlib
+import hmac
+import logging
 import uvicorn
-import threading
 import sys
 import os
 
-# Import the bot
 sys.path.insert(0, os.path.dirname(__file__))
 
-app = FastAPI()
+from config import BOT_TOKEN, CONCURRENT_UPDATES, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL
+from health import health_report
+from metrics import render as render_metrics
+
+logger = logging.getLogger(__name__)
+
+MODE = 'webhook' if WEBHOOK_URL else 'polling'
+
+# Telegram accepts 1-256 characters of A-Z, a-z, 0-9, _ and -
+SECRET_TOKEN = WEBHOOK_SECRET or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+
+# The running Application
+bot_app = None
+
+
+async def start_bot():
+    """Start the Application on this loop and begin receiving updates."""
+    global bot_app
+    from bot import create_app
+    application = create_app()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    if MODE == 'webhook':
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=min(max(CONCURRENT_UPDATES, 1), 100),
+        )
+        logger.info(f"Bot started with webhook at {WEBHOOK_URL}{WEBHOOK_PATH}")
+    else:
+        # Also removes any webhook left from an earlier webhook deployment
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        logger.info("Bot started with polling...")
+    bot_app = application
+
+
+async def stop_bot():
+    """Stop receiving updates, finish the queued ones and shut the Application down."""
+    global bot_app
+    application, bot_app = bot_app, None
+    if application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_bot()
+    try:
+        yield
+    finally:
+        if bot_app is not None:
+            await stop_bot()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def health_check():
     return {
-        "status": "running",
+        "status": "running" if bot_app is not None else "stopped",
         "service": "Telegram Omegle Bot",
-        "message": "Bot is active and polling for updates"
+        "message": f"Bot is receiving updates by {MODE}"
     }
 
 @app.get("/health")
-def health():
-    return {"status": "healthy"}
+async def health():
+    report = await health_report(bot_app, MODE)
+    report["status"] = "healthy" if report.pop("healthy") else "unhealthy"
+    return JSONResponse(report, status_code=200 if report["status"] == "healthy" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Handler, database and Bot API latencies in the Prometheus text format."""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-def run_bot():
-    """Run the Telegram bot in a separate thread"""
-    import bot
-    # The bot.py script will handle its own execution
+@app.post(WEBHOOK_PATH)
+async def webhook(request: Request):
+    """Receive an update from Telegram and acknowledge it before it is handled."""
+    if bot_app is None or MODE != 'webhook':
+        return Response(status_code=503)
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token.encode(), SECRET_TOKEN.encode()):
+        return Response(status_code=403)
+    try:
+        update = Update.de_json(await request.json(), bot_app.bot)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Rejected malformed update: {e}")
+        return Response(status_code=400)
+    await bot_app.update_queue.put(update)
+    return Response(status_code=200)
 
 if __name__ == "__main__":
-    # Start bot in background thread
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
-    
-    # Run FastAPI server on port 7860 (required by HF Spaces)
-    uvicorn.run(app, host="0.0.0.0", port=7860)
+    # Run FastAPI server and the bot on port 7860 (required by HF Spaces)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "7860")))
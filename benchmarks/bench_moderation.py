@@ -0,0 +1,57 @@
+"""
+Benchmark for moderation.WordFilter.
+
+Times the per-message cost of the Aho-Corasick filter against the old
+approach (a substring test per listed word) as the word list grows. The
+filter's cost should stay flat; the per-word scan grows with the list.
+
+    python benchmarks/bench_moderation.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moderation import WordFilter  # noqa: E402
+
+MESSAGES = [
+    "hey, how are you doing today?",
+    "I just finished watching that new anime everyone keeps talking about, it was great",
+    "lol",
+    "do you play any games? I'm mostly into strategy and a bit of racing on weekends",
+    "where are you from? I'm from Colombo",
+] * 200
+
+
+def random_words(count, rng):
+    return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(count)]
+
+
+def per_message(check):
+    started = time.perf_counter()
+    for message in MESSAGES:
+        check(message)
+    return (time.perf_counter() - started) / len(MESSAGES)
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'words':>6} {'build ms':>9} {'us/msg (filter)':>16} {'us/msg (per-word scan)':>23}")
+    for size in (10, 100, 1000, 5000, 20000):
+        words = random_words(size, rng)
+        started = time.perf_counter()
+        word_filter = WordFilter(words)
+        build = time.perf_counter() - started
+
+        def naive(message):
+            lowered = message.lower()
+            return next((word for word in words if word in lowered), None)
+
+        print(f"{size:>6} {build * 1e3:>9.1f} {per_message(word_filter.find) * 1e6:>16.1f} {per_message(naive) * 1e6:>23.1f}")
+
+
+if __name__ == "__main__":
+    main()
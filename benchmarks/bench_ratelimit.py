@@ -0,0 +1,72 @@
+"""
+Microbenchmark for middleware.RateLimiter.
+
+Fills the limiter with up to 1M distinct users and reports, at each size, the
+mean cost of a check and the memory held per tracked user, then sweeps and
+reports what is left. Per-check cost and per-user memory should stay flat as
+the population grows, and the sweep should bring memory back to ~0.
+
+    python benchmarks/bench_ratelimit.py [--users 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from middleware import RateLimiter  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def time_checks(limiter, user_ids):
+    started = time.perf_counter()
+    for user_id in user_ids:
+        limiter.check(user_id)
+    return (time.perf_counter() - started) / len(user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=100_000, help="checks timed at each size")
+    args = parser.parse_args()
+
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    print(f"{'users':>10} {'ns/check (new)':>15} {'ns/check (known)':>17} {'bytes/user':>11}")
+    size = 0
+    checkpoints = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n < args.users] + [args.users]
+    for target in checkpoints:
+        # Grow to the target population, then time first checks of fresh
+        # users and repeat checks of users already tracked
+        for user_id in range(size, target - args.sample):
+            limiter.check(user_id)
+        new = time_checks(limiter, range(max(size, target - args.sample), target))
+        size = target
+        clock.now += 0.01
+        known = time_checks(limiter, range(0, min(args.sample, size)))
+        per_user = (tracemalloc.get_traced_memory()[0] - base) / len(limiter)
+        print(f"{size:>10} {new * 1e9:>15.0f} {known * 1e9:>17.0f} {per_user:>11.0f}")
+
+    clock.now += limiter.window + 1
+    started = time.perf_counter()
+    evicted = limiter.sweep()
+    elapsed = time.perf_counter() - started
+    left = tracemalloc.get_traced_memory()[0] - base
+    print(f"sweep: evicted {evicted} idle users in {elapsed:.2f}s, {len(limiter)} left, {left / 1e6:.1f} MB still held")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Load test for update_processor.ChatOrderedUpdateProcessor.
+
+Replays a burst of updates from many chats, each handled in a random 10-60ms
+(a Bot API call plus a database write), through the processor at several
+concurrency levels. Throughput should scale with concurrency while every
+conversation's updates are still handled in the order they arrived. PTB's
+plain concurrent processor is shown for comparison: just as fast, but it
+reorders conversations.
+
+    python benchmarks/bench_update_processor.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+
+CHATS = 200
+UPDATES_PER_USER = 5
+
+
+async def partner_of(user_id):
+    # Users 2k and 2k+1 chat with each other
+    return user_id ^ 1
+
+
+async def run(proc, seed=1):
+    rng = random.Random(seed)
+    # Per conversation, the order updates arrived in and the order they were handled
+    arrived, handled = {}, {}
+
+    async def handle(user_id, seq):
+        await asyncio.sleep(rng.uniform(0.01, 0.06))
+        handled.setdefault(user_id // 2, []).append((user_id, seq))
+
+    updates = [(user_id, seq) for seq in range(UPDATES_PER_USER) for user_id in rng.sample(range(2 * CHATS), 2 * CHATS)]
+    for user_id, seq in updates:
+        arrived.setdefault(user_id // 2, []).append((user_id, seq))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        proc.process_update(SimpleNamespace(effective_user=SimpleNamespace(id=user_id)), handle(user_id, seq))
+        for user_id, seq in updates
+    ))
+    elapsed = time.perf_counter() - started
+    out_of_order = sum(arrived[chat] != handled[chat] for chat in arrived)
+    return len(updates) / elapsed, out_of_order
+
+
+def main():
+    print(f"{CHATS} chats, {2 * CHATS * UPDATES_PER_USER} updates")
+    print(f"{'processor':>10} {'concurrency':>12} {'updates/s':>10} {'chats out of order':>19}")
+    for concurrency in (1, 8, 32, 128):
+        rate, out_of_order = asyncio.run(run(ChatOrderedUpdateProcessor(concurrency, partner_of=partner_of)))
+        print(f"{'ordered':>10} {concurrency:>12} {rate:>10.0f} {out_of_order:>19}")
+    for concurrency in (32, 128):
+        rate, out_of_order = asyncio.run(run(SimpleUpdateProcessor(concurrency)))
+        print(f"{'ptb':>10} {concurrency:>12} {rate:>10.0f} {out_of_order:>19}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Benchmark for the webhook entry point.
+
+Relays chat messages through a local fake Bot API (every call answered after
+LATENCY seconds, like a real round trip) and compares:
+
+- legacy: the old api/index.py, a fresh event loop per request via
+  asyncio.run(). As written it never initialized the Application, so after the
+  first request the bot's connection pool is tied to a closed loop and every
+  call fails. It is measured here with the per-request initialize/shutdown and
+  database open/close it would need to work at all; updates are handled one at
+  a time.
+- asgi: app.py's webhook on one long-lived loop and Application, driven
+  through httpx with Telegram-like parallel connections. "acked" is how fast
+  Telegram gets its answers, "handled" how fast the messages reach partners.
+
+    python benchmarks/bench_webhook.py
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LATENCY = float(os.getenv("BENCH_LATENCY", "0.02"))  # seconds per Bot API call
+PAIRS = 100
+MESSAGES_PER_USER = 2  # stays under the per-user rate limit
+CONNECTIONS = 40  # Telegram's default max_connections for webhooks
+TOKEN = "123456:bench"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PORT = free_port()
+os.environ.update({
+    "BOT_TOKEN": TOKEN,
+    "BOT_API_URL": f"http://127.0.0.1:{PORT}/bot",
+    "DB_TYPE": "sqlite",
+    "WEBHOOK_URL": "https://bench.invalid",
+    "WEBHOOK_SECRET": "bench-secret",
+    # The fake API has no flood limits to respect
+    "SEND_RATE": "100000",
+})
+
+import httpx  # noqa: E402
+from telegram import Update  # noqa: E402
+
+import database as db  # noqa: E402
+
+
+class FakeBotAPI:
+    """
+    Keep-alive HTTP server answering every Bot API method after LATENCY
+    seconds, in its own thread and event loop. Counts relayed messages.
+    """
+
+    def __init__(self):
+        self.relayed = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _result(self, method, body):
+        with self._lock:
+            self._next_id += 1
+            message_id = self._next_id
+            if method == "copyMessage":
+                self.relayed += 1
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "copyMessage":
+            return {"message_id": message_id}
+        if method == "sendMessage":
+            chat_id = int(parse_qs(body.decode())["chat_id"][0])
+            return {"message_id": message_id, "date": 0, "chat": {"id": chat_id, "type": "private"}}
+        return True
+
+    async def _respond(self, writer, method, body):
+        await asyncio.sleep(LATENCY)
+        payload = json.dumps({"ok": True, "result": self._result(method, body)}).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(payload), payload))
+
+    async def _connection(self, reader, writer):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                body = await reader.readexactly(length)
+                method = request_line.split()[1].rsplit(b"/", 1)[-1].decode()
+                # Requests on one connection are answered in order
+                await self._respond(writer, method, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def serve(self):
+        started = threading.Event()
+
+        async def run():
+            await asyncio.start_server(self._connection, "127.0.0.1", PORT)
+            started.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+        started.wait()
+
+
+def make_updates(first_user):
+    """Text messages from every user of PAIRS pairs starting at first_user, interleaved."""
+    updates = []
+    for round_ in range(MESSAGES_PER_USER):
+        for user_id in range(first_user, first_user + 2 * PAIRS):
+            update_id = len(updates) + first_user * 10
+            updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": 0,
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                    "text": f"hello {round_}",
+                },
+            })
+    return updates
+
+
+async def pair_users(first_user):
+    await db.init_db()
+    for user_id in range(first_user, first_user + 2 * PAIRS, 2):
+        await db.set_language(user_id, 'en')
+        await db.set_language(user_id + 1, 'en')
+        await db.create_chat(user_id, user_id + 1)
+    await db.close_db()
+
+
+def run_legacy(updates):
+    from bot import create_app
+    application = create_app()
+
+    async def handle(data):
+        async with application:
+            await db.init_db()
+            try:
+                await application.process_update(Update.de_json(data, application.bot))
+            finally:
+                await db.close_db()
+
+    started = time.perf_counter()
+    for data in updates:
+        asyncio.run(handle(data))
+    # Acknowledged only once handled
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+async def run_asgi(api, updates):
+    import app as server
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "bench-secret"}
+    async with server.lifespan(server.app):
+        relayed_before = api.relayed
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            pending = iter(updates)
+
+            async def connection():
+                for data in pending:
+                    response = await client.post(server.WEBHOOK_PATH, json=data, headers=headers)
+                    assert response.status_code == 200, response.status_code
+
+            started = time.perf_counter()
+            await asyncio.gather(*(connection() for _ in range(CONNECTIONS)))
+            acked = time.perf_counter() - started
+            while api.relayed - relayed_before < len(updates):
+                await asyncio.sleep(0.005)
+            return acked, time.perf_counter() - started
+
+
+def main():
+    logging.disable(logging.INFO)
+    api = FakeBotAPI()
+    api.serve()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        asyncio.run(pair_users(1_000))
+        asyncio.run(pair_users(100_000))
+
+        # The legacy handler is slow; a quarter of the updates is enough to time it
+        legacy_updates = make_updates(1_000)[:PAIRS * MESSAGES_PER_USER // 2]
+        asgi_updates = make_updates(100_000)
+
+        print(f"Bot API latency {LATENCY * 1000:.0f}ms, {PAIRS} chats")
+        print(f"{'handler':>8} {'updates':>8} {'acked/s':>10} {'handled/s':>10}")
+        for name, updates, run in (
+            ("legacy", legacy_updates, lambda: run_legacy(legacy_updates)),
+            ("asgi", asgi_updates, lambda: asyncio.run(run_asgi(api, asgi_updates))),
+        ):
+            acked, handled = run()
+            print(f"{name:>8} {len(updates):>8} {len(updates) / acked:>10.0f} {len(updates) / handled:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
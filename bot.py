@@ -1,8 +1,17 @@
 import logging
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from config import BOT_TOKEN
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
+from config import (
+    BOT_TOKEN, BOT_API_URL, CONCURRENT_UPDATES,
+    SEND_POOL_SIZE, SEND_POOL_KEEPALIVE, SEND_POOL_KEEPALIVE_EXPIRY, SEND_HTTP_VERSION,
+    SEND_CONNECT_TIMEOUT, SEND_READ_TIMEOUT, SEND_WRITE_TIMEOUT, SEND_POOL_TIMEOUT,
+    POLLING_POOL_SIZE, POLLING_POOL_KEEPALIVE, POLLING_POOL_KEEPALIVE_EXPIRY, POLLING_HTTP_VERSION,
+    POLLING_CONNECT_TIMEOUT, POLLING_READ_TIMEOUT, POLLING_WRITE_TIMEOUT, POLLING_POOL_TIMEOUT,
+)
 import database as db
 from handlers import (
+    albums,
+    load_session,
     start, 
     button_handler, 
     handle_message, 
@@ -13,6 +22,13 @@ from handlers import (
     language_command
 )
 from admin import stats_command, broadcast_command
+from delivery import track_activity
+from middleware import close_rate_limits
+from jobs import schedule_jobs
+from update_processor import ChatOrderedUpdateProcessor
+from outbound import SendScheduler
+from http_pool import PooledRequest
+from health import FIRST_GROUP, LAST_GROUP, record_received, record_processed
 
 # Configure logging
 logging.basicConfig(
@@ -22,11 +38,30 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def create_app():
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Separate connection pools, so the long poll never holds a connection a send needs
+    send_request = PooledRequest(
+        'send', SEND_POOL_SIZE, SEND_POOL_KEEPALIVE, SEND_POOL_KEEPALIVE_EXPIRY, SEND_HTTP_VERSION,
+        SEND_CONNECT_TIMEOUT, SEND_READ_TIMEOUT, SEND_WRITE_TIMEOUT, SEND_POOL_TIMEOUT,
+    )
+    polling_request = PooledRequest(
+        'polling', POLLING_POOL_SIZE, POLLING_POOL_KEEPALIVE, POLLING_POOL_KEEPALIVE_EXPIRY, POLLING_HTTP_VERSION,
+        POLLING_CONNECT_TIMEOUT, POLLING_READ_TIMEOUT, POLLING_WRITE_TIMEOUT, POLLING_POOL_TIMEOUT,
+    )
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_URL)
+        .request(send_request)
+        .get_updates_request(polling_request)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .rate_limiter(SendScheduler())
+        .build()
+    )
     
     # Initialize database on startup
     async def post_init(application: Application):
         await db.init_db()
+        schedule_jobs(application)
         
         # Set Bot Commands
         from telegram import BotCommand
@@ -44,8 +79,28 @@ def create_app():
         from telegram import MenuButtonCommands
         await application.bot.set_chat_menu_button(menu_button=MenuButtonCommands())
     
+    # Relay collected albums while the bot can still send (shutdown closes its connections)
+    async def post_stop(application: Application):
+        await albums.close()
+
+    # Flush pending writes and close connections on shutdown
+    async def post_shutdown(application: Application):
+        await db.close_db()
+        await close_rate_limits()
+
     app.post_init = post_init
+    app.post_stop = post_stop
+    app.post_shutdown = post_shutdown
     
+    # Count updates in and out for /health
+    app.add_handler(TypeHandler(Update, record_received), group=FIRST_GROUP)
+    app.add_handler(TypeHandler(Update, record_processed), group=LAST_GROUP)
+
+    # Clear the unreachable flag of anyone who talks to the bot again
+    app.add_handler(TypeHandler(Update, track_activity), group=-1)
+    # Read the user's language, chat and queue status once per update (context.session)
+    app.add_handler(TypeHandler(Update, load_session), group=-2)
+
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("next", next_command))
     app.add_handler(CommandHandler("stop", stop_command))
@@ -0,0 +1,109 @@
+"""
+Admin broadcasts, delivered in the background by the JobQueue.
+
+Each broadcast is a row in the broadcasts table. Its job walks the reachable
+users in user_settings in user_id order, BROADCAST_BATCH_SIZE ids at a time,
+and sends every batch concurrently, paced by one TokenBucket shared by all
+broadcasts. Recipients found to have blocked the bot are flagged unreachable
+and skipped from then on. After each batch the cursor (the batch's last
+user_id) and the totals are saved, so a broadcast cut off by a restart is
+picked up again by resume_broadcasts(); at most the one unfinished batch is
+sent twice. Broadcast messages have the lowest priority in the bot's
+SendScheduler, so live chats are never held up behind them, and it is the
+scheduler that waits out flood control and retries network errors. The
+admin's status message is edited with the progress every PROGRESS_INTERVAL
+seconds.
+"""
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.ext import Application, ContextTypes
+from config import BROADCAST_RATE, BROADCAST_BATCH_SIZE
+import database as db
+from delivery import record_failure
+from outbound import PRIORITY_BULK
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress edits of the admin's status message
+PROGRESS_INTERVAL = 5
+
+_bucket = TokenBucket(BROADCAST_RATE)
+
+
+async def _send(bot, broadcast, user_id):
+    """Deliver the broadcast to one user. Returns True if it arrived."""
+    await _bucket.acquire()
+    try:
+        if broadcast['text'] is None:
+            await bot.copy_message(chat_id=user_id, from_chat_id=broadcast['from_chat_id'], message_id=broadcast['message_id'], rate_limit_args=PRIORITY_BULK)
+        else:
+            await bot.send_message(chat_id=user_id, text=broadcast['text'], parse_mode='Markdown', rate_limit_args=PRIORITY_BULK)
+        return True
+    except (Forbidden, BadRequest) as e:
+        # Bot blocked, account deleted, ... retrying will not help
+        await record_failure(user_id, e)
+    except (RetryAfter, NetworkError) as e:
+        # Still failing after the SendScheduler's retries
+        logger.warning(f"Broadcast {broadcast['id']} to {user_id} failed: {e}")
+    return False
+
+
+async def _report(bot, broadcast, text):
+    """Show text in the admin's status message."""
+    try:
+        await bot.edit_message_text(chat_id=broadcast['admin_chat_id'], message_id=broadcast['status_message_id'], text=text)
+    except BadRequest as e:
+        # "Message is not modified" and the like; progress is best effort
+        logger.debug(f"Could not edit broadcast {broadcast['id']} status: {e}")
+    except Exception as e:
+        logger.warning(f"Could not edit broadcast {broadcast['id']} status: {e}")
+
+
+async def deliver(bot, broadcast):
+    """Send a broadcast to every user after its cursor. Returns (sent, failed)."""
+    cursor, sent, failed = broadcast['cursor'], broadcast['sent'], broadcast['failed']
+    total = (await db.get_stats())['reachable_users']
+    last_report = time.monotonic()
+
+    user_ids = await db.get_user_ids_page(cursor, BROADCAST_BATCH_SIZE)
+    while user_ids:
+        # Fetch the next page while this one is being sent
+        next_page = asyncio.ensure_future(db.get_user_ids_page(user_ids[-1], BROADCAST_BATCH_SIZE))
+        results = await asyncio.gather(*(_send(bot, broadcast, user_id) for user_id in user_ids))
+        delivered = sum(results)
+        sent += delivered
+        failed += len(results) - delivered
+        cursor = user_ids[-1]
+        await db.update_broadcast(broadcast['id'], cursor, sent, failed)
+
+        if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            await _report(bot, broadcast, f"📢 Broadcasting... {sent + failed}/{total}\nSuccess: {sent}\nFailed: {failed}")
+        user_ids = await next_page
+
+    await db.update_broadcast(broadcast['id'], cursor, sent, failed, status='done')
+    await _report(bot, broadcast, f"✅ Broadcast complete!\nSuccess: {sent}\nFailed: {failed}")
+    logger.info(f"Broadcast {broadcast['id']} finished: {sent} sent, {failed} failed")
+    return sent, failed
+
+
+async def run_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    await deliver(context.bot, context.job.data)
+
+
+def start_broadcast(application: Application, broadcast):
+    """Deliver a broadcast created with db.create_broadcast() in the background."""
+    if application.job_queue is None:
+        application.create_task(deliver(application.bot, broadcast))
+        return
+    application.job_queue.run_once(run_broadcast, 0, data=broadcast, name=f"broadcast_{broadcast['id']}")
+
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """Restart the broadcasts that were still running when the bot last stopped."""
+    for broadcast in await db.get_unfinished_broadcasts():
+        logger.info(f"Resuming broadcast {broadcast['id']} after user {broadcast['cursor']}")
+        start_broadcast(context.application, broadcast)
@@ -8,9 +8,84 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 DB_TYPE = os.getenv("DB_TYPE", "sqlite").lower()
 
+# Bot API endpoint; point it at a self-hosted Bot API server if you run one
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+
+# Webhook mode (app.py): public HTTPS base URL Telegram posts updates to, the
+# path they are posted on, and the secret token Telegram sends along with each
+# one (derived from BOT_TOKEN if unset). Polling is used while WEBHOOK_URL is unset.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Updates handled at the same time (1 = strictly one after another); a
+# conversation's own updates are always handled in order
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
+# Bot API connection pools (http_pool.py), one for sending and one for getUpdates
+# long polling: max connections, idle connections kept alive and for how many
+# seconds, HTTP version ("1.1" or "2") and connect/read/write/pool-wait timeouts
+# (seconds). The long poll's own wait is added to POLLING_READ_TIMEOUT.
+SEND_POOL_SIZE = int(os.getenv("SEND_POOL_SIZE", "64"))
+SEND_POOL_KEEPALIVE = int(os.getenv("SEND_POOL_KEEPALIVE", "32"))
+SEND_POOL_KEEPALIVE_EXPIRY = float(os.getenv("SEND_POOL_KEEPALIVE_EXPIRY", "30"))
+SEND_HTTP_VERSION = os.getenv("SEND_HTTP_VERSION", "1.1")
+SEND_CONNECT_TIMEOUT = float(os.getenv("SEND_CONNECT_TIMEOUT", "5"))
+SEND_READ_TIMEOUT = float(os.getenv("SEND_READ_TIMEOUT", "10"))
+SEND_WRITE_TIMEOUT = float(os.getenv("SEND_WRITE_TIMEOUT", "10"))
+SEND_POOL_TIMEOUT = float(os.getenv("SEND_POOL_TIMEOUT", "5"))
+POLLING_POOL_SIZE = int(os.getenv("POLLING_POOL_SIZE", "1"))
+POLLING_POOL_KEEPALIVE = int(os.getenv("POLLING_POOL_KEEPALIVE", "1"))
+POLLING_POOL_KEEPALIVE_EXPIRY = float(os.getenv("POLLING_POOL_KEEPALIVE_EXPIRY", "60"))
+POLLING_HTTP_VERSION = os.getenv("POLLING_HTTP_VERSION", "1.1")
+POLLING_CONNECT_TIMEOUT = float(os.getenv("POLLING_CONNECT_TIMEOUT", "5"))
+POLLING_READ_TIMEOUT = float(os.getenv("POLLING_READ_TIMEOUT", "5"))
+POLLING_WRITE_TIMEOUT = float(os.getenv("POLLING_WRITE_TIMEOUT", "5"))
+POLLING_POOL_TIMEOUT = float(os.getenv("POLLING_POOL_TIMEOUT", "1"))
+
+# Supabase HTTP client: max pooled keep-alive connections and request timeout (seconds)
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+# user_settings cache: max cached users and seconds before an entry is re-read
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000"))
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+
+# message_logs write-behind: rows per batch and max seconds a row waits to be written
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv("MESSAGE_LOG_BATCH_SIZE", "100"))
+MESSAGE_LOG_FLUSH_INTERVAL = float(os.getenv("MESSAGE_LOG_FLUSH_INTERVAL", "1.0"))
+
+# Message id mappings older than this are pruned (replies/edits to them stop syncing)
+MESSAGE_LOG_RETENTION_DAYS = float(os.getenv("MESSAGE_LOG_RETENTION_DAYS", "7"))
+
+# Outbound Bot API calls: messages per second across all chats and per chat
+# (after a short burst), and retries on flood control or network errors
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Broadcasts: messages per second (Telegram allows ~30/s to different chats for
+# free broadcasts) and recipients fetched and sent concurrently per batch
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+
+# Per-user message rate limit state: "memory" (per process), "sqlite" (a file
+# shared by the workers on one host) or "redis" (any Redis-protocol server)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "ratelimit.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Albums are relayed once no new item arrived for ALBUM_QUIET_PERIOD seconds,
+# or at the latest ALBUM_MAX_DELAY seconds after their first item
+ALBUM_QUIET_PERIOD = float(os.getenv("ALBUM_QUIET_PERIOD", "0.5"))
+ALBUM_MAX_DELAY = float(os.getenv("ALBUM_MAX_DELAY", "2.0"))
+
 # Admin user IDs (comma-separated in .env, e.g., "123456789,987654321")
 ADMIN_IDS = [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if id.strip()]
 
 BAD_WORDS = ["badword1", "badword2", "spam", "scam"]
+# Optional word list file (one word per line) replacing BAD_WORDS; edits are picked up while running
+BAD_WORDS_FILE = os.getenv("BAD_WORDS_FILE", "bad_words.txt")
 
 INTERESTS = ["Anime", "Tech", "Gaming", "Movies", "Music", "Random"]
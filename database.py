@@ -1,378 +1,796 @@
 import os
+import time
 import logging
 
-from config import DB_TYPE
+import migrations
+from cache import MISSING, TTLCache
+from config import DB_TYPE, SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL, MESSAGE_LOG_BATCH_SIZE, MESSAGE_LOG_FLUSH_INTERVAL
+from matchmaker import BlockIndex, Matchmaker
+from message_log import MessageLogWriter
+from metrics import CallbackMetric, instrument_module
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
+# In-memory waiting queue and blocklist shared by both backends. They are the
+# read path for all queue operations and block checks; the waiting_queue and
+# blocked_users tables are only written through to so both can be rebuilt in
+# init_db() after a restart.
+_matchmaker = Matchmaker()
+_blocklist = BlockIndex()
+
+# Active chats, both directions (user_id -> partner_id). This is the read path
+# for get_partner(); active_chats is the durable write-through copy it is
+# loaded from on startup.
+_partners = {}
+
+# (interest, language) per user, read on nearly every update. Entries are
+# refreshed from the row written by set_interest/set_language.
+_settings_cache = TTLCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL)
+
+# Running totals behind get_stats(), bumped by the functions that change them.
+# total_users counts user_settings rows created; matches_made and
+# messages_relayed are also persisted in the stats_counters table. Active chats
+# and queue length are read off _partners and _matchmaker directly.
+# reconcile_stats() corrects any drift against the tables.
+_counters = {'total_users': 0, 'matches_made': 0, 'messages_relayed': 0}
+
+# Users Telegram refuses to deliver to (blocked the bot, deleted account),
+# flagged by mark_unreachable(). They are never matched and broadcasts skip them.
+_unreachable = set()
+
+
+def get_cache_stats():
+    """Hit/miss counters of the user_settings cache."""
+    return _settings_cache.stats()
+
+
+CallbackMetric('slomegle_settings_cache_lookups_total', 'user_settings cache lookups, by result.', 'counter', ('result',),
+               lambda: {('hit',): _settings_cache.hits, ('miss',): _settings_cache.misses})
+CallbackMetric('slomegle_settings_cache_evictions_total', 'user_settings cache entries dropped to stay within SETTINGS_CACHE_SIZE.', 'counter', (),
+               lambda: {(): _settings_cache.evictions})
+CallbackMetric('slomegle_settings_cache_entries', 'Users in the user_settings cache.', 'gauge', (),
+               lambda: {(): len(_settings_cache)})
+
+
+async def get_stats():
+    """Get bot statistics for admin dashboard, without querying the database."""
+    return {
+        'total_users': _counters['total_users'],
+        'reachable_users': _counters['total_users'] - len(_unreachable),
+        'unreachable_users': len(_unreachable),
+        'active_chats': len(_partners) // 2,
+        'in_queue': len(_matchmaker),
+        'matches_made': _counters['matches_made'],
+        'messages_relayed': _counters['messages_relayed'],
+    }
+
+
+def _correct_stats(total_users, persisted, chat_rows, queue_rows):
+    """Bring _counters in line with counts taken from the tables by reconcile_stats()."""
+    counted = {
+        'total_users': total_users,
+        'matches_made': persisted.get('matches_made', 0),
+        # Logged messages are only added to the table once their batch is written
+        'messages_relayed': persisted.get('messages_relayed', 0) + len(_message_log),
+    }
+    for name, value in counted.items():
+        if _counters[name] != value:
+            logger.info(f"Correcting {name} from {_counters[name]} to {value}")
+            _counters[name] = value
+    # Queue and chats are authoritative in memory; a mismatch means a write-through failed
+    for table, table_count, memory_count in (('active_chats', chat_rows, len(_partners)), ('waiting_queue', queue_rows, len(_matchmaker))):
+        if table_count != memory_count:
+            logger.warning(f"Stats drift: {table} has {table_count} rows, memory has {memory_count}")
+
+
+def _can_pair(user_id, is_busy=None):
+    """
+    Candidate filter for _matchmaker.pop(): nobody unreachable or blocked either
+    way, nor anyone is_busy(candidate) reports in the middle of their own update.
+    """
+    return lambda candidate: (
+        candidate not in _unreachable
+        and not _blocklist.is_blocked(user_id, candidate)
+        and not (is_busy and is_busy(candidate))
+    )
+
+
+def _pair(user_id, partner_id):
+    _partners[user_id] = partner_id
+    _partners[partner_id] = user_id
+
+
+def _unpair(user_id):
+    """Forget user_id's chat. Returns the former partner, if any."""
+    partner_id = _partners.pop(user_id, None)
+    if partner_id is not None and _partners.get(partner_id) == user_id:
+        del _partners[partner_id]
+    return partner_id
+
+
+class SessionContext:
+    """What the handlers need to know about a user, read once per update."""
+    __slots__ = ('user_id', 'language', 'interest', 'partner_id', 'partner_language', 'in_queue')
+
+    def __init__(self, user_id, language, interest, partner_id, partner_language, in_queue):
+        self.user_id = user_id
+        self.language = language
+        self.interest = interest
+        self.partner_id = partner_id
+        self.partner_language = partner_language
+        self.in_queue = in_queue
+
+    def __repr__(self):
+        return f"SessionContext(user_id={self.user_id}, language={self.language!r}, partner_id={self.partner_id})"
+
+
+async def get_session_context(user_id):
+    """
+    Language, interest, partner, partner's language and queue status of user_id.
+    Chats and the queue are read from memory and both users' settings from the
+    cache, with at most one query for whichever of them is not cached.
+    """
+    partner_id = _partners.get(user_id)
+    if partner_id is None:
+        (interest, language), = await _get_settings_many([user_id])
+        partner_language = None
+    else:
+        (interest, language), (_, partner_language) = await _get_settings_many([user_id, partner_id])
+    return SessionContext(user_id, language, interest, partner_id, partner_language, user_id in _matchmaker)
+
+
+def _reset_state():
+    """Drop all in-memory state; the next init_db() reloads it."""
+    _matchmaker.clear()
+    _blocklist.clear()
+    _partners.clear()
+    _settings_cache.clear()
+    _unreachable.clear()
+    for name in _counters:
+        _counters[name] = 0
+
 # ----------------------------------------------------------------------
 # SQLite implementation (Async version)
 # ----------------------------------------------------------------------
 if DB_TYPE == "sqlite":
+    import asyncio
+    from contextlib import asynccontextmanager
     import aiosqlite
     DB_PATH = "bot.db"
 
-    async def init_db():
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("""CREATE TABLE IF NOT EXISTS waiting_queue (user_id INTEGER PRIMARY KEY, interest TEXT)""")
-            await conn.execute("""CREATE TABLE IF NOT EXISTS active_chats (user_id INTEGER PRIMARY KEY, partner_id INTEGER)""")
-            await conn.execute("""CREATE TABLE IF NOT EXISTS user_settings (user_id INTEGER PRIMARY KEY, interest TEXT, language TEXT DEFAULT 'en')""")
-            await conn.execute("""CREATE TABLE IF NOT EXISTS blocked_users (user_id INTEGER, blocked_user_id INTEGER, PRIMARY KEY (user_id, blocked_user_id))""")
-            await conn.execute("""CREATE TABLE IF NOT EXISTS reports (id INTEGER PRIMARY KEY AUTOINCREMENT, reporter_id INTEGER, reported_id INTEGER, reason TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)""")
-            await conn.execute("""CREATE TABLE IF NOT EXISTS message_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id INTEGER, sender_msg_id INTEGER, receiver_id INTEGER, receiver_msg_id INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)""")
-            
-            # Migration: Add language column if it doesn't exist (for existing databases)
+    # Connections are opened once in init_db() and reused for the lifetime of
+    # the process. SQLite only allows one writer at a time, so every write goes
+    # through a single writer connection guarded by _write_lock; reads use a
+    # separate read-only connection so in WAL mode they never queue behind a
+    # write. Both connections cache up to STATEMENT_CACHE_SIZE prepared
+    # statements, so the hot-path queries below are compiled only once.
+    STATEMENT_CACHE_SIZE = 256
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=134217728",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    _writer = None
+    _reader = None
+    _write_lock = None
+
+    async def _open_connection(read_only=False):
+        # isolation_level=None puts the sqlite3 module in autocommit mode, so
+        # transactions only start when we say so (see _transaction below).
+        conn = await aiosqlite.connect(DB_PATH, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @asynccontextmanager
+    async def _transaction():
+        """Run several statements on the writer connection as one transaction."""
+        async with _write_lock:
+            await _writer.execute("BEGIN IMMEDIATE")
             try:
-                await conn.execute("ALTER TABLE user_settings ADD COLUMN language TEXT DEFAULT 'en'")
-                await conn.commit()
-                logger.info("Migrated database: Added language column to user_settings")
-            except Exception as e:
-                # Column likely already exists
-                pass
-            
-            await conn.commit()
-        logger.info("SQLite DB initialized")
+                yield _writer
+            except BaseException:
+                await _writer.execute("ROLLBACK")
+                raise
+            await _writer.execute("COMMIT")
+
+    async def _write(query, params=()):
+        async with _write_lock:
+            await _writer.execute(query, params)
+
+    async def _write_returning(query, params=()):
+        async with _write_lock:
+            async with _writer.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+    async def _fetchone(query, params=()):
+        async with _reader.execute(query, params) as cursor:
+            return await cursor.fetchone()
+
+    async def _fetchall(query, params=()):
+        async with _reader.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+    async def init_db():
+        global _writer, _reader, _write_lock
+        if _writer is not None:
+            return
+        _write_lock = asyncio.Lock()
+        _writer = await _open_connection()
+
+        # All DDL lives in versioned migrations, applied once here
+        async with _write_lock:
+            await migrations.migrate_sqlite(_writer)
+
+        _reader = await _open_connection(read_only=True)
+        _matchmaker.load(await _fetchall("SELECT user_id, interest FROM waiting_queue ORDER BY joined_at, user_id"))
+        _blocklist.load(await _fetchall("SELECT user_id, blocked_user_id FROM blocked_users"))
+        _partners.update(await _fetchall("SELECT user_id, partner_id FROM active_chats"))
+        _counters['total_users'] = (await _fetchone("SELECT COUNT(*) FROM user_settings"))[0]
+        _counters.update(await _fetchall("SELECT name, value FROM stats_counters"))
+        _unreachable.update(row[0] for row in await _fetchall("SELECT user_id FROM user_settings WHERE unreachable_since IS NOT NULL"))
+        logger.info(f"SQLite DB initialized ({len(_matchmaker)} users waiting, {len(_partners) // 2} chats, {len(_blocklist)} blocks)")
+
+    async def close_db():
+        global _writer, _reader
+        await _message_log.close()
+        for conn in (_reader, _writer):
+            if conn is not None:
+                await conn.close()
+        _writer = _reader = None
+        _reset_state()
+        logger.info("SQLite DB closed")
+
+    async def ping():
+        """Round-trip time of a trivial query, in seconds."""
+        started = time.perf_counter()
+        await _fetchone("SELECT 1")
+        return time.perf_counter() - started
+
+    async def _get_settings(user_id):
+        # (interest, language) for user_id, from the cache when possible
+        settings = _settings_cache.get(user_id)
+        if settings is MISSING:
+            row = await _fetchone("SELECT interest, language FROM user_settings WHERE user_id = ?", (user_id,))
+            settings = (row[0], row[1] or 'en') if row else (None, 'en')
+            _settings_cache.set(user_id, settings)
+        return settings
+
+    async def _get_settings_many(user_ids):
+        # _get_settings for several users, reading the uncached ones in one query
+        settings = {user_id: _settings_cache.get(user_id) for user_id in user_ids}
+        missing = [user_id for user_id, cached in settings.items() if cached is MISSING]
+        if missing:
+            placeholders = ", ".join("?" * len(missing))
+            rows = await _fetchall(f"SELECT user_id, interest, language FROM user_settings WHERE user_id IN ({placeholders})", missing)
+            found = {row[0]: (row[1], row[2] or 'en') for row in rows}
+            for user_id in missing:
+                settings[user_id] = found.get(user_id, (None, 'en'))
+                _settings_cache.set(user_id, settings[user_id])
+        return [settings[user_id] for user_id in user_ids]
+
+    async def _save_setting(user_id, column, value):
+        # Create the row if needed (counting the new user), then set one column
+        async with _transaction() as conn:
+            async with conn.execute("INSERT OR IGNORE INTO user_settings (user_id) VALUES (?)", (user_id,)) as cursor:
+                created = cursor.rowcount
+            async with conn.execute(f"UPDATE user_settings SET {column} = ? WHERE user_id = ? RETURNING interest, language", (value, user_id)) as cursor:
+                row = await cursor.fetchone()
+        _counters['total_users'] += created
+        _settings_cache.set(user_id, (row[0], row[1] or 'en'))
 
     async def set_interest(user_id, interest):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("INSERT INTO user_settings (user_id, interest) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET interest=?", (user_id, interest, interest))
-            await conn.commit()
+        await _save_setting(user_id, 'interest', interest)
         logger.info(f"User {user_id} set interest to {interest}")
 
     async def get_language(user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT language FROM user_settings WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else 'en'
+        return (await _get_settings(user_id))[1]
 
     async def set_language(user_id, language):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            # Upsert logic: ensure user exists, update language
-            # We need to preserve interest if it exists, but here we use upsert on user_id
-            # If row doesn't exist, interest will be null (which is fine)
-            await conn.execute("INSERT INTO user_settings (user_id, language) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET language=?", (user_id, language, language))
-            await conn.commit()
+        await _save_setting(user_id, 'language', language)
         logger.info(f"User {user_id} set language to {language}")
 
     async def get_interest(user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT interest FROM user_settings WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-        return row[0] if row else None
+        return (await _get_settings(user_id))[0]
 
     async def add_to_queue(user_id, interest=None):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            # Ensure interest column exists (migration for existing DB)
-            try:
-                await conn.execute("ALTER TABLE waiting_queue ADD COLUMN interest TEXT")
-            except aiosqlite.OperationalError:
-                pass # Column already exists
-            
-            await conn.execute("INSERT OR IGNORE INTO waiting_queue (user_id, interest) VALUES (?, ?)", (user_id, interest))
-            await conn.commit()
+        if not _matchmaker.add(user_id, interest):
+            return
+        try:
+            await _write("INSERT OR IGNORE INTO waiting_queue (user_id, interest, joined_at) VALUES (?, ?, ?)", (user_id, interest, time.time()))
+        except Exception:
+            _matchmaker.remove(user_id)
+            raise
         logger.info(f"User {user_id} added to SQLite queue with interest {interest}")
 
-    async def get_from_queue(user_id, interest=None):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            # Get list of users blocked by this user
-            async with conn.execute("SELECT blocked_user_id FROM blocked_users WHERE user_id = ?", (user_id,)) as cursor:
-                blocked_by_me = [row[0] for row in await cursor.fetchall()]
-            
-            # Get list of users who blocked this user
-            async with conn.execute("SELECT user_id FROM blocked_users WHERE blocked_user_id = ?", (user_id,)) as cursor:
-                blocked_me = [row[0] for row in await cursor.fetchall()]
-            
-            excluded_ids = set(blocked_by_me + blocked_me + [user_id])
-            excluded_ids_placeholder = ','.join('?' for _ in excluded_ids)
-            
-            query = f"SELECT user_id FROM waiting_queue WHERE user_id NOT IN ({excluded_ids_placeholder})"
-            params = list(excluded_ids)
-            
-            if interest:
-                query += " AND interest = ?"
-                params.append(interest)
-                
-            query += " LIMIT 1"
-            
-            async with conn.execute(query, params) as cursor:
-                row = await cursor.fetchone()
-            
-            if row:
-                partner_id = row[0]
-                await conn.execute("DELETE FROM waiting_queue WHERE user_id = ?", (partner_id,))
-                await conn.commit()
-                return partner_id
-                
-        return None
+    async def match_and_pair(user_id, interest=None, is_busy=None):
+        """
+        Pop the oldest waiting user who may be paired with user_id and open a
+        chat between them, passing over anyone is_busy(candidate) is true for.
+        The candidate is picked from the in-memory queue and both the dequeue
+        and the chat are written in one transaction.
+        Returns the partner's id, or None if nobody suitable is waiting.
+        """
+        partner_id = _matchmaker.pop(user_id, interest, _can_pair(user_id, is_busy))
+        if not partner_id:
+            return None
+        _matchmaker.remove(user_id)
+        _pair(user_id, partner_id)
+
+        try:
+            async with _transaction() as conn:
+                await conn.execute("DELETE FROM waiting_queue WHERE user_id IN (?, ?)", (user_id, partner_id))
+                await conn.executemany("INSERT OR REPLACE INTO active_chats VALUES (?, ?)", [(user_id, partner_id), (partner_id, user_id)])
+                await conn.execute("UPDATE stats_counters SET value = value + 1 WHERE name = 'matches_made'")
+        except Exception:
+            _unpair(user_id)
+            # Nothing was written, so put whoever is still in the table back in line
+            for row in await _fetchall("SELECT user_id, interest FROM waiting_queue WHERE user_id IN (?, ?) ORDER BY joined_at", (user_id, partner_id)):
+                _matchmaker.add(*row)
+            raise
+        _counters['matches_made'] += 1
+        logger.info(f"SQLite chat created between {user_id} and {partner_id}")
+        return partner_id
 
     async def remove_from_queue(user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("DELETE FROM waiting_queue WHERE user_id = ?", (user_id,))
-            await conn.commit()
+        _matchmaker.remove(user_id)
+        await _write("DELETE FROM waiting_queue WHERE user_id = ?", (user_id,))
         logger.info(f"User {user_id} removed from SQLite queue")
 
     async def is_in_queue(user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT user_id FROM waiting_queue WHERE user_id = ?", (user_id,)) as cursor:
-                exists = await cursor.fetchone() is not None
-        return exists
+        return user_id in _matchmaker
 
     async def create_chat(user_id, partner_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
+        _pair(user_id, partner_id)
+        async with _transaction() as conn:
             await conn.execute("INSERT OR REPLACE INTO active_chats VALUES (?, ?)", (user_id, partner_id))
             await conn.execute("INSERT OR REPLACE INTO active_chats VALUES (?, ?)", (partner_id, user_id))
-            await conn.commit()
         logger.info(f"SQLite chat created between {user_id} and {partner_id}")
 
     async def get_partner(user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT partner_id FROM active_chats WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-        return row[0] if row else None
+        return _partners.get(user_id)
 
     async def end_chat(user_id):
-        partner_id = await get_partner(user_id)
+        partner_id = _unpair(user_id)
         if partner_id:
-            async with aiosqlite.connect(DB_PATH) as conn:
-                await conn.execute("DELETE FROM active_chats WHERE user_id = ?", (user_id,))
-                await conn.execute("DELETE FROM active_chats WHERE user_id = ?", (partner_id,))
-                await conn.commit()
+            await _write("DELETE FROM active_chats WHERE user_id IN (?, ?)", (user_id, partner_id))
             logger.info(f"SQLite chat ended between {user_id} and {partner_id}")
         return partner_id
 
     async def block_user(user_id, blocked_user_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("INSERT OR IGNORE INTO blocked_users (user_id, blocked_user_id) VALUES (?, ?)", (user_id, blocked_user_id))
-            await conn.commit()
+        _blocklist.add(user_id, blocked_user_id)
+        await _write("INSERT OR IGNORE INTO blocked_users (user_id, blocked_user_id) VALUES (?, ?)", (user_id, blocked_user_id))
         logger.info(f"User {user_id} blocked {blocked_user_id}")
 
+    async def mark_unreachable(user_id):
+        """Flag a user the bot can no longer message and take them out of the queue."""
+        if user_id in _unreachable:
+            return
+        _unreachable.add(user_id)
+        _matchmaker.remove(user_id)
+        await _save_setting(user_id, 'unreachable_since', time.time())
+        await _write("DELETE FROM waiting_queue WHERE user_id = ?", (user_id,))
+        logger.info(f"User {user_id} is unreachable")
+
+    async def mark_reachable(user_id):
+        """Clear the unreachable flag once the user talks to the bot again."""
+        if user_id not in _unreachable:
+            return
+        _unreachable.discard(user_id)
+        await _write("UPDATE user_settings SET unreachable_since = NULL WHERE user_id = ?", (user_id,))
+        logger.info(f"User {user_id} is reachable again")
+
     async def report_user(reporter_id, reported_id, reason):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("INSERT INTO reports (reporter_id, reported_id, reason) VALUES (?, ?, ?)", (reporter_id, reported_id, reason))
-            await conn.commit()
+        await _write("INSERT INTO reports (reporter_id, reported_id, reason) VALUES (?, ?, ?)", (reporter_id, reported_id, reason))
         logger.info(f"User {reporter_id} reported {reported_id} for {reason}")
 
+    async def _insert_message_logs(rows):
+        async with _transaction() as conn:
+            await conn.executemany("INSERT OR REPLACE INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id) VALUES (?, ?, ?, ?)", rows)
+            await conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = 'messages_relayed'", (len(rows),))
+
+    _message_log = MessageLogWriter(_insert_message_logs, MESSAGE_LOG_BATCH_SIZE, MESSAGE_LOG_FLUSH_INTERVAL)
+
     async def log_message(sender_id, sender_msg_id, receiver_id, receiver_msg_id):
-        async with aiosqlite.connect(DB_PATH) as conn:
-            await conn.execute("INSERT INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id) VALUES (?, ?, ?, ?)", 
-                      (sender_id, sender_msg_id, receiver_id, receiver_msg_id))
-            await conn.commit()
+        _message_log.add([(sender_id, sender_msg_id, receiver_id, receiver_msg_id)])
+        _counters['messages_relayed'] += 1
+
+    async def log_messages(rows):
+        """Log several (sender_id, sender_msg_id, receiver_id, receiver_msg_id) rows at once."""
+        _message_log.add(rows)
+        _counters['messages_relayed'] += len(rows)
 
     async def get_partner_message_id(sender_id, sender_msg_id):
         # Find the message ID on the receiver's side given the sender's message ID
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT receiver_msg_id FROM message_logs WHERE sender_id = ? AND sender_msg_id = ?", (sender_id, sender_msg_id)) as cursor:
-                row = await cursor.fetchone()
+        pending = _message_log.get_receiver_msg_id(sender_id, sender_msg_id)
+        if pending is not None:
+            return pending
+        row = await _fetchone("SELECT receiver_msg_id FROM message_logs WHERE sender_id = ? AND sender_msg_id = ?", (sender_id, sender_msg_id))
         return row[0] if row else None
 
     async def get_original_message_id(user_id, reply_msg_id):
         # If user_id is replying to reply_msg_id, it means reply_msg_id was sent TO user_id.
         # So we look for a log where receiver_id = user_id AND receiver_msg_id = reply_msg_id.
         # We want the original sender_msg_id to reply to that on the partner's side.
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT sender_msg_id FROM message_logs WHERE receiver_id = ? AND receiver_msg_id = ?", (user_id, reply_msg_id)) as cursor:
-                row = await cursor.fetchone()
+        pending = _message_log.get_sender_msg_id(user_id, reply_msg_id)
+        if pending is not None:
+            return pending
+        row = await _fetchone("SELECT sender_msg_id FROM message_logs WHERE receiver_id = ? AND receiver_msg_id = ?", (user_id, reply_msg_id))
         return row[0] if row else None
 
-    async def get_stats():
-        """Get bot statistics for admin dashboard."""
-        async with aiosqlite.connect(DB_PATH) as conn:
-            async with conn.execute("SELECT COUNT(DISTINCT user_id) FROM user_settings") as cursor:
-                total_users = (await cursor.fetchone())[0]
-            
-            async with conn.execute("SELECT COUNT(*) FROM active_chats") as cursor:
-                active_chats = (await cursor.fetchone())[0] // 2  # Divide by 2 since each chat has 2 entries
-            
-            async with conn.execute("SELECT COUNT(*) FROM waiting_queue") as cursor:
-                in_queue = (await cursor.fetchone())[0]
-        
-        return {
-            'total_users': total_users,
-            'active_chats': active_chats,
-            'in_queue': in_queue
-        }
+    # Rows deleted per statement when pruning, so the write lock is released between chunks
+    PRUNE_CHUNK_SIZE = 5000
+
+    async def prune_message_logs(max_age):
+        """Delete message mappings older than max_age seconds. Returns the number deleted."""
+        cutoff = int(time.time() - max_age)
+        deleted = 0
+        while True:
+            async with _write_lock:
+                async with _writer.execute("""DELETE FROM message_logs WHERE (sender_id, sender_msg_id) IN (
+                        SELECT sender_id, sender_msg_id FROM message_logs WHERE timestamp < ? LIMIT ?)""", (cutoff, PRUNE_CHUNK_SIZE)) as cursor:
+                    count = cursor.rowcount
+            deleted += count
+            if count < PRUNE_CHUNK_SIZE:
+                break
+        if deleted:
+            logger.info(f"Pruned {deleted} message logs older than {max_age}s")
+        return deleted
+
+    async def get_user_ids_page(after_id=0, limit=1000):
+        """Up to `limit` reachable user ids above after_id in ascending order, for keyset pagination."""
+        return [row[0] for row in await _fetchall("SELECT user_id FROM user_settings WHERE user_id > ? AND unreachable_since IS NULL ORDER BY user_id LIMIT ?", (after_id, limit))]
+
+    BROADCAST_COLUMNS = ('id', 'admin_chat_id', 'status_message_id', 'from_chat_id', 'message_id', 'text', 'cursor', 'sent', 'failed', 'status')
+
+    async def create_broadcast(admin_chat_id, status_message_id, from_chat_id=None, message_id=None, text=None):
+        """Record a new broadcast, either a copy of from_chat_id/message_id or a text. Returns it as a dict."""
+        row = await _write_returning(f"INSERT INTO broadcasts (admin_chat_id, status_message_id, from_chat_id, message_id, text) VALUES (?, ?, ?, ?, ?) RETURNING {', '.join(BROADCAST_COLUMNS)}",
+                                     (admin_chat_id, status_message_id, from_chat_id, message_id, text))
+        return dict(zip(BROADCAST_COLUMNS, row))
+
+    async def update_broadcast(broadcast_id, cursor, sent, failed, status='running'):
+        """Save a broadcast's progress: the last user_id handled and the running totals."""
+        await _write("UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, status = ? WHERE id = ?", (cursor, sent, failed, status, broadcast_id))
+
+    async def get_unfinished_broadcasts():
+        """Broadcasts that were still running when the bot last stopped."""
+        rows = await _fetchall(f"SELECT {', '.join(BROADCAST_COLUMNS)} FROM broadcasts WHERE status = 'running' ORDER BY id")
+        return [dict(zip(BROADCAST_COLUMNS, row)) for row in rows]
+
+    async def reconcile_stats():
+        """Recount the counters behind get_stats() from the tables and correct any drift."""
+        total_users, chat_rows, queue_rows = await _fetchone(
+            "SELECT (SELECT COUNT(*) FROM user_settings), (SELECT COUNT(*) FROM active_chats), (SELECT COUNT(*) FROM waiting_queue)")
+        persisted = dict(await _fetchall("SELECT name, value FROM stats_counters"))
+        _correct_stats(total_users, persisted, chat_rows, queue_rows)
+        return await get_stats()
 
 
 # ----------------------------------------------------------------------
 # Supabase implementation (used when DB_TYPE == "supabase")
 # ----------------------------------------------------------------------
 else:
-    from supabase import create_client, Client
-    from config import SUPABASE_URL, SUPABASE_KEY
+    from datetime import datetime, timezone
+    from httpx import AsyncClient, Limits
+    from postgrest import AsyncPostgrestClient
+    from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+    from postgrest.types import ReturnMethod
+    from config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_POOL_SIZE, SUPABASE_TIMEOUT
 
     if not SUPABASE_URL or not SUPABASE_KEY:
         logger.error("Supabase URL or Key is missing in environment variables.")
         raise ValueError("Supabase credentials missing.")
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    class _PooledPostgrestClient(AsyncPostgrestClient):
+        """Async PostgREST client whose requests share one keep-alive connection pool."""
+
+        def create_session(self, base_url, headers, timeout):
+            return AsyncClient(
+                base_url=base_url,
+                headers=headers,
+                timeout=timeout,
+                limits=Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE),
+            )
+
+    # Every query below is awaited on an async HTTP client, so a slow Supabase
+    # response only suspends the handler that made it, never the event loop.
+    supabase = _PooledPostgrestClient(
+        f"{SUPABASE_URL}/rest/v1",
+        headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, 'apikey': SUPABASE_KEY, 'Authorization': f'Bearer {SUPABASE_KEY}'},
+        timeout=SUPABASE_TIMEOUT,
+    )
+
+    # PostgREST returns at most this many rows per request
+    PAGE_SIZE = 1000
 
     async def init_db():
-        logger.info("Supabase DB assumed to be pre‑created.")
-        # Note: You need to add 'interest' column to waiting_queue and create user_settings table in Supabase manually
+        # The schema is managed with the scripts in supabase/migrations; just check it is current
+        expected = migrations.latest_version(migrations.SUPABASE_MIGRATIONS_DIR)
+        try:
+            resp = await supabase.table('schema_version').select('version').order('version', desc=True).limit(1).execute()
+            current = resp.data[0]['version'] if resp.data else None
+        except Exception as e:
+            logger.error(f"Error reading schema version: {e}")
+            current = None
+        if current != expected:
+            logger.warning(f"Supabase schema is at version {current}, expected {expected}. Apply the scripts in supabase/migrations.")
+
+        # Rebuild the in-memory queue (oldest first) and blocklist from their tables
+        queue = await _select_all('waiting_queue', 'user_id, interest', 'joined_at', 'user_id')
+        _matchmaker.load((row['user_id'], row['interest']) for row in queue)
+        blocks = await _select_all('blocked_users', 'user_id, blocked_user_id', 'user_id', 'blocked_user_id')
+        _blocklist.load((row['user_id'], row['blocked_user_id']) for row in blocks)
+        chats = await _select_all('active_chats', 'user_id, partner_id', 'user_id')
+        _partners.update((row['user_id'], row['partner_id']) for row in chats)
+        unreachable = await _select_all('user_settings', 'user_id', 'user_id', where=lambda query: query.not_.is_('unreachable_since', 'null'))
+        _unreachable.update(row['user_id'] for row in unreachable)
+        try:
+            _counters['total_users'] = await _count('user_settings')
+            resp = await supabase.table('stats_counters').select('name, value').execute()
+            _counters.update((row['name'], row['value']) for row in resp.data)
+        except Exception as e:
+            logger.error(f"Error loading stats counters: {e}")
+        logger.info(f"Loaded {len(_matchmaker)} waiting users, {len(_partners) // 2} chats and {len(_blocklist)} blocks from Supabase")
+
+    async def _select_all(table, columns, *order, where=None):
+        """Fetch every row of a table (or those where(query) filters to), one PAGE_SIZE page at a time."""
+        rows = []
+        while True:
+            query = supabase.table(table).select(columns)
+            if where is not None:
+                query = where(query)
+            for column in order:
+                query = query.order(column)
+            resp = await query.range(len(rows), len(rows) + PAGE_SIZE - 1).execute()
+            rows.extend(resp.data)
+            if len(resp.data) < PAGE_SIZE:
+                return rows
+
+    async def _count(table):
+        # Exact row count from the Content-Range header; only one row is transferred
+        resp = await supabase.table(table).select('user_id', count='exact').limit(1).execute()
+        return resp.count or 0
+
+    async def close_db():
+        await _message_log.close()
+        await supabase.aclose()
+        _reset_state()
+        logger.info("Supabase client closed")
+
+    async def ping():
+        """Round-trip time of a trivial query, in seconds."""
+        started = time.perf_counter()
+        await supabase.table('schema_version').select('version').limit(1).execute()
+        return time.perf_counter() - started
+
+    def _cache_settings(user_id, rows):
+        # Refresh the cache from the user_settings row a write returned
+        if rows:
+            _settings_cache.set(user_id, (rows[0].get('interest'), rows[0].get('language') or 'en'))
+        else:
+            _settings_cache.invalidate(user_id)
+
+    async def _get_settings(user_id):
+        # (interest, language) for user_id, from the cache when possible
+        settings = _settings_cache.get(user_id)
+        if settings is MISSING:
+            resp = await supabase.table('user_settings').select('interest, language').eq('user_id', user_id).execute()
+            if resp.data:
+                settings = (resp.data[0].get('interest'), resp.data[0].get('language') or 'en')
+            else:
+                settings = (None, 'en')
+            _settings_cache.set(user_id, settings)
+        return settings
+
+    async def _get_settings_many(user_ids):
+        # _get_settings for several users, reading the uncached ones in one query
+        settings = {user_id: _settings_cache.get(user_id) for user_id in user_ids}
+        missing = [user_id for user_id, cached in settings.items() if cached is MISSING]
+        if missing:
+            try:
+                resp = await supabase.table('user_settings').select('user_id, interest, language').in_('user_id', missing).execute()
+            except Exception as e:
+                logger.error(f"Error getting settings: {e}")
+                # Defaults for this update only; the next one tries again
+                return [(None, 'en') if settings[user_id] is MISSING else settings[user_id] for user_id in user_ids]
+            found = {row['user_id']: (row.get('interest'), row.get('language') or 'en') for row in resp.data}
+            for user_id in missing:
+                settings[user_id] = found.get(user_id, (None, 'en'))
+                _settings_cache.set(user_id, settings[user_id])
+        return [settings[user_id] for user_id in user_ids]
+
+    async def _save_setting(user_id, column, value):
+        # Update the row if the user exists, otherwise create it (counting the new user)
+        resp = await supabase.table('user_settings').update({column: value}).eq('user_id', user_id).execute()
+        if not resp.data:
+            resp = await supabase.table('user_settings').insert({'user_id': user_id, column: value}).execute()
+            _counters['total_users'] += 1
+        _cache_settings(user_id, resp.data)
 
     async def set_interest(user_id, interest):
         try:
-            supabase.table('user_settings').upsert({'user_id': user_id, 'interest': interest}).execute()
+            await _save_setting(user_id, 'interest', interest)
             logger.info(f"User {user_id} set interest to {interest}")
         except Exception as e:
+            _settings_cache.invalidate(user_id)
             logger.error(f"Error setting interest: {e}")
 
     async def get_language(user_id):
         try:
-            resp = supabase.table('user_settings').select('language').eq('user_id', user_id).execute()
-            if resp.data:
-                return resp.data[0].get('language', 'en')
-            return 'en'
+            return (await _get_settings(user_id))[1]
         except Exception as e:
             logger.error(f"Error getting language: {e}")
             return 'en'
 
     async def set_language(user_id, language):
         try:
-            # We need to be careful not to overwrite interest if we use upsert with just language
-            # But Supabase upsert usually merges if configured, or we fetch first.
-            # Simpler: upsert with user_id and language. 
-            # Note: If row doesn't exist, it creates it. If it exists, it updates specified columns? 
-            # Supabase-py upsert replaces the row by default unless we specify ignore_duplicates=False (default)
-            # To do a partial update, we should check if user exists or use update()
-            
-            # Try update first
-            resp = supabase.table('user_settings').update({'language': language}).eq('user_id', user_id).execute()
-            if not resp.data:
-                # If no data returned, user might not exist, so insert
-                supabase.table('user_settings').insert({'user_id': user_id, 'language': language}).execute()
-                
+            await _save_setting(user_id, 'language', language)
             logger.info(f"User {user_id} set language to {language}")
         except Exception as e:
+            _settings_cache.invalidate(user_id)
             logger.error(f"Error setting language: {e}")
 
     async def get_interest(user_id):
         try:
-            resp = supabase.table('user_settings').select('interest').eq('user_id', user_id).execute()
-            if resp.data:
-                return resp.data[0]['interest']
-            return None
+            return (await _get_settings(user_id))[0]
         except Exception as e:
             logger.error(f"Error getting interest: {e}")
             return None
 
     async def add_to_queue(user_id, interest=None):
+        if not _matchmaker.add(user_id, interest):
+            return
         try:
-            supabase.table('waiting_queue').upsert({'user_id': user_id, 'interest': interest}).execute()
+            await supabase.table('waiting_queue').upsert({'user_id': user_id, 'interest': interest}).execute()
             logger.info(f"User {user_id} added to Supabase queue with interest {interest}")
         except Exception as e:
             logger.error(f"Error adding to queue: {e}")
 
-    async def get_from_queue(user_id, interest=None):
-        try:
-            # Complex exclusion logic is harder in Supabase via simple client without RPC
-            # For now, we will just fetch a candidate and check if blocked in python (less efficient but works)
-            # Ideally, use a Postgres function.
-            
-            # 1. Get blocked users
-            blocked_resp = supabase.table('blocked_users').select('blocked_user_id').eq('user_id', user_id).execute()
-            blocked_ids = [item['blocked_user_id'] for item in blocked_resp.data]
-            
-            # 2. Get users who blocked me
-            blocked_me_resp = supabase.table('blocked_users').select('user_id').eq('blocked_user_id', user_id).execute()
-            blocked_ids.extend([item['user_id'] for item in blocked_me_resp.data])
-            
-            query = supabase.table('waiting_queue').select('user_id')
-            if interest:
-                query = query.eq('interest', interest)
-            
-            # Fetch a few candidates
-            resp = query.limit(10).execute()
-            
-            for candidate in resp.data:
-                candidate_id = candidate['user_id']
-                if candidate_id != user_id and candidate_id not in blocked_ids:
-                    # Found a valid match
-                    supabase.table('waiting_queue').delete().eq('user_id', candidate_id).execute()
-                    return candidate_id
-            
+    async def match_and_pair(user_id, interest=None, is_busy=None):
+        """
+        Pop the oldest waiting user who may be paired with user_id and open a
+        chat between them, passing over anyone is_busy(candidate) is true for.
+        The candidate is picked from the in-memory queue and both the dequeue
+        and the chat are written in one transaction by the pair_users Postgres
+        function (see supabase_setup.sql).
+        Returns the partner's id, or None if nobody suitable is waiting.
+        """
+        partner_id = _matchmaker.pop(user_id, interest, _can_pair(user_id, is_busy))
+        if not partner_id:
             return None
+        _matchmaker.remove(user_id)
+        _pair(user_id, partner_id)
+
+        try:
+            await supabase.rpc('pair_users', {'p_user_id': user_id, 'p_partner_id': partner_id}).execute()
+            _counters['matches_made'] += 1
+            logger.info(f"Supabase chat created between {user_id} and {partner_id}")
+            return partner_id
         except Exception as e:
-            logger.error(f"Error getting from queue: {e}")
+            logger.error(f"Error matching user: {e}")
+            _unpair(user_id)
+            # Nothing was written, so put whoever is still in the table back in line
+            try:
+                resp = await supabase.table('waiting_queue').select('user_id, interest').in_('user_id', [user_id, partner_id]).order('joined_at').execute()
+                for row in resp.data:
+                    _matchmaker.add(row['user_id'], row['interest'])
+            except Exception as e:
+                logger.error(f"Error restoring queue: {e}")
             return None
 
     async def remove_from_queue(user_id):
+        _matchmaker.remove(user_id)
         try:
-            supabase.table('waiting_queue').delete().eq('user_id', user_id).execute()
+            await supabase.table('waiting_queue').delete().eq('user_id', user_id).execute()
             logger.info(f"User {user_id} removed from Supabase queue")
         except Exception as e:
             logger.error(f"Error removing from queue: {e}")
 
     async def is_in_queue(user_id):
-        try:
-            resp = supabase.table('waiting_queue').select('user_id').eq('user_id', user_id).execute()
-            return len(resp.data) > 0
-        except Exception as e:
-            logger.error(f"Error checking queue status: {e}")
-            return False
+        return user_id in _matchmaker
 
     async def create_chat(user_id, partner_id):
+        _pair(user_id, partner_id)
         try:
             data = [
                 {'user_id': user_id, 'partner_id': partner_id},
                 {'user_id': partner_id, 'partner_id': user_id}
             ]
-            supabase.table('active_chats').upsert(data).execute()
+            await supabase.table('active_chats').upsert(data).execute()
             logger.info(f"Supabase chat created between {user_id} and {partner_id}")
         except Exception as e:
             logger.error(f"Error creating chat: {e}")
 
     async def get_partner(user_id):
-        try:
-            resp = supabase.table('active_chats').select('partner_id').eq('user_id', user_id).execute()
-            if resp.data:
-                return resp.data[0]['partner_id']
-            return None
-        except Exception as e:
-            logger.error(f"Error getting partner: {e}")
-            return None
+        return _partners.get(user_id)
 
     async def end_chat(user_id):
+        partner_id = _unpair(user_id)
         try:
-            partner_id = await get_partner(user_id)
             if partner_id:
-                supabase.table('active_chats').delete().eq('user_id', user_id).execute()
-                supabase.table('active_chats').delete().eq('user_id', partner_id).execute()
+                await supabase.table('active_chats').delete().in_('user_id', [user_id, partner_id]).execute()
                 logger.info(f"Supabase chat ended between {user_id} and {partner_id}")
-            return partner_id
         except Exception as e:
             logger.error(f"Error ending chat: {e}")
-            return None
+        return partner_id
 
     async def block_user(user_id, blocked_user_id):
+        _blocklist.add(user_id, blocked_user_id)
         try:
-            supabase.table('blocked_users').upsert({'user_id': user_id, 'blocked_user_id': blocked_user_id}).execute()
+            await supabase.table('blocked_users').upsert({'user_id': user_id, 'blocked_user_id': blocked_user_id}).execute()
             logger.info(f"User {user_id} blocked {blocked_user_id}")
         except Exception as e:
             logger.error(f"Error blocking user: {e}")
 
+    async def mark_unreachable(user_id):
+        """Flag a user the bot can no longer message and take them out of the queue."""
+        if user_id in _unreachable:
+            return
+        _unreachable.add(user_id)
+        _matchmaker.remove(user_id)
+        try:
+            await _save_setting(user_id, 'unreachable_since', datetime.now(timezone.utc).isoformat())
+            await supabase.table('waiting_queue').delete().eq('user_id', user_id).execute()
+            logger.info(f"User {user_id} is unreachable")
+        except Exception as e:
+            logger.error(f"Error marking user unreachable: {e}")
+
+    async def mark_reachable(user_id):
+        """Clear the unreachable flag once the user talks to the bot again."""
+        if user_id not in _unreachable:
+            return
+        _unreachable.discard(user_id)
+        try:
+            await supabase.table('user_settings').update({'unreachable_since': None}).eq('user_id', user_id).execute()
+            logger.info(f"User {user_id} is reachable again")
+        except Exception as e:
+            logger.error(f"Error marking user reachable: {e}")
+
     async def report_user(reporter_id, reported_id, reason):
         try:
-            supabase.table('reports').insert({'reporter_id': reporter_id, 'reported_id': reported_id, 'reason': reason}).execute()
+            await supabase.table('reports').insert({'reporter_id': reporter_id, 'reported_id': reported_id, 'reason': reason}).execute()
             logger.info(f"User {reporter_id} reported {reported_id}")
         except Exception as e:
             logger.error(f"Error reporting user: {e}")
 
-    async def log_message(sender_id, sender_msg_id, receiver_id, receiver_msg_id):
-        try:
-            supabase.table('message_logs').insert({
+    async def _insert_message_logs(rows):
+        # One log_messages RPC per batch inserts the rows and bumps messages_relayed;
+        # errors are handled (and retried) by the writer
+        await supabase.rpc('log_messages', {'p_rows': [
+            {
                 'sender_id': sender_id,
                 'sender_msg_id': sender_msg_id,
                 'receiver_id': receiver_id,
                 'receiver_msg_id': receiver_msg_id
-            }).execute()
-        except Exception as e:
-            logger.error(f"Error logging message: {e}")
+            }
+            for sender_id, sender_msg_id, receiver_id, receiver_msg_id in rows
+        ]}).execute()
+
+    _message_log = MessageLogWriter(_insert_message_logs, MESSAGE_LOG_BATCH_SIZE, MESSAGE_LOG_FLUSH_INTERVAL)
+
+    async def log_message(sender_id, sender_msg_id, receiver_id, receiver_msg_id):
+        _message_log.add([(sender_id, sender_msg_id, receiver_id, receiver_msg_id)])
+        _counters['messages_relayed'] += 1
+
+    async def log_messages(rows):
+        """Log several (sender_id, sender_msg_id, receiver_id, receiver_msg_id) rows at once."""
+        _message_log.add(rows)
+        _counters['messages_relayed'] += len(rows)
 
     async def get_partner_message_id(sender_id, sender_msg_id):
+        pending = _message_log.get_receiver_msg_id(sender_id, sender_msg_id)
+        if pending is not None:
+            return pending
         try:
-            resp = supabase.table('message_logs').select('receiver_msg_id').eq('sender_id', sender_id).eq('sender_msg_id', sender_msg_id).execute()
+            resp = await supabase.table('message_logs').select('receiver_msg_id').eq('sender_id', sender_id).eq('sender_msg_id', sender_msg_id).execute()
             if resp.data:
                 return resp.data[0]['receiver_msg_id']
             return None
@@ -381,8 +799,11 @@ else:
             return None
 
     async def get_original_message_id(user_id, reply_msg_id):
+        pending = _message_log.get_sender_msg_id(user_id, reply_msg_id)
+        if pending is not None:
+            return pending
         try:
-            resp = supabase.table('message_logs').select('sender_msg_id').eq('receiver_id', user_id).eq('receiver_msg_id', reply_msg_id).execute()
+            resp = await supabase.table('message_logs').select('sender_msg_id').eq('receiver_id', user_id).eq('receiver_msg_id', reply_msg_id).execute()
             if resp.data:
                 return resp.data[0]['sender_msg_id']
             return None
@@ -390,33 +811,67 @@ else:
             logger.error(f"Error getting original message id: {e}")
             return None
 
-    async def get_stats():
-        """Get bot statistics for admin dashboard."""
+    async def prune_message_logs(max_age):
+        """Delete message mappings older than max_age seconds. Returns the number deleted."""
+        cutoff = datetime.fromtimestamp(time.time() - max_age, tz=timezone.utc).isoformat()
         try:
-            # Get total users
-            users_resp = supabase.table('user_settings').select('user_id', count='exact').execute()
-            total_users = users_resp.count if hasattr(users_resp, 'count') else len(users_resp.data)
-            
-            # Get active chats
-            chats_resp = supabase.table('active_chats').select('user_id', count='exact').execute()
-            active_chats = (chats_resp.count if hasattr(chats_resp, 'count') else len(chats_resp.data)) // 2
-            
-            # Get queue
-            queue_resp = supabase.table('waiting_queue').select('user_id', count='exact').execute()
-            in_queue = queue_resp.count if hasattr(queue_resp, 'count') else len(queue_resp.data)
-            
-            return {
-                'total_users': total_users,
-                'active_chats': active_chats,
-                'in_queue': in_queue
-            }
+            resp = await supabase.table('message_logs').delete(count='exact', returning=ReturnMethod.minimal).lt('timestamp', cutoff).execute()
+            deleted = resp.count or 0
+            if deleted:
+                logger.info(f"Pruned {deleted} message logs older than {max_age}s")
+            return deleted
         except Exception as e:
-            logger.error(f"Error getting stats: {e}")
-            return {
-                'total_users': 0,
-                'active_chats': 0,
-                'in_queue': 0
-            }
+            logger.error(f"Error pruning message logs: {e}")
+            return 0
+
+    async def get_user_ids_page(after_id=0, limit=1000):
+        """Up to `limit` reachable user ids above after_id in ascending order, for keyset pagination."""
+        resp = await supabase.table('user_settings').select('user_id').gt('user_id', after_id).is_('unreachable_since', 'null').order('user_id').limit(limit).execute()
+        return [row['user_id'] for row in resp.data]
+
+    BROADCAST_COLUMNS = 'id, admin_chat_id, status_message_id, from_chat_id, message_id, text, cursor, sent, failed, status'
+
+    async def create_broadcast(admin_chat_id, status_message_id, from_chat_id=None, message_id=None, text=None):
+        """Record a new broadcast, either a copy of from_chat_id/message_id or a text. Returns it as a dict."""
+        resp = await supabase.table('broadcasts').insert({
+            'admin_chat_id': admin_chat_id,
+            'status_message_id': status_message_id,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'text': text
+        }).execute()
+        return resp.data[0]
+
+    async def update_broadcast(broadcast_id, cursor, sent, failed, status='running'):
+        """Save a broadcast's progress: the last user_id handled and the running totals."""
+        try:
+            await supabase.table('broadcasts').update({'cursor': cursor, 'sent': sent, 'failed': failed, 'status': status}).eq('id', broadcast_id).execute()
+        except Exception as e:
+            logger.error(f"Error saving broadcast {broadcast_id} progress: {e}")
 
+    async def get_unfinished_broadcasts():
+        """Broadcasts that were still running when the bot last stopped."""
+        try:
+            resp = await supabase.table('broadcasts').select(BROADCAST_COLUMNS).eq('status', 'running').order('id').execute()
+            return resp.data
+        except Exception as e:
+            logger.error(f"Error loading unfinished broadcasts: {e}")
+            return []
+
+    async def reconcile_stats():
+        """Recount the counters behind get_stats() from the tables and correct any drift."""
+        try:
+            total_users = await _count('user_settings')
+            chat_rows = await _count('active_chats')
+            queue_rows = await _count('waiting_queue')
+            resp = await supabase.table('stats_counters').select('name, value').execute()
+        except Exception as e:
+            logger.error(f"Error reconciling stats: {e}")
+            return await get_stats()
+        persisted = {row['name']: row['value'] for row in resp.data}
+        _correct_stats(total_users, persisted, chat_rows, queue_rows)
+        return await get_stats()
 
 
+# Time every call of the functions above for /metrics, whichever backend defined them
+instrument_module(globals())
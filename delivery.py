@@ -0,0 +1,37 @@
+"""
+Recognising recipients the bot can no longer reach.
+
+Telegram answers Forbidden when a user has blocked the bot or deleted their
+account, and BadRequest "Chat not found" for chats that no longer exist. Every
+later message to them would fail the same way, so they are flagged with
+db.mark_unreachable(), which keeps them out of matchmaking and broadcasts until
+track_activity() sees an update from them again.
+"""
+import logging
+from telegram import Update
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import ContextTypes
+import database as db
+
+logger = logging.getLogger(__name__)
+
+
+def is_unreachable_error(error):
+    """True if error means messages to that chat cannot be delivered at all."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and 'chat not found' in error.message.lower()
+
+
+async def record_failure(user_id, error):
+    """Flag user_id if error shows they are unreachable. Returns True if it did."""
+    if not is_unreachable_error(error):
+        return False
+    await db.mark_unreachable(user_id)
+    return True
+
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every other handler: an update from a user proves they are reachable."""
+    if update.effective_user:
+        await db.mark_reachable(update.effective_user.id)
@@ -1,8 +1,9 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import BAD_WORDS
 import database as db
+from delivery import record_failure
+from moderation import find_bad_word
 from locales import get_text
 from keyboards import (
     get_main_menu_keyboard,
@@ -15,13 +16,60 @@ from keyboards import (
     get_language_keyboard
 )
 from telegram import constants
+from functools import partial
+from pairing import connect_pair
+from metrics import timed_handler
 
 logger = logging.getLogger(__name__)
 
+@timed_handler
+async def load_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before the other handlers: reads the user's session once for the whole update."""
+    if update.effective_user:
+        context.session = await db.get_session_context(update.effective_user.id)
+
+async def notify_partner_left(context, partner_id):
+    """Tell the former partner the chat is over."""
+    session = context.session
+    if partner_id == session.partner_id:
+        partner_lang = session.partner_language
+    else:
+        partner_lang = await db.get_language(partner_id)
+    try:
+        await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Failed to notify partner {partner_id}: {e}")
+        await record_failure(partner_id, e)
+
+async def find_partner(context, user_id, lang, show, message_id=None):
+    """
+    Pair the user with someone waiting, or queue them. `show(text, reply_markup=...)`
+    displays the result; message_id is the message it edits, if any.
+    """
+    user_interest = context.session.interest
+    # Nobody is paired while an update of their own is in flight (say, cancelling
+    # the search), or it would go on as if they were still waiting
+    partner_id = await db.match_and_pair(user_id, user_interest, context.application.update_processor.is_busy)
+
+    if partner_id:
+        searching_msg_id = context.user_data.pop('searching_msg_id', None)
+        if searching_msg_id == message_id:
+            # The searching message is the one about to show the chat
+            searching_msg_id = None
+        await connect_pair(context.bot, user_id, partner_id, lang, user_interest, show, searching_msg_id)
+    else:
+        await db.add_to_queue(user_id, user_interest)
+        msg = get_text(lang, 'searching')
+        if user_interest:
+            msg += get_text(lang, 'interest_label', user_interest)
+        sent_msg = await show(msg, reply_markup=get_queue_keyboard(lang))
+        # Store searching message ID for cleanup
+        context.user_data['searching_msg_id'] = sent_msg.message_id
+
+@timed_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"User {update.effective_user.id} started the bot.")
-    user_id = update.effective_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     
     # Simple Captcha: Force user to click a button first
     await update.message.reply_text(
@@ -30,10 +78,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+@timed_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     await query.answer()
 
     if query.data == 'captcha_solved':
@@ -44,60 +93,18 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     elif query.data == 'start_search':
-        if await db.get_partner(user_id):
+        if context.session.partner_id:
             await query.edit_message_text(get_text(lang, 'already_in_chat'), reply_markup=get_chat_keyboard(lang))
             return
         
-        if await db.is_in_queue(user_id):
+        if context.session.in_queue:
             await query.edit_message_text(get_text(lang, 'searching'), reply_markup=get_queue_keyboard(lang), parse_mode='Markdown')
             return
 
-        user_interest = await db.get_interest(user_id)
-        partner_id = await db.get_from_queue(user_id, user_interest)
-        
-        if partner_id:
-            await db.create_chat(user_id, partner_id)
-            partner_lang = await db.get_language(partner_id)
-            
-            msg = get_text(lang, 'connected')
-            partner_msg = get_text(partner_lang, 'connected')
-            
-            if user_interest:
-                msg += get_text(lang, 'matched_interest', user_interest)
-                partner_msg += get_text(partner_lang, 'matched_interest', user_interest)
-            
-            await query.edit_message_text(msg, reply_markup=get_chat_keyboard(lang), parse_mode='Markdown')
-            try:
-                # Pin message for user
-                await context.bot.pin_chat_message(chat_id=user_id, message_id=query.message.message_id)
-            except Exception:
-                pass
-
-            try:
-                sent_partner = await context.bot.send_message(partner_id, partner_msg, reply_markup=get_chat_keyboard(partner_lang), parse_mode='Markdown')
-                # Pin message for partner
-                await context.bot.pin_chat_message(chat_id=partner_id, message_id=sent_partner.message_id)
-            except Exception as e:
-                logger.error(f"Failed to send message to partner {partner_id}: {e}")
-            
-            # Cleanup searching message
-            if 'searching_msg_id' in context.user_data:
-                try:
-                    await context.bot.delete_message(chat_id=user_id, message_id=context.user_data['searching_msg_id'])
-                    del context.user_data['searching_msg_id']
-                except Exception:
-                    pass
-        else:
-            await db.add_to_queue(user_id, user_interest)
-            msg = get_text(lang, 'searching')
-            if user_interest:
-                msg += get_text(lang, 'interest_label', user_interest)
-            sent_msg = await query.edit_message_text(msg, reply_markup=get_queue_keyboard(lang), parse_mode='Markdown')
-            # Store searching message ID for cleanup
-            context.user_data['searching_msg_id'] = sent_msg.message_id
+        await find_partner(context, user_id, lang, partial(query.edit_message_text, parse_mode='Markdown'), query.message.message_id)
 
     elif query.data == 'set_interest':
-        current_interest = await db.get_interest(user_id) or "None"
+        current_interest = context.session.interest or "None"
         await query.edit_message_text(
             get_text(lang, 'select_interest', current_interest),
             reply_markup=get_interest_keyboard(lang),
@@ -145,65 +152,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.unpin_all_chat_messages(chat_id=user_id)
         await query.edit_message_text(get_text(lang, 'chat_ended'), reply_markup=get_main_menu_keyboard(lang), parse_mode='Markdown')
         if partner_id:
-            partner_lang = await db.get_language(partner_id)
-            try:
-                await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"Failed to notify partner {partner_id}: {e}")
+            await notify_partner_left(context, partner_id)
 
     elif query.data == 'next_partner':
         partner_id = await db.end_chat(user_id)
         await context.bot.unpin_all_chat_messages(chat_id=user_id)
         if partner_id:
-            partner_lang = await db.get_language(partner_id)
-            try:
-                await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"Failed to notify partner {partner_id}: {e}")
+            await notify_partner_left(context, partner_id)
         
         # Start new search immediately
-        user_interest = await db.get_interest(user_id)
-        partner_id = await db.get_from_queue(user_id, user_interest)
-        
-        if partner_id:
-            await db.create_chat(user_id, partner_id)
-            partner_lang = await db.get_language(partner_id)
-            
-            msg = get_text(lang, 'connected')
-            partner_msg = get_text(partner_lang, 'connected')
-            
-            if user_interest:
-                msg += get_text(lang, 'matched_interest', user_interest)
-                partner_msg += get_text(partner_lang, 'matched_interest', user_interest)
-            
-            await query.edit_message_text(msg, reply_markup=get_chat_keyboard(lang), parse_mode='Markdown')
-            try:
-                # Pin message for user
-                await context.bot.pin_chat_message(chat_id=user_id, message_id=query.message.message_id)
-            except Exception:
-                pass
-
-            try:
-                sent_partner = await context.bot.send_message(partner_id, partner_msg, reply_markup=get_chat_keyboard(partner_lang), parse_mode='Markdown')
-                # Pin message for partner
-                await context.bot.pin_chat_message(chat_id=partner_id, message_id=sent_partner.message_id)
-            except Exception as e:
-                logger.error(f"Failed to send message to partner {partner_id}: {e}")
-            
-            # Cleanup searching message
-            if 'searching_msg_id' in context.user_data:
-                try:
-                    await context.bot.delete_message(chat_id=user_id, message_id=context.user_data['searching_msg_id'])
-                    del context.user_data['searching_msg_id']
-                except Exception:
-                    pass
-        else:
-            await db.add_to_queue(user_id, user_interest)
-            msg = get_text(lang, 'searching')
-            if user_interest:
-                msg += get_text(lang, 'interest_label', user_interest)
-            sent_msg = await query.edit_message_text(msg, reply_markup=get_queue_keyboard(lang), parse_mode='Markdown')
-            context.user_data['searching_msg_id'] = sent_msg.message_id
+        await find_partner(context, user_id, lang, partial(query.edit_message_text, parse_mode='Markdown'), query.message.message_id)
 
     elif query.data == 'cancel_search':
         await db.remove_from_queue(user_id)
@@ -228,7 +186,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif query.data.startswith('report_'):
         reason = query.data.split('_')[1]
-        partner_id = await db.get_partner(user_id)
+        partner_id = context.session.partner_id
         if partner_id:
             await db.report_user(user_id, partner_id, reason)
             await query.answer(get_text(lang, 'user_reported'), show_alert=True)
@@ -245,30 +203,20 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if partner_id:
             await db.block_user(user_id, partner_id)
             await query.edit_message_text(get_text(lang, 'blocked'), reply_markup=get_main_menu_keyboard(lang), parse_mode='Markdown')
-            partner_lang = await db.get_language(partner_id)
-            try:
-                await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"Failed to notify partner {partner_id}: {e}")
+            await notify_partner_left(context, partner_id)
         else:
              await query.edit_message_text(get_text(lang, 'not_in_chat'), reply_markup=get_main_menu_keyboard(lang))
 
 
 from middleware import check_rate_limit
-import asyncio
+from albums import AlbumAggregator
+from config import ALBUM_QUIET_PERIOD, ALBUM_MAX_DELAY
 from telegram import InputMediaPhoto, InputMediaVideo, InputMediaAudio, InputMediaDocument
 
-# Buffer for media groups: media_group_id -> list of messages
-media_buffer = {}
+async def send_media_group(messages, data):
+    """Relay the collected items of one album to the partner."""
+    bot, partner_id = data
 
-async def send_media_group_task(context, partner_id, media_group_id):
-    """Wait for all media in a group to arrive, then send them together."""
-    await asyncio.sleep(2)  # Wait 2 seconds for all parts to arrive
-    
-    messages = media_buffer.pop(media_group_id, [])
-    if not messages:
-        return
-    
     # Sort by message_id to ensure correct order
     messages.sort(key=lambda m: m.message_id)
     
@@ -291,22 +239,29 @@ async def send_media_group_task(context, partner_id, media_group_id):
             
     if media:
         try:
-            sent_msgs = await context.bot.send_media_group(chat_id=partner_id, media=media)
+            sent_msgs = await bot.send_media_group(chat_id=partner_id, media=media)
             
-            # Log all messages
+            # Log all messages in one batch
             sender_id = messages[0].from_user.id
-            for orig, sent in zip(messages, sent_msgs):
-                await db.log_message(sender_id, orig.message_id, partner_id, sent.message_id)
+            await db.log_messages([
+                (sender_id, orig.message_id, partner_id, sent.message_id)
+                for orig, sent in zip(messages, sent_msgs)
+            ])
                 
         except Exception as e:
             logger.error(f"Failed to send media group to {partner_id}: {e}")
+            await record_failure(partner_id, e)
 
+# Album items are collected per (sender, media_group_id) and relayed together
+albums = AlbumAggregator(send_media_group, quiet=ALBUM_QUIET_PERIOD, deadline=ALBUM_MAX_DELAY)
+
+@timed_handler
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     
     # Rate Limit Check
-    is_allowed, error_msg = check_rate_limit(user_id)
+    is_allowed, error_msg = await check_rate_limit(user_id)
     if not is_allowed:
         if "Muted" in error_msg:
             # Extract seconds
@@ -317,25 +272,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(error_msg)
         return
 
-    partner_id = await db.get_partner(user_id)
+    partner_id = context.session.partner_id
     
     if partner_id:
-        # Bad Word Filter
-        if update.message.text:
-            text_lower = update.message.text.lower()
-            for bad_word in BAD_WORDS:
-                if bad_word in text_lower:
-                    await update.message.reply_text(get_text(lang, 'blocked_msg'), parse_mode='Markdown')
-                    return
+        # Bad Word Filter (text and media captions)
+        if find_bad_word(update.message.text or update.message.caption):
+            await update.message.reply_text(get_text(lang, 'blocked_msg'), parse_mode='Markdown')
+            return
 
         # Media Group Handling
         if update.message.media_group_id:
-            mg_id = update.message.media_group_id
-            if mg_id not in media_buffer:
-                media_buffer[mg_id] = []
-                context.application.create_task(send_media_group_task(context, partner_id, mg_id))
-            
-            media_buffer[mg_id].append(update.message)
+            albums.add((user_id, update.message.media_group_id), update.message, (context.bot, partner_id))
             return
 
         try:
@@ -346,7 +293,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             sent_msg = await update.message.copy(
                 chat_id=partner_id,
-                reply_to_message_id=reply_to_message_id
+                reply_to_message_id=reply_to_message_id,
+                # The replied-to message may have been deleted on the partner's side
+                allow_sending_without_reply=True
             )
             
             # Log message
@@ -354,18 +303,23 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         except Exception as e:
             logger.error(f"Failed to send message to {partner_id}: {e}")
-            # Notify user if partner blocked/stopped
-            await db.end_chat(user_id)
-            await update.message.reply_text(get_text(lang, 'partner_offline'), reply_markup=get_main_menu_keyboard(lang))
+            if await record_failure(partner_id, e):
+                # Partner blocked the bot or deleted their account
+                await db.end_chat(user_id)
+                await update.message.reply_text(get_text(lang, 'partner_offline'), reply_markup=get_main_menu_keyboard(lang))
+            else:
+                # Flood control or network trouble outlasted the retries; the chat is fine
+                await update.message.reply_text(get_text(lang, 'send_failed'))
     else:
         # Not in chat
         pass
 
 
+@timed_handler
 async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle edited messages and sync to partner."""
     user_id = update.effective_user.id
-    partner_id = await db.get_partner(user_id)
+    partner_id = context.session.partner_id
     
     if partner_id and update.edited_message:
         try:
@@ -387,10 +341,11 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Failed to sync edit: {e}")
 
 
+@timed_handler
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Allow user to delete a sent message by replying to it with /delete."""
     user_id = update.effective_user.id
-    partner_id = await db.get_partner(user_id)
+    partner_id = context.session.partner_id
     
     if not update.message.reply_to_message:
         await update.message.reply_text("⚠️ Reply to the message you want to delete with /delete.")
@@ -411,61 +366,26 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("⚠️ Could not find that message to delete.")
 
+@timed_handler
 async def next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /next command."""
     user_id = update.effective_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     
     partner_id = await db.end_chat(user_id)
     await context.bot.unpin_all_chat_messages(chat_id=user_id)
     
     if partner_id:
-        partner_lang = await db.get_language(partner_id)
-        try:
-            await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"Failed to notify partner {partner_id}: {e}")
+        await notify_partner_left(context, partner_id)
     
     # Start new search immediately
-    user_interest = await db.get_interest(user_id)
-    partner_id = await db.get_from_queue(user_id, user_interest)
-    
-    if partner_id:
-        await db.create_chat(user_id, partner_id)
-        partner_lang = await db.get_language(partner_id)
-        
-        msg = get_text(lang, 'connected')
-        partner_msg = get_text(partner_lang, 'connected')
-        
-        if user_interest:
-            msg += get_text(lang, 'matched_interest', user_interest)
-            partner_msg += get_text(partner_lang, 'matched_interest', user_interest)
-        
-        sent_msg = await update.message.reply_text(msg, reply_markup=get_chat_keyboard(lang), parse_mode='Markdown')
-        try:
-            # Pin message for user
-            await context.bot.pin_chat_message(chat_id=user_id, message_id=sent_msg.message_id)
-        except Exception:
-            pass
-
-        try:
-            sent_partner = await context.bot.send_message(partner_id, partner_msg, reply_markup=get_chat_keyboard(partner_lang), parse_mode='Markdown')
-            # Pin message for partner
-            await context.bot.pin_chat_message(chat_id=partner_id, message_id=sent_partner.message_id)
-        except Exception as e:
-            logger.error(f"Failed to send message to partner {partner_id}: {e}")
-    else:
-        await db.add_to_queue(user_id, user_interest)
-        msg = get_text(lang, 'searching')
-        if user_interest:
-            msg += get_text(lang, 'interest_label', user_interest)
-        sent_msg = await update.message.reply_text(msg, reply_markup=get_queue_keyboard(lang), parse_mode='Markdown')
-        context.user_data['searching_msg_id'] = sent_msg.message_id
+    await find_partner(context, user_id, lang, partial(update.message.reply_text, parse_mode='Markdown'))
 
+@timed_handler
 async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /stop command."""
     user_id = update.effective_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     
     partner_id = await db.end_chat(user_id)
     await context.bot.unpin_all_chat_messages(chat_id=user_id)
@@ -473,16 +393,12 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(get_text(lang, 'chat_ended'), reply_markup=get_main_menu_keyboard(lang), parse_mode='Markdown')
     
     if partner_id:
-        partner_lang = await db.get_language(partner_id)
-        try:
-            await context.bot.send_message(partner_id, get_text(partner_lang, 'partner_disconnected'), reply_markup=get_main_menu_keyboard(partner_lang), parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"Failed to notify partner {partner_id}: {e}")
+        await notify_partner_left(context, partner_id)
 
+@timed_handler
 async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /language command."""
-    user_id = update.effective_user.id
-    lang = await db.get_language(user_id)
+    lang = context.session.language
     await update.message.reply_text(
         get_text(lang, 'select_language'),
         reply_markup=get_language_keyboard(),
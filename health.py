@@ -0,0 +1,76 @@
+"""
+Liveness of the running bot, reported by app.py's /health endpoint.
+
+Two TypeHandlers bracket every update: record_received() in the first handler
+group and record_processed() in the last, so the difference is how many
+updates are being handled right now. Together with the updates still queued
+and those the update processor holds back until their conversation (or a
+running slot) is free, that is the backlog; a backlog that keeps growing, or a bot that stopped
+polling, shows up here long before users complain.
+"""
+import time
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+import database as db
+from http_pool import pool_stats
+
+# Handler groups for the two hooks, around every other group in bot.py
+FIRST_GROUP = -3
+LAST_GROUP = 1
+
+_state = {
+    'received': 0,
+    'processed': 0,
+    'last_update_id': None,
+    'last_processed_at': None,
+}
+
+
+async def record_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _state['received'] += 1
+
+
+async def record_processed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _state['processed'] += 1
+    _state['last_update_id'] = update.update_id
+    _state['last_processed_at'] = time.time()
+
+
+async def health_report(application: Application, mode):
+    """
+    Status of the bot as a dict, with 'healthy' set to False if it is not
+    receiving updates or the database does not answer.
+    """
+    running = application is not None and application.running
+    if running and mode == 'polling':
+        running = application.updater.running
+
+    try:
+        db_latency = await db.ping()
+    except Exception as e:
+        db_latency, db_error = None, str(e)
+    else:
+        db_error = None
+
+    last_at = _state['last_processed_at']
+    queued = application.update_queue.qsize() if application is not None else 0
+    processor = application.update_processor.stats() if application is not None else {'running': 0, 'waiting': 0}
+    in_progress = _state['received'] - _state['processed']
+    scheduler = application.bot.rate_limiter if application is not None else None
+    return {
+        'healthy': running and db_error is None,
+        'mode': mode,
+        'running': running,
+        'last_update_id': _state['last_update_id'],
+        'seconds_since_last_update': round(time.time() - last_at, 1) if last_at else None,
+        'updates_processed': _state['processed'],
+        'updates_in_progress': in_progress,
+        'updates_queued': queued,
+        'updates_waiting': processor['waiting'],
+        'updates_running': processor['running'],
+        'updates_backlog': queued + processor['waiting'] + in_progress,
+        'db_latency_ms': round(db_latency * 1000, 1) if db_latency is not None else None,
+        'db_error': db_error,
+        'outbound': scheduler.stats() if scheduler is not None else None,
+        'http_pools': pool_stats(),
+    }
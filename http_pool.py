@@ -0,0 +1,134 @@
+"""
+Connection pools for the Bot API.
+
+bot.py gives getUpdates long polling and everything the bot sends a
+PooledRequest each, so a long poll never holds a connection a send is
+waiting for. Each pool's size, keep-alive and timeouts come from config.py.
+
+A request that finds every connection busy waits for one (up to the pool
+timeout, after which PTB raises TimedOut without sending it). How long each
+request waited is recorded per pool and reported by /health, so the pool
+sizes can be set from what the bot actually sees. The waits, and how long
+each Bot API method takes, also go to /metrics.
+"""
+import time
+import httpx
+from telegram.request import HTTPXRequest
+from metrics import BOT_API_ERRORS, BOT_API_SECONDS, HTTP_POOL_WAIT_SECONDS
+
+# PooledRequest instances by name, for pool_stats()
+_pools = {}
+
+# Trace events marking that a request got a connection: a new one starts
+# connecting, or a pooled one starts sending
+_GOT_CONNECTION = ('connect_tcp.started', 'send_request_headers.started')
+
+
+class PoolWaits:
+    """Running totals of the time requests waited for a connection."""
+
+    __slots__ = ('requests', 'waited', 'total', 'max', 'timeouts')
+
+    # Waits shorter than this count as getting a connection straight away (seconds)
+    THRESHOLD = 0.001
+
+    def __init__(self):
+        self.requests = 0
+        self.waited = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds):
+        self.requests += 1
+        if seconds >= self.THRESHOLD:
+            self.waited += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'waited': self.waited,
+            'avg_wait_ms': round(self.total / self.requests * 1000, 2) if self.requests else 0.0,
+            'max_wait_ms': round(self.max * 1000, 2),
+            'timeouts': self.timeouts,
+        }
+
+
+class PooledRequest(HTTPXRequest):
+    """
+    HTTPXRequest with its own keep-alive settings that records how long each
+    request waits for a free connection (see PoolWaits).
+    """
+
+    def __init__(self, name, pool_size, keepalive, keepalive_expiry, http_version='1.1',
+                 connect_timeout=5.0, read_timeout=5.0, write_timeout=5.0, pool_timeout=1.0):
+        # Read by _build_client(), which HTTPXRequest.__init__ calls
+        self.name = name
+        self.pool_size = pool_size
+        self.waits = PoolWaits()
+        self._wait_series = HTTP_POOL_WAIT_SECONDS.labels(name)
+        self._limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=min(keepalive, pool_size),
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(
+            connection_pool_size=pool_size,
+            http_version=http_version,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            pool_timeout=pool_timeout,
+        )
+        _pools[name] = self
+
+    def _build_client(self):
+        self._client_kwargs['limits'] = self._limits
+        self._client_kwargs['event_hooks'] = {'request': [self._trace_pool_wait]}
+        return super()._build_client()
+
+    async def _trace_pool_wait(self, request):
+        # httpx hands request extensions to httpcore, which reports its steps to 'trace'
+        started = time.perf_counter()
+        waits, series = self.waits, self._wait_series
+        pending = True
+
+        async def trace(event, info):
+            nonlocal pending
+            if pending and event.endswith(_GOT_CONNECTION):
+                pending = False
+                waited = time.perf_counter() - started
+                waits.record(waited)
+                HTTP_POOL_WAIT_SECONDS.observe(series, waited)
+
+        request.extensions['trace'] = trace
+
+    async def do_request(self, url, method, *args, **kwargs):
+        # API calls are POSTs to a URL ending in the API method (the token before it
+        # stays out of the labels); file downloads are GETs of the file's path
+        api_method = url.rsplit('/', 1)[-1] if method == 'POST' else 'download'
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self.waits.timeouts += 1
+            BOT_API_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(BOT_API_SECONDS.labels(api_method), time.perf_counter() - started)
+        if code >= 400:
+            # Telegram's answer (flood control, a blocked user, ...); PTB raises it
+            BOT_API_ERRORS.inc(api_method, str(code))
+        return code, payload
+
+    def stats(self):
+        return {'size': self.pool_size, 'http_version': self.http_version, **self.waits.as_dict()}
+
+
+def pool_stats():
+    """Pool-wait figures of every PooledRequest, by name."""
+    return {name: request.stats() for name, request in _pools.items()}
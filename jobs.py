@@ -0,0 +1,52 @@
+"""
+Periodic background jobs, run by the application's JobQueue.
+"""
+import logging
+from telegram.ext import Application, ContextTypes
+from config import MESSAGE_LOG_RETENTION_DAYS
+import database as db
+from broadcast import resume_broadcasts
+from middleware import sweep_rate_limits
+from moderation import reload_if_changed
+
+logger = logging.getLogger(__name__)
+
+# How often each job runs, in seconds
+PRUNE_MESSAGE_LOGS_INTERVAL = 3600
+RECONCILE_STATS_INTERVAL = 600
+SWEEP_RATE_LIMITS_INTERVAL = 60
+RELOAD_BAD_WORDS_INTERVAL = 30
+
+
+async def prune_message_logs(context: ContextTypes.DEFAULT_TYPE):
+    """Drop message id mappings past the retention window."""
+    await db.prune_message_logs(MESSAGE_LOG_RETENTION_DAYS * 86400)
+
+
+async def reconcile_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Correct drift in the /stats counters against the tables."""
+    await db.reconcile_stats()
+
+
+async def sweep_idle_rate_limits(context: ContextTypes.DEFAULT_TYPE):
+    """Drop rate-limit state of users who have gone quiet."""
+    evicted = await sweep_rate_limits()
+    if evicted:
+        logger.debug(f"Evicted {evicted} idle users from the rate limiter")
+
+
+async def reload_bad_words(context: ContextTypes.DEFAULT_TYPE):
+    """Recompile the bad-word filter when its word list file changes."""
+    reload_if_changed()
+
+
+def schedule_jobs(application: Application):
+    job_queue = application.job_queue
+    if job_queue is None:
+        logger.warning("JobQueue unavailable (install python-telegram-bot[job-queue]); background jobs disabled")
+        return
+    job_queue.run_repeating(prune_message_logs, interval=PRUNE_MESSAGE_LOGS_INTERVAL, first=60, name="prune_message_logs")
+    job_queue.run_repeating(reconcile_stats, interval=RECONCILE_STATS_INTERVAL, first=RECONCILE_STATS_INTERVAL, name="reconcile_stats")
+    job_queue.run_once(resume_broadcasts, 5, name="resume_broadcasts")
+    job_queue.run_repeating(sweep_idle_rate_limits, interval=SWEEP_RATE_LIMITS_INTERVAL, first=SWEEP_RATE_LIMITS_INTERVAL, name="sweep_rate_limits")
+    job_queue.run_repeating(reload_bad_words, interval=RELOAD_BAD_WORDS_INTERVAL, first=RELOAD_BAD_WORDS_INTERVAL, name="reload_bad_words")
@@ -27,6 +27,7 @@ TEXTS = {
         'blocked': "🚫 **User blocked and chat ended.**",
         'blocked_msg': "⚠️ **Message blocked:** Contains restricted words.",
         'partner_offline': "⚠️ Partner seems to be offline. Ending chat.",
+        'send_failed': "⚠️ Your message could not be delivered. Please try again.",
         'end_chat': "🛑 End Chat",
         'next_partner': "⏭️ Next",
         'report': "⚠️ Report",
@@ -66,6 +67,7 @@ TEXTS = {
         'blocked': "🚫 **පරිශීලකයා අවහිර කර කතාබහ අවසන් කරන ලදී.**",
         'blocked_msg': "⚠️ **පණිවිඩය අවහිර කරන ලදී:** තහනම් වචන අඩංගු වේ.",
         'partner_offline': "⚠️ සහකරු නොබැඳි බව පෙනේ. කතාබහ අවසන් කරයි.",
+        'send_failed': "⚠️ ඔබගේ පණිවිඩය යැවීමට නොහැකි විය. කරුණාකර නැවත උත්සාහ කරන්න.",
         'end_chat': "🛑 නවත්වන්න",
         'next_partner': "⏭️ ඊළඟ",
         'report': "⚠️ වාර්තා",
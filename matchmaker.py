@@ -0,0 +1,140 @@
+"""
+In-process matchmaking queue and blocklist index.
+
+Waiting users are kept in one FIFO deque per interest plus a membership dict,
+so queue membership checks are O(1) and the oldest eligible user can be popped
+in O(1) amortized time. database.py owns the single instance, writes every
+change through to the waiting_queue table and rebuilds the queue from that
+table on startup. The queue is therefore owned by one bot process.
+BlockIndex does the same for blocked_users, so candidates are vetted without
+sending exclusion lists to the database.
+"""
+import itertools
+from collections import deque
+
+# Rebuild the deques once this many removed users are still sitting in them
+COMPACT_THRESHOLD = 1024
+
+
+class Matchmaker:
+    def __init__(self):
+        self._queues = {}  # interest -> deque of (ticket, user_id)
+        self._members = {}  # user_id -> (interest, ticket)
+        self._tickets = itertools.count()
+        self._stale = 0  # deque entries whose user has since left the queue
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, user_id):
+        return user_id in self._members
+
+    def clear(self):
+        self._queues.clear()
+        self._members.clear()
+        self._stale = 0
+
+    def load(self, rows):
+        """Rebuild the queue from (user_id, interest) rows, oldest first."""
+        self.clear()
+        for user_id, interest in rows:
+            self.add(user_id, interest)
+
+    def add(self, user_id, interest=None):
+        """Queue user_id at the back of their interest's line. Returns False if already waiting."""
+        if user_id in self._members:
+            return False
+        ticket = next(self._tickets)
+        self._members[user_id] = (interest, ticket)
+        self._queues.setdefault(interest, deque()).append((ticket, user_id))
+        return True
+
+    def remove(self, user_id):
+        """Take user_id out of the queue. Returns False if they were not waiting."""
+        if self._members.pop(user_id, None) is None:
+            return False
+        # The deque entry is dropped lazily, when it reaches the head of its line
+        self._stale += 1
+        if self._stale > COMPACT_THRESHOLD and self._stale > len(self._members):
+            self._compact()
+        return True
+
+    def pop(self, user_id, interest=None, is_eligible=None):
+        """
+        Remove and return the user who has waited longest and can be paired with user_id.
+        With an interest only users waiting on that interest qualify, otherwise
+        anyone does. is_eligible(candidate_id) can veto candidates (e.g. blocked users).
+        Returns None if nobody qualifies.
+        """
+        if interest:
+            queues = [self._queues.get(interest)]
+        else:
+            queues = list(self._queues.values())
+
+        best = None
+        for queue in queues:
+            entry = self._first_eligible(queue, user_id, is_eligible)
+            if entry and (best is None or entry[0] < best[0]):
+                best = entry
+
+        if best is None:
+            return None
+        self.remove(best[1])
+        return best[1]
+
+    def _is_current(self, entry):
+        ticket, user_id = entry
+        member = self._members.get(user_id)
+        return member is not None and member[1] == ticket
+
+    def _first_eligible(self, queue, user_id, is_eligible):
+        if not queue:
+            return None
+        # Discard entries of users who already left the line
+        while queue and not self._is_current(queue[0]):
+            queue.popleft()
+            self._stale -= 1
+        for entry in queue:
+            candidate = entry[1]
+            if candidate == user_id or not self._is_current(entry):
+                continue
+            if is_eligible is None or is_eligible(candidate):
+                return entry
+        return None
+
+    def _compact(self):
+        for interest, queue in self._queues.items():
+            self._queues[interest] = deque(entry for entry in queue if self._is_current(entry))
+        self._stale = 0
+
+
+class BlockIndex:
+    """
+    Blocklist held in memory as adjacency sets in both directions, so checking
+    whether two users may be paired is two set lookups and no query.
+    """
+
+    def __init__(self):
+        self._blocked = {}  # user_id -> ids that user blocked
+        self._blocked_by = {}  # user_id -> ids that blocked that user
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._blocked.values())
+
+    def clear(self):
+        self._blocked.clear()
+        self._blocked_by.clear()
+
+    def load(self, rows):
+        """Rebuild the index from (user_id, blocked_user_id) rows."""
+        self.clear()
+        for user_id, blocked_user_id in rows:
+            self.add(user_id, blocked_user_id)
+
+    def add(self, user_id, blocked_user_id):
+        self._blocked.setdefault(user_id, set()).add(blocked_user_id)
+        self._blocked_by.setdefault(blocked_user_id, set()).add(user_id)
+
+    def is_blocked(self, user_id, other_id):
+        """True if either user has blocked the other."""
+        return other_id in self._blocked.get(user_id, ()) or other_id in self._blocked_by.get(user_id, ())
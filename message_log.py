@@ -0,0 +1,108 @@
+"""
+Write-behind buffer for message_logs.
+
+Relayed messages are logged as (sender_id, sender_msg_id, receiver_id,
+receiver_msg_id) rows. Instead of one INSERT and commit per message, rows are
+buffered and handed to a backend flush function in batches, once
+max_batch rows are pending or max_delay seconds after the first one arrived.
+Pending rows stay indexed in memory until they are written, so replies and
+edits to a message that was just relayed still resolve immediately.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stop re-queueing failed batches once this many batches' worth of rows are waiting
+MAX_PENDING_BATCHES = 10
+
+
+class MessageLogWriter:
+    def __init__(self, flush_rows, max_batch=100, max_delay=1.0):
+        self._flush_rows = flush_rows  # async callable taking a list of row tuples
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._by_sender = {}  # (sender_id, sender_msg_id) -> receiver_msg_id
+        self._by_receiver = {}  # (receiver_id, receiver_msg_id) -> sender_msg_id
+        self._timer = None
+        self._lock = None
+        self._tasks = set()  # flushes in flight; the event loop only keeps weak references
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, rows):
+        """Queue rows for writing; they are visible to the lookups right away."""
+        for row in rows:
+            sender_id, sender_msg_id, receiver_id, receiver_msg_id = row
+            self._pending.append(row)
+            self._by_sender[(sender_id, sender_msg_id)] = receiver_msg_id
+            self._by_receiver[(receiver_id, receiver_msg_id)] = sender_msg_id
+
+        if len(self._pending) >= self.max_batch:
+            self._start(self.flush())
+        elif self._pending and self._timer is None:
+            self._timer = self._start(self._flush_later())
+
+    def _start(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def get_receiver_msg_id(self, sender_id, sender_msg_id):
+        return self._by_sender.get((sender_id, sender_msg_id))
+
+    def get_sender_msg_id(self, receiver_id, receiver_msg_id):
+        return self._by_receiver.get((receiver_id, receiver_msg_id))
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write everything pending in batches of at most max_batch rows."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                try:
+                    await self._flush_rows(batch)
+                except Exception as e:
+                    if len(self._pending) < self.max_batch * MAX_PENDING_BATCHES:
+                        logger.error(f"Failed to write {len(batch)} message logs, will retry: {e}")
+                        self._pending[:0] = batch
+                        if self._timer is None:
+                            self._timer = self._start(self._flush_later())
+                        return
+                    logger.error(f"Failed to write {len(batch)} message logs, dropping them: {e}")
+                self._forget(batch)
+
+    def _forget(self, batch):
+        # Written rows are served by the database from now on
+        for sender_id, sender_msg_id, receiver_id, receiver_msg_id in batch:
+            if self._by_sender.get((sender_id, sender_msg_id)) == receiver_msg_id:
+                del self._by_sender[(sender_id, sender_msg_id)]
+            if self._by_receiver.get((receiver_id, receiver_msg_id)) == sender_msg_id:
+                del self._by_receiver[(receiver_id, receiver_msg_id)]
+
+    async def close(self):
+        """Cancel the flush timer, wait for running flushes and write out everything still pending."""
+        self._cancel_timer()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+        # A failed final flush must not leave a retry running after shutdown
+        self._cancel_timer()
+        if self._pending:
+            logger.error(f"Lost {len(self._pending)} message logs on shutdown")
+        self._lock = None
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
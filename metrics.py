@@ -0,0 +1,165 @@
+"""
+Latency histograms and counters, served by app.py's /metrics endpoint in the
+Prometheus text format.
+
+Each labelled series of a Histogram is one fixed-size array of doubles: a
+count per bucket, then one for values above the last bucket, then the running
+sum. Observing a value is a binary search and two additions, so the
+instruments are cheap enough to stay on in production:
+
+- timed_handler: decorator for the update handlers in handlers.py and admin.py
+- instrument_module(): wraps every public coroutine function of database.py
+- http_pool.PooledRequest times every Bot API call and its wait for a connection
+- pairing.connect_pair times each step of announcing a new chat
+- CallbackMetric: figures another object already keeps (such as a cache's hit
+  counters), read when /metrics is scraped
+"""
+import functools
+import inspect
+import time
+from array import array
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency buckets: in-memory lookups land in the
+# first few, Bot API and database round trips in the middle
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Every Histogram and Counter, in the order they are rendered
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_string(names, values):
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}' if pairs else ''
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class Histogram:
+    """Distribution of observed values per combination of label values."""
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> array('d'): bucket counts, overflow, sum
+        _registry.append(self)
+
+    def labels(self, *values):
+        """The series for these label values, created empty on first use."""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = array('d', bytes(8 * (len(self.buckets) + 2)))
+        return series
+
+    def observe(self, series, value):
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for values, series in self._series.items():
+            labels = _label_string(self.labelnames, values)
+            bucket_prefix = f'{self.name}_bucket' + (labels[:-1] + ',' if labels else '{')
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                lines.append(f'{bucket_prefix}le="{bound}"}} {int(cumulative)}')
+            lines.append(f'{self.name}_sum{labels} {repr(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {int(cumulative)}')
+        return lines
+
+
+class Counter:
+    """Running totals per combination of label values."""
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> total
+        _registry.append(self)
+
+    def inc(self, *values, amount=1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for values, total in self._values.items():
+            lines.append(f'{self.name}{_label_string(self.labelnames, values)} {_number(total)}')
+        return lines
+
+
+class CallbackMetric:
+    """A counter or gauge whose values read() returns, as {label values: value}, at scrape time."""
+
+    def __init__(self, name, documentation, kind, labelnames, read):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, value in self.read().items():
+            lines.append(f'{self.name}{_label_string(self.labelnames, values)} {_number(value)}')
+        return lines
+
+
+HANDLER_SECONDS = Histogram('slomegle_handler_seconds', 'Time spent handling an update, per handler.', ('handler',))
+HANDLER_ERRORS = Counter('slomegle_handler_errors_total', 'Exceptions raised by update handlers.', ('handler', 'error'))
+DB_SECONDS = Histogram('slomegle_db_seconds', 'Time spent in database.py calls, per function.', ('function',))
+DB_ERRORS = Counter('slomegle_db_errors_total', 'Exceptions raised by database.py calls.', ('function', 'error'))
+BOT_API_SECONDS = Histogram('slomegle_bot_api_seconds', 'Bot API request time, per method.', ('method',))
+BOT_API_ERRORS = Counter('slomegle_bot_api_errors_total', 'Failed Bot API requests, per method.', ('method', 'error'))
+HTTP_POOL_WAIT_SECONDS = Histogram('slomegle_http_pool_wait_seconds', 'Time Bot API requests waited for a pooled connection.', ('pool',))
+PAIRING_SECONDS = Histogram('slomegle_pairing_seconds', 'Time each step of connecting a new pair took, and the total.', ('step',))
+
+
+def timed(histogram, errors, name):
+    """Decorator recording how long each call of a coroutine function takes and what it raises."""
+    def decorator(func):
+        series = histogram.labels(name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                errors.inc(name, type(e).__name__)
+                raise
+            finally:
+                histogram.observe(series, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def timed_handler(func):
+    """Time an update handler into slomegle_handler_seconds, labelled with its name."""
+    return timed(HANDLER_SECONDS, HANDLER_ERRORS, func.__name__)(func)
+
+
+def instrument_module(namespace, histogram=DB_SECONDS, errors=DB_ERRORS):
+    """Replace every public coroutine function in a module's globals() with a timed one."""
+    for name, func in list(namespace.items()):
+        if not name.startswith('_') and inspect.iscoroutinefunction(func) and func.__module__ == namespace['__name__']:
+            namespace[name] = timed(histogram, errors, name)(func)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
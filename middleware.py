@@ -1,40 +1,386 @@
+"""
+Per-user message rate limiting.
+
+check_rate_limit() is served by one of three backends, picked with
+RATE_LIMIT_BACKEND:
+
+- memory: RateLimiter, an exact sliding window per process (the default).
+- sqlite: state in a SQLite file shared by every worker on the host.
+- redis: state in Redis, or any server speaking its protocol, shared by
+  every worker everywhere.
+
+The shared backends keep a sliding-window counter (this and the previous
+window's message counts, the previous one weighted by how much of it still
+overlaps the window) plus the mute deadline, so mutes survive restarts and
+apply across instances. Checks arriving together are coalesced into one
+batch, so each message costs at most one round trip to the store.
+"""
+import asyncio
+import logging
+import math
 import time
-from collections import defaultdict
+from array import array
+
+from config import RATE_LIMIT_BACKEND, RATE_LIMIT_SQLITE_PATH, REDIS_URL
+
+logger = logging.getLogger(__name__)
 
 # Rate limit settings
 RATE_LIMIT_MSG = 5  # Max messages
 RATE_LIMIT_WINDOW = 2  # In seconds
 MUTE_DURATION = 60  # Seconds
 
-# Storage: user_id -> list of timestamps
-user_timestamps = defaultdict(list)
-# Storage: user_id -> mute_end_timestamp
-muted_users = {}
+# Most checks sent to a shared store in one batch
+MAX_BATCH = 500
+
+
+def _muted_message(remaining):
+    return False, f"⚠️ You are muted for {int(remaining)}s due to spam."
+
+
+def _too_fast_message(mute):
+    return False, f"🚫 You are sending messages too fast! Muted for {mute}s."
+
 
-def check_rate_limit(user_id):
+class _Window:
+    """The last `limit` message times of one user, in a fixed-size ring."""
+    __slots__ = ('times', 'head', 'muted_until')
+
+    def __init__(self, limit):
+        self.times = array('d', [float('-inf')]) * limit
+        self.head = 0  # index of the oldest time, overwritten next
+        self.muted_until = 0.0
+
+    def last_seen(self):
+        return self.times[self.head - 1]
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter: more than `limit` messages within `window` seconds
+    mutes a user for `mute` seconds. Each user costs one fixed-size ring of
+    timestamps, so a check is O(1) in time and memory; sweep() forgets users
+    who have gone quiet.
+    """
+
+    def __init__(self, limit=RATE_LIMIT_MSG, window=RATE_LIMIT_WINDOW, mute=MUTE_DURATION, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.mute = mute
+        self._clock = clock
+        self._users = {}  # user_id -> _Window
+
+    def __len__(self):
+        return len(self._users)
+
+    def check(self, user_id):
+        """
+        Check if user is rate limited.
+        Returns (is_allowed, error_message)
+        """
+        now = self._clock()
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _Window(self.limit)
+
+        # Check if currently muted
+        if now < state.muted_until:
+            return _muted_message(state.muted_until - now)
+
+        # The slot about to be overwritten holds the message `limit` messages ago;
+        # if that is still inside the window this one is over the limit
+        oldest = state.times[state.head]
+        state.times[state.head] = now
+        state.head = (state.head + 1) % self.limit
+        if now - oldest < self.window:
+            state.muted_until = now + self.mute
+            return _too_fast_message(self.mute)
+
+        return True, None
+
+    def sweep(self):
+        """Forget users who are neither muted nor have messages in the window. Returns how many."""
+        now = self._clock()
+        idle = [user_id for user_id, state in self._users.items()
+                if now >= state.muted_until and now - state.last_seen() >= self.window]
+        for user_id in idle:
+            del self._users[user_id]
+        # A dict never gives back its table on deletes; copy it once most of it is gone
+        if len(idle) > len(self._users):
+            self._users = dict(self._users)
+        return len(idle)
+
+
+class MemoryBackend:
+    """RateLimiter behind the async backend interface."""
+
+    def __init__(self, **limits):
+        self.limiter = RateLimiter(**limits)
+
+    async def check(self, user_id):
+        return self.limiter.check(user_id)
+
+    async def sweep(self):
+        return self.limiter.sweep()
+
+    async def close(self):
+        pass
+
+
+class _BatchingBackend:
+    """
+    Base for shared stores. check() calls made in the same event loop
+    iteration are sent to _check_batch() together, one round trip for all.
+    With unique_users set, a user checked again within a batch waits for the
+    next one, for stores that do not answer in the order they applied checks.
+    """
+
+    unique_users = False
+
+    def __init__(self, limit=RATE_LIMIT_MSG, window=RATE_LIMIT_WINDOW, mute=MUTE_DURATION, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.mute = mute
+        self._clock = clock  # wall clock: shared with other processes
+        self._pending = []  # (user_id, future)
+        self._flushing = False
+        self._tasks = set()  # background work; the event loop only keeps weak references
+
+    async def check(self, user_id):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, future))
+        if not self._flushing:
+            # The task starts on the next loop iteration, after this one's checks are in
+            self._flushing = True
+            self._start(self._flush())
+        return await future
+
+    def _start(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _wait_for_tasks(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _next_batch(self):
+        if not self.unique_users:
+            batch = self._pending[:MAX_BATCH]
+            del self._pending[:MAX_BATCH]
+            return batch
+        batch, later, seen = [], [], set()
+        for check in self._pending:
+            if check[0] in seen or len(batch) >= MAX_BATCH:
+                later.append(check)
+            else:
+                seen.add(check[0])
+                batch.append(check)
+        self._pending = later
+        return batch
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                batch = self._next_batch()
+                try:
+                    results = await self._check_batch([user_id for user_id, _ in batch], self._clock())
+                except Exception as e:
+                    # Never hold up chats because the store is unavailable
+                    logger.error(f"Rate limit store failed, allowing {len(batch)} messages: {e}")
+                    results = [(True, None)] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._flushing = False
+
+    def _window_position(self, now):
+        """The current window number and the weight left on the previous window."""
+        slot = math.floor(now / self.window)
+        return slot, 1 - (now - slot * self.window) / self.window
+
+    def _verdict(self, muted_until, mute_until, now):
+        if muted_until == mute_until:
+            return _too_fast_message(self.mute)
+        if muted_until > now:
+            return _muted_message(muted_until - now)
+        return True, None
+
+
+class SQLiteBackend(_BatchingBackend):
+    """
+    State in a SQLite file, updated with one multi-row upsert per batch.
+    SQLite returns RETURNING rows in no particular order, so each user is in
+    a batch at most once and rows are matched to checks by user_id.
+    """
+
+    unique_users = True
+
+    # ?1 now, ?2 current window, ?3 weight of the previous window, ?4 limit,
+    # ?5 mute deadline if this message trips the limit; user ids from ?6 on.
+    # Muted users are left untouched, everyone else rolls the window forward
+    # and is muted if the weighted count goes over the limit.
+    UPSERT = """
+        INSERT INTO rate_limits (user_id, slot, count, prev_count, muted_until) VALUES {values}
+        ON CONFLICT(user_id) DO UPDATE SET
+            muted_until = CASE
+                WHEN muted_until > ?1 THEN muted_until
+                WHEN (CASE WHEN slot = ?2 THEN prev_count WHEN slot = ?2 - 1 THEN count ELSE 0 END) * ?3
+                     + (CASE WHEN slot = ?2 THEN count + 1 ELSE 1 END) > ?4 THEN ?5
+                ELSE muted_until END,
+            prev_count = CASE
+                WHEN muted_until > ?1 THEN prev_count
+                WHEN slot = ?2 THEN prev_count WHEN slot = ?2 - 1 THEN count ELSE 0 END,
+            count = CASE WHEN muted_until > ?1 THEN count WHEN slot = ?2 THEN count + 1 ELSE 1 END,
+            slot = CASE WHEN muted_until > ?1 THEN slot ELSE ?2 END
+        RETURNING user_id, muted_until
+    """
+
+    def __init__(self, path=RATE_LIMIT_SQLITE_PATH, **limits):
+        super().__init__(**limits)
+        self.path = path
+        self._conn = None
+
+    async def _connect(self):
+        import aiosqlite
+        self._conn = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        await self._conn.execute("PRAGMA synchronous=NORMAL")
+        await self._conn.execute("PRAGMA busy_timeout=5000")
+        await self._conn.execute("""CREATE TABLE IF NOT EXISTS rate_limits (
+            user_id INTEGER PRIMARY KEY,
+            slot INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            prev_count INTEGER NOT NULL,
+            muted_until REAL NOT NULL)""")
+
+    async def _check_batch(self, user_ids, now):
+        if self._conn is None:
+            await self._connect()
+        slot, weight = self._window_position(now)
+        mute_until = now + self.mute
+        values = ", ".join(f"(?{i}, ?2, 1, 0, 0)" for i in range(6, 6 + len(user_ids)))
+        async with self._conn.execute(self.UPSERT.format(values=values), (now, slot, weight, self.limit, mute_until, *user_ids)) as cursor:
+            rows = await cursor.fetchall()
+
+        muted = dict(rows)
+        return [self._verdict(muted[user_id], mute_until, now) for user_id in user_ids]
+
+    async def sweep(self):
+        """Delete rows that no longer affect any check. Returns how many."""
+        if self._conn is None:
+            return 0
+        now = self._clock()
+        slot, _ = self._window_position(now)
+        async with self._conn.execute("DELETE FROM rate_limits WHERE slot < ? AND muted_until <= ?", (slot - 1, now)) as cursor:
+            return cursor.rowcount
+
+    async def close(self):
+        await self._wait_for_tasks()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class RedisBackend(_BatchingBackend):
+    """
+    State in Redis: a counter per user and window (expiring after two windows)
+    and a mute key with a TTL. A batch is one pipeline of INCR, PEXPIRE, GET of
+    the previous window and PTTL of the mute key per message. A mute is written
+    when a message trips the limit; this process remembers it until the write
+    lands, so the next message does not wait on it.
+    """
+
+    def __init__(self, url=REDIS_URL, prefix='ratelimit', **limits):
+        super().__init__(**limits)
+        from resp import RedisConnection
+        self._redis = RedisConnection(url)
+        self.prefix = prefix
+        self._local_mutes = {}  # user_id -> muted_until, for mutes not yet stored
+
+    def _mute_key(self, user_id):
+        return f"{self.prefix}:mute:{user_id}"
+
+    async def _check_batch(self, user_ids, now):
+        slot, weight = self._window_position(now)
+        window_ms = int(self.window * 2000)
+        commands = []
+        for user_id in user_ids:
+            current, previous = f"{self.prefix}:{user_id}:{slot}", f"{self.prefix}:{user_id}:{slot - 1}"
+            commands += [('INCR', current), ('PEXPIRE', current, window_ms), ('GET', previous), ('PTTL', self._mute_key(user_id))]
+        replies = await self._redis.pipeline(commands)
+
+        results = []
+        new_mutes = []
+        for i, user_id in enumerate(user_ids):
+            count, _, previous, mute_ttl = replies[4 * i:4 * i + 4]
+            muted_until = self._local_mutes.get(user_id, 0)
+            if isinstance(mute_ttl, int) and mute_ttl > 0:
+                muted_until = max(muted_until, now + mute_ttl / 1000)
+            if muted_until > now:
+                results.append(_muted_message(muted_until - now))
+            elif int(previous or 0) * weight + count > self.limit:
+                self._local_mutes[user_id] = now + self.mute
+                new_mutes.append(user_id)
+                results.append(_too_fast_message(self.mute))
+            else:
+                self._local_mutes.pop(user_id, None)
+                results.append((True, None))
+
+        if new_mutes:
+            self._start(self._store_mutes(new_mutes))
+        return results
+
+    async def _store_mutes(self, user_ids):
+        commands = [('SET', self._mute_key(user_id), 1, 'PX', int(self.mute * 1000)) for user_id in user_ids]
+        try:
+            await self._redis.pipeline(commands)
+            for user_id in user_ids:
+                self._local_mutes.pop(user_id, None)
+        except Exception as e:
+            logger.error(f"Failed to store {len(user_ids)} mutes in Redis: {e}")
+
+    async def sweep(self):
+        # Forget remembered mutes that have run out (their Redis keys expire on their own)
+        now = self._clock()
+        expired = [user_id for user_id, until in self._local_mutes.items() if until <= now]
+        for user_id in expired:
+            del self._local_mutes[user_id]
+        return len(expired)
+
+    async def close(self):
+        # Let pending checks and mute writes land first
+        await self._wait_for_tasks()
+        await self._redis.close()
+
+
+def _create_backend(name):
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'redis':
+        return RedisBackend()
+    if name != 'memory':
+        logger.warning(f"Unknown RATE_LIMIT_BACKEND {name!r}, using memory")
+    return MemoryBackend()
+
+
+_backend = _create_backend(RATE_LIMIT_BACKEND)
+
+
+async def check_rate_limit(user_id):
     """
     Check if user is rate limited.
     Returns (is_allowed, error_message)
     """
-    now = time.time()
-    
-    # Check if currently muted
-    if user_id in muted_users:
-        if now < muted_users[user_id]:
-            remaining = int(muted_users[user_id] - now)
-            return False, f"⚠️ You are muted for {remaining}s due to spam."
-        else:
-            del muted_users[user_id]
-    
-    # Clean old timestamps
-    user_timestamps[user_id] = [t for t in user_timestamps[user_id] if now - t < RATE_LIMIT_WINDOW]
-    
-    # Add current timestamp
-    user_timestamps[user_id].append(now)
-    
-    # Check limit
-    if len(user_timestamps[user_id]) > RATE_LIMIT_MSG:
-        muted_users[user_id] = now + MUTE_DURATION
-        return False, f"🚫 You are sending messages too fast! Muted for {MUTE_DURATION}s."
-    
-    return True, None
+    return await _backend.check(user_id)
+
+
+async def sweep_rate_limits():
+    """Drop rate-limit state that no longer matters. Returns how many entries went."""
+    return await _backend.sweep()
+
+
+async def close_rate_limits():
+    await _backend.close()
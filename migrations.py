@@ -0,0 +1,85 @@
+"""
+Versioned schema migrations.
+
+Migrations are SQL scripts named <version>_<name>.sql and are applied in
+version order, once, at startup. SQLite scripts live in sqlite/migrations/ and
+Supabase scripts in supabase/migrations/. Both directories share one version
+sequence: a schema change that touches both backends uses the same version in
+each, and a backend that needs nothing for a version simply has no file for it.
+Applied versions are recorded in the schema_version table.
+
+The bot applies SQLite migrations itself. Supabase migrations are applied with
+the Supabase CLI (or the SQL editor); the bot only checks that it is current.
+"""
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SQLITE_MIGRATIONS_DIR = os.path.join(ROOT, 'sqlite', 'migrations')
+SUPABASE_MIGRATIONS_DIR = os.path.join(ROOT, 'supabase', 'migrations')
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def list_migrations(directory):
+    """(version, name, path) for every migration script in directory, oldest first."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def latest_version(directory):
+    migrations = list_migrations(directory)
+    return migrations[-1][0] if migrations else None
+
+
+def split_statements(script):
+    """Split a SQLite script into complete statements."""
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ''
+    return statements
+
+
+async def migrate_sqlite(conn):
+    """
+    Apply pending SQLite migrations on an aiosqlite connection in autocommit mode.
+    Each migration runs in its own transaction together with its schema_version row.
+    """
+    await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at INTEGER NOT NULL)")
+    async with conn.execute("SELECT version FROM schema_version") as cursor:
+        applied = {row[0] for row in await cursor.fetchall()}
+
+    for version, name, path in list_migrations(SQLITE_MIGRATIONS_DIR):
+        if version in applied:
+            continue
+        with open(path, encoding='utf-8') as f:
+            statements = split_statements(f.read())
+
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                try:
+                    await conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # ADD COLUMN on a database that already has the column
+                    if 'duplicate column name' not in str(e):
+                        raise
+            await conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)", (version, name, int(time.time())))
+        except BaseException:
+            await conn.execute("ROLLBACK")
+            raise
+        await conn.execute("COMMIT")
+        logger.info(f"Applied SQLite migration {version}_{name}")
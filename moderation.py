@@ -0,0 +1,168 @@
+"""
+Bad-word filter for relayed messages and captions.
+
+The word list is compiled into an Aho-Corasick automaton, so a message is
+scanned once no matter how many words are listed. Both the words and the
+messages go through normalize() first, which undoes the usual evasions:
+lookalike letters from other scripts, fullwidth and styled Unicode, accents,
+leetspeak and spaced-out words ("s p a m"). Stretched letters ("spaaam") are
+left to the automaton, which stays put on a repeat of the letter it just
+matched; squeezing them out of the words instead would turn "ass" into "as".
+
+The list comes from BAD_WORDS_FILE (one word or phrase per line, # for
+comments) when that file exists, otherwise from config.BAD_WORDS.
+reload_if_changed() picks up edits to the file without a restart.
+"""
+import logging
+import os
+import re
+import unicodedata
+from collections import deque
+
+from config import BAD_WORDS, BAD_WORDS_FILE
+
+logger = logging.getLogger(__name__)
+
+# Letters from other scripts that look like Latin ones, and leetspeak
+_CONFUSABLES = str.maketrans({
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'з': 'e', 'і': 'i', 'ї': 'i', 'ј': 'j', 'к': 'k', 'м': 'm',
+    'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w',
+    # Greek
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't',
+    'υ': 'u', 'χ': 'x', 'ω': 'w',
+    # Leetspeak
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '@': 'a', '$': 's', '|': 'l',
+})
+
+_NON_WORD = re.compile(r'\W+')
+_ACCENTS = re.compile('[\u0300-\u036f]+')
+
+
+def _separator(match):
+    # Keep combining marks (vowel signs of Sinhala and other scripts), blank out the rest
+    chars = match.group()
+    if all(unicodedata.category(ch).startswith('M') for ch in chars):
+        return chars
+    return ' '
+
+
+def normalize(text):
+    """Reduce text to the canonical form both the word list and messages are matched in."""
+    if text.isascii():
+        # Nothing to fold or strip beyond case and punctuation
+        text = _NON_WORD.sub(' ', text.lower().translate(_CONFUSABLES))
+    else:
+        text = unicodedata.normalize('NFKC', text).casefold()
+        # Strip accents from Latin letters
+        text = _ACCENTS.sub('', unicodedata.normalize('NFKD', text))
+        text = _NON_WORD.sub(_separator, text.translate(_CONFUSABLES))
+    text = text.replace('_', ' ')
+
+    # Join runs of single characters: "s p a m" -> "spam"
+    words = []
+    for word in text.split():
+        if len(word) == 1 and words and words[-1][1]:
+            words[-1][0] += word
+        else:
+            words.append([word, len(word) == 1])
+    return ' '.join(word for word, _ in words)
+
+
+class WordFilter:
+    """Aho-Corasick automaton over a list of normalized words."""
+
+    def __init__(self, words):
+        self._goto = [{}]  # state -> {char: next state}
+        self._fail = [0]
+        self._match = [None]  # state -> word ending here (or at a suffix state)
+        self._last = [None]  # state -> the character leading into it
+        self.words = sorted({normalized for normalized in map(normalize, words) if normalized})
+
+        for word in self.words:
+            state = 0
+            for ch in word:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(None)
+                    self._last.append(ch)
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._match[state] = word
+
+        # Breadth-first, so every state's fail link is final before its children's;
+        # states one character deep fail to the root
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                if self._match[child] is None:
+                    self._match[child] = self._match[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self):
+        return len(self.words)
+
+    def find(self, text):
+        """The first listed word (in normalized form) found in text, or None."""
+        goto, fail, match, last = self._goto, self._fail, self._match, self._last
+        state = 0
+        for ch in normalize(text):
+            if ch == last[state] and ch not in goto[state]:
+                # A stretched letter ("spaaam"): still the same letter of the word
+                continue
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if match[state] is not None:
+                return match[state]
+        return None
+
+
+def load_words(path):
+    """Read a word list: one word or phrase per line, blank lines and # comments ignored."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+_filter = WordFilter(BAD_WORDS)
+_loaded_mtime = None
+
+
+def reload_if_changed(path=BAD_WORDS_FILE):
+    """Recompile the filter if the word list file changed since the last load. Returns True if it did."""
+    global _filter, _loaded_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        if _loaded_mtime is None:
+            return False
+        # File removed: fall back to the built-in list
+        mtime, words = None, BAD_WORDS
+    else:
+        if mtime == _loaded_mtime:
+            return False
+        try:
+            words = load_words(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Failed to load bad words from {path}: {e}")
+            return False
+    _filter = WordFilter(words)
+    _loaded_mtime = mtime
+    logger.info(f"Loaded {len(_filter)} bad words from {path if mtime else 'config'}")
+    return True
+
+
+def find_bad_word(text):
+    """The first bad word found in text (or a caption), or None."""
+    return _filter.find(text) if text else None
+
+
+reload_if_changed()
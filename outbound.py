@@ -0,0 +1,169 @@
+"""
+Scheduling of outbound Bot API calls.
+
+SendScheduler is installed as the bot's rate limiter, so every call made
+through context.bot (and the shortcuts on messages and callback queries) goes
+through it. Calls that put something in a chat (sending, copying, editing,
+pinning) are paced to Telegram's limits: SEND_RATE per second across all
+chats, and SEND_CHAT_RATE per second in any one chat after a burst of
+SEND_CHAT_BURST. When the global limit is the bottleneck, waiting calls are
+served by priority: relays in live chats first, then pins, then broadcasts.
+Flood control (RetryAfter) holds back every sender for the time Telegram
+asks; it and network errors are retried with backoff, up to SEND_MAX_RETRIES
+times. A network error after the request may have reached Telegram (a read
+timeout, a dropped connection) is only retried for edits and pins, which are
+safe to repeat: sending a message again could deliver it twice. Everything else (answering callback queries, getUpdates, ...) passes
+straight through.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+import httpx
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import SEND_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priorities, most urgent first. Pass one as rate_limit_args to override the default.
+PRIORITY_RELAY = 0
+PRIORITY_PIN = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_RELAY: 'relay', PRIORITY_PIN: 'pin', PRIORITY_BULK: 'bulk'}
+
+# Endpoints whose default priority is not PRIORITY_RELAY
+_ENDPOINT_PRIORITY = {'pinChatMessage': PRIORITY_PIN}
+
+# Seconds before the first retry after a network error, doubled for each next one
+RETRY_BACKOFF = 0.5
+
+# Chats whose per-chat pacing is remembered; the least recently used are dropped
+MAX_TRACKED_CHATS = 10000
+
+
+def _is_paced(endpoint):
+    """True for the calls that count against Telegram's message limits."""
+    return endpoint.startswith(('send', 'copy', 'forward')) or endpoint in ('pinChatMessage', 'editMessageText')
+
+
+def _is_idempotent(endpoint):
+    """True for the paced calls that change nothing when made twice."""
+    return endpoint.startswith(('edit', 'pin'))
+
+
+def _was_not_sent(error):
+    """True if the request never left (no free pooled connection, or no connection to Telegram at all)."""
+    return isinstance(error.__cause__, (httpx.PoolTimeout, httpx.ConnectError, httpx.ConnectTimeout))
+
+
+class SendScheduler(BaseRateLimiter):
+    def __init__(self, rate=SEND_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST, max_retries=SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate)
+        self._chats = OrderedDict()  # chat_id -> TokenBucket, least recently used first
+        self._waiting = []  # heap of (priority, arrival, future) waiting for the global limit
+        self._arrivals = itertools.count()
+        self._dispatcher = None
+        self._waiting_for_chat = 0
+        self._counters = {'sent': 0, 'retried': 0, 'flood_waits': 0, 'failed': 0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def stats(self):
+        """Calls waiting for the global limit per priority, for a chat's limit, and running totals."""
+        waiting = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for priority, _, future in self._waiting:
+            if not future.done():
+                waiting[PRIORITY_NAMES.get(priority, 'relay')] += 1
+        return {'waiting': waiting, 'waiting_for_chat': self._waiting_for_chat, **self._counters}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > MAX_TRACKED_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _wait_for_chat(self, chat_id):
+        bucket = self._chat_bucket(chat_id)
+        if bucket.try_acquire():
+            return
+        self._waiting_for_chat += 1
+        try:
+            await bucket.acquire()
+        finally:
+            self._waiting_for_chat -= 1
+
+    async def _wait_for_global(self, priority):
+        if not self._waiting and self._global.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._arrivals), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        # Hand out global tokens to the waiting calls, most urgent (then oldest) first
+        while self._waiting:
+            if self._waiting[0][2].done():
+                # Its caller was cancelled
+                heapq.heappop(self._waiting)
+            elif self._global.try_acquire():
+                heapq.heappop(self._waiting)[2].set_result(None)
+            else:
+                await asyncio.sleep(self._global.delay())
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or not _is_paced(endpoint):
+            return await callback(*args, **kwargs)
+
+        priority = rate_limit_args if rate_limit_args is not None else _ENDPOINT_PRIORITY.get(endpoint, PRIORITY_RELAY)
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self._wait_for_global(priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so hold back every sender
+                self._counters['flood_waits'] += 1
+                self._global.pause(e.retry_after)
+                error, backoff = e, 0
+            except BadRequest:
+                # The request itself is wrong; sending it again will not help
+                self._counters['failed'] += 1
+                raise
+            except NetworkError as e:
+                if not (_was_not_sent(e) or _is_idempotent(endpoint)):
+                    # Telegram may have delivered it before the connection failed
+                    self._counters['failed'] += 1
+                    raise
+                error, backoff = e, RETRY_BACKOFF * 2 ** attempt
+            except Exception:
+                # Forbidden and the like: the chat cannot be reached
+                self._counters['failed'] += 1
+                raise
+            else:
+                self._counters['sent'] += 1
+                return result
+            if attempt < self.max_retries:
+                self._counters['retried'] += 1
+                logger.warning(f"{endpoint} to {chat_id} failed, retrying: {error}")
+                await asyncio.sleep(backoff)
+        self._counters['failed'] += 1
+        raise error
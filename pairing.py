@@ -0,0 +1,79 @@
+"""
+Telling two freshly matched users that they are connected.
+
+Both sides are independent, so they run concurrently: the user's "connected"
+message is shown while the partner's is sent, and each is pinned as soon as it
+exists. Removing the user's old "searching" message runs alongside both. Both
+users see the chat after one round trip instead of five.
+"""
+import asyncio
+import logging
+import time
+import database as db
+from delivery import record_failure
+from keyboards import get_chat_keyboard
+from locales import get_text
+from metrics import PAIRING_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+async def _timed(timings, step, awaitable):
+    """Await awaitable and record how long it took under step, in seconds."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[step] = time.perf_counter() - started
+
+
+async def connect_pair(bot, user_id, partner_id, lang, interest, show, searching_msg_id=None):
+    """
+    Announce and pin the new chat on both sides. `show(text, reply_markup=...)`
+    puts the user's message on screen (editing the pressed button's message or
+    replying to a command) and returns it; errors from it are raised, those on
+    the partner's side are logged. The time each step took, in seconds, goes to
+slomegle_pairing_seconds and is returned.
+    """
+    timings = {}
+    started = time.perf_counter()
+    partner_lang = await _timed(timings, 'partner_lang', db.get_language(partner_id))
+
+    msg = get_text(lang, 'connected')
+    partner_msg = get_text(partner_lang, 'connected')
+    if interest:
+        msg += get_text(lang, 'matched_interest', interest)
+        partner_msg += get_text(partner_lang, 'matched_interest', interest)
+
+    async def user_side():
+        sent = await _timed(timings, 'show_user', show(msg, reply_markup=get_chat_keyboard(lang)))
+        try:
+            await _timed(timings, 'pin_user', bot.pin_chat_message(chat_id=user_id, message_id=sent.message_id))
+        except Exception:
+            pass
+
+    async def partner_side():
+        try:
+            sent = await _timed(timings, 'send_partner', bot.send_message(partner_id, partner_msg, reply_markup=get_chat_keyboard(partner_lang), parse_mode='Markdown'))
+            await _timed(timings, 'pin_partner', bot.pin_chat_message(chat_id=partner_id, message_id=sent.message_id))
+        except Exception as e:
+            logger.error(f"Failed to send message to partner {partner_id}: {e}")
+            await record_failure(partner_id, e)
+
+    async def cleanup():
+        try:
+            await _timed(timings, 'delete_searching', bot.delete_message(chat_id=user_id, message_id=searching_msg_id))
+        except Exception:
+            pass
+
+    steps = [user_side(), partner_side()]
+    if searching_msg_id:
+        steps.append(cleanup())
+    user_result = (await asyncio.gather(*steps, return_exceptions=True))[0]
+    timings['total'] = time.perf_counter() - started
+    for step, seconds in timings.items():
+        PAIRING_SECONDS.observe(PAIRING_SECONDS.labels(step), seconds)
+    logger.debug(f"Connected {user_id} and {partner_id}: " + ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+    if isinstance(user_result, BaseException):
+        raise user_result
+    return timings
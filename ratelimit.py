@@ -0,0 +1,57 @@
+"""
+Token bucket for pacing outbound Bot API calls.
+
+Tokens refill continuously at `rate` per second up to `capacity`; acquire()
+takes one, sleeping until it is available. pause() empties the bucket and
+holds every caller back, which is how a Telegram RetryAfter is honoured by all
+senders sharing the bucket rather than just the one that hit it.
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', '_tokens', '_updated', '_paused_until', '_clock')
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available right now. Returns False otherwise."""
+        now = self._clock()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Seconds until the next token is available."""
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    async def acquire(self):
+        """Wait for a token and take it."""
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds`, e.g. after a RetryAfter."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        # No tokens accumulate during the pause
+        self._tokens = 0
+        self._updated = self._paused_until
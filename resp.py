@@ -0,0 +1,115 @@
+"""
+Minimal asyncio client for the Redis protocol (RESP2).
+
+Only what the bot needs: one connection, commands sent as pipelines (every
+command of a batch written at once, replies read back in order), so a batch
+costs a single round trip. Works against Redis or anything that speaks its
+protocol (Valkey, KeyDB, Dragonfly, a local stand-in in tests).
+"""
+import asyncio
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    """An error reply from the server."""
+
+
+def _encode(command):
+    parts = [b'*%d\r\n' % len(command)]
+    for arg in command:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+class RedisConnection:
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        for reply in await self._roundtrip(setup):
+            if isinstance(reply, RedisError):
+                raise reply
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+    async def _roundtrip(self, commands):
+        if not commands:
+            return []
+        self._writer.write(b''.join(_encode(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def pipeline(self, commands):
+        """
+        Send commands in one write and return their replies in order. Error
+        replies are returned as RedisError instances, not raised.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is None:
+                await self._connect()
+            try:
+                return await self._roundtrip(commands)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                # The stream is out of step now; reconnect on the next call
+                await self._close_stream()
+                raise
+
+    async def execute(self, *command):
+        reply = (await self.pipeline([command]))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def _close_stream(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def close(self):
+        await self._close_stream()
+        self._lock = None
@@ -0,0 +1,12 @@
+-- Initial schema (SQLite counterpart of supabase/migrations/20251121212121_init.sql)
+CREATE TABLE IF NOT EXISTS waiting_queue (user_id INTEGER PRIMARY KEY, interest TEXT);
+CREATE TABLE IF NOT EXISTS active_chats (user_id INTEGER PRIMARY KEY, partner_id INTEGER);
+CREATE TABLE IF NOT EXISTS user_settings (user_id INTEGER PRIMARY KEY, interest TEXT, language TEXT DEFAULT 'en');
+CREATE TABLE IF NOT EXISTS blocked_users (user_id INTEGER, blocked_user_id INTEGER, PRIMARY KEY (user_id, blocked_user_id));
+CREATE TABLE IF NOT EXISTS reports (id INTEGER PRIMARY KEY AUTOINCREMENT, reporter_id INTEGER, reported_id INTEGER, reason TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS message_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id INTEGER, sender_msg_id INTEGER, receiver_id INTEGER, receiver_msg_id INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+
+-- Databases created by early versions of the bot lack these columns
+-- (the runner skips ADD COLUMN for columns that already exist)
+ALTER TABLE user_settings ADD COLUMN language TEXT DEFAULT 'en';
+ALTER TABLE waiting_queue ADD COLUMN interest TEXT;
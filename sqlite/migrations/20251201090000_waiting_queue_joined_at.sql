@@ -0,0 +1,2 @@
+-- Arrival time, so the in-memory queue can be rebuilt first-come, first-served
+ALTER TABLE waiting_queue ADD COLUMN joined_at REAL;
@@ -0,0 +1,28 @@
+-- Rebuild message_logs keyed on the sender's side and indexed on the receiver's
+-- side, so every lookup is an index search. WITHOUT ROWID stores rows inside the
+-- primary key b-tree and the receiver index covers sender_msg_id.
+-- timestamp becomes Unix seconds.
+ALTER TABLE message_logs RENAME TO message_logs_legacy;
+DROP INDEX IF EXISTS idx_message_logs_receiver;
+DROP INDEX IF EXISTS idx_message_logs_timestamp;
+
+CREATE TABLE message_logs (
+    sender_id INTEGER NOT NULL,
+    sender_msg_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    receiver_msg_id INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+    PRIMARY KEY (sender_id, sender_msg_id)
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id, timestamp)
+SELECT sender_id, sender_msg_id, receiver_id, receiver_msg_id,
+       CASE WHEN typeof(timestamp) = 'integer' THEN timestamp
+            ELSE COALESCE(CAST(strftime('%s', timestamp) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)) END
+FROM message_logs_legacy
+WHERE sender_id IS NOT NULL AND sender_msg_id IS NOT NULL AND receiver_id IS NOT NULL AND receiver_msg_id IS NOT NULL;
+
+DROP TABLE message_logs_legacy;
+
+CREATE INDEX idx_message_logs_receiver ON message_logs (receiver_id, receiver_msg_id);
+CREATE INDEX idx_message_logs_timestamp ON message_logs (timestamp);
@@ -0,0 +1,7 @@
+-- Cumulative totals shown by /stats, bumped in the same transaction as the
+-- writes they count
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO stats_counters (name) VALUES ('matches_made'), ('messages_relayed');
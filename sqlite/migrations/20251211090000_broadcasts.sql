@@ -0,0 +1,16 @@
+-- Admin broadcasts. cursor is the last user_id a batch was delivered to, so an
+-- interrupted run resumes where it stopped.
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_chat_id INTEGER NOT NULL,
+    status_message_id INTEGER,
+    from_chat_id INTEGER,
+    message_id INTEGER,
+    text TEXT,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status);
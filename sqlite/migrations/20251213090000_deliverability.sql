@@ -0,0 +1,4 @@
+-- When the bot was last refused by Telegram for this user (blocked the bot,
+-- deleted account); NULL while they are reachable
+ALTER TABLE user_settings ADD COLUMN unreachable_since REAL;
+CREATE INDEX IF NOT EXISTS idx_user_settings_unreachable ON user_settings (user_id) WHERE unreachable_since IS NOT NULL;
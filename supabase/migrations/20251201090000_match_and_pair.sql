@@ -0,0 +1,39 @@
+-- Order the queue so matching is first-come, first-served
+ALTER TABLE waiting_queue ADD COLUMN IF NOT EXISTS joined_at TIMESTAMPTZ DEFAULT NOW();
+
+-- Atomically pick the oldest eligible waiting user for p_user_id, dequeue both
+-- users and create the chat. Called by the bot through RPC; returns the
+-- partner id, or NULL if nobody suitable is waiting.
+CREATE OR REPLACE FUNCTION match_and_pair(p_user_id BIGINT, p_interest TEXT DEFAULT NULL)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_partner_id BIGINT;
+BEGIN
+    DELETE FROM waiting_queue
+    WHERE user_id = (
+        SELECT q.user_id FROM waiting_queue q
+        WHERE q.user_id <> p_user_id
+          AND (p_interest IS NULL OR q.interest = p_interest)
+          AND NOT EXISTS (
+              SELECT 1 FROM blocked_users b
+              WHERE (b.user_id = p_user_id AND b.blocked_user_id = q.user_id)
+                 OR (b.user_id = q.user_id AND b.blocked_user_id = p_user_id))
+        ORDER BY q.joined_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED)
+    RETURNING user_id INTO v_partner_id;
+
+    IF v_partner_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    DELETE FROM waiting_queue WHERE user_id = p_user_id;
+    INSERT INTO active_chats (user_id, partner_id)
+    VALUES (p_user_id, v_partner_id), (v_partner_id, p_user_id)
+    ON CONFLICT (user_id) DO UPDATE SET partner_id = EXCLUDED.partner_id;
+
+    RETURN v_partner_id;
+END;
+$$;
@@ -0,0 +1,13 @@
+-- Dequeue both users and create the chat in one transaction. The bot picks the
+-- partner from its in-memory queue and calls this through RPC.
+CREATE OR REPLACE FUNCTION pair_users(p_user_id BIGINT, p_partner_id BIGINT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM waiting_queue WHERE user_id IN (p_user_id, p_partner_id);
+    INSERT INTO active_chats (user_id, partner_id)
+    VALUES (p_user_id, p_partner_id), (p_partner_id, p_user_id)
+    ON CONFLICT (user_id) DO UPDATE SET partner_id = EXCLUDED.partner_id;
+END;
+$$;
@@ -0,0 +1,5 @@
+-- Index the message id mappings looked up by replies, edits and /delete,
+-- and the timestamp used by the retention job
+CREATE INDEX IF NOT EXISTS idx_message_logs_sender ON message_logs (sender_id, sender_msg_id) INCLUDE (receiver_msg_id);
+CREATE INDEX IF NOT EXISTS idx_message_logs_receiver ON message_logs (receiver_id, receiver_msg_id) INCLUDE (sender_msg_id);
+CREATE INDEX IF NOT EXISTS idx_message_logs_timestamp ON message_logs (timestamp);
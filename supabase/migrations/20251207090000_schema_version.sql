@@ -0,0 +1,16 @@
+-- Record applied migrations so the bot can check the schema on startup.
+-- Every later migration inserts its own version here as well.
+CREATE TABLE IF NOT EXISTS schema_version (
+    version BIGINT PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE schema_version ENABLE ROW LEVEL SECURITY;
+
+INSERT INTO schema_version (version, name) VALUES
+    (20251121212121, 'init'),
+    (20251201090000, 'match_and_pair'),
+    (20251203090000, 'pair_users'),
+    (20251205090000, 'message_logs_indexes'),
+    (20251207090000, 'schema_version')
+ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,41 @@
+-- Cumulative totals shown by /stats, bumped by the same functions that do the
+-- writes they count
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+ALTER TABLE stats_counters ENABLE ROW LEVEL SECURITY;
+INSERT INTO stats_counters (name) VALUES ('matches_made'), ('messages_relayed')
+ON CONFLICT (name) DO NOTHING;
+
+-- Dequeue both users and create the chat in one transaction. The bot picks the
+-- partner from its in-memory queue and calls this through RPC.
+CREATE OR REPLACE FUNCTION pair_users(p_user_id BIGINT, p_partner_id BIGINT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM waiting_queue WHERE user_id IN (p_user_id, p_partner_id);
+    INSERT INTO active_chats (user_id, partner_id)
+    VALUES (p_user_id, p_partner_id), (p_partner_id, p_user_id)
+    ON CONFLICT (user_id) DO UPDATE SET partner_id = EXCLUDED.partner_id;
+    UPDATE stats_counters SET value = value + 1 WHERE name = 'matches_made';
+END;
+$$;
+
+-- Write a batch of message id mappings and count them in one round trip.
+-- p_rows is a JSON array of {sender_id, sender_msg_id, receiver_id, receiver_msg_id}.
+CREATE OR REPLACE FUNCTION log_messages(p_rows JSONB)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id)
+    SELECT sender_id, sender_msg_id, receiver_id, receiver_msg_id
+    FROM jsonb_to_recordset(p_rows) AS r(sender_id BIGINT, sender_msg_id BIGINT, receiver_id BIGINT, receiver_msg_id BIGINT);
+    UPDATE stats_counters SET value = value + jsonb_array_length(p_rows) WHERE name = 'messages_relayed';
+END;
+$$;
+
+INSERT INTO schema_version (version, name) VALUES (20251209090000, 'stats_counters')
+ON CONFLICT (version) DO NOTHING;
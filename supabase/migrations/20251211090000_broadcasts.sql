@@ -0,0 +1,20 @@
+-- Admin broadcasts. cursor is the last user_id a batch was delivered to, so an
+-- interrupted run resumes where it stopped.
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    admin_chat_id BIGINT NOT NULL,
+    status_message_id BIGINT,
+    from_chat_id BIGINT,
+    message_id BIGINT,
+    text TEXT,
+    cursor BIGINT NOT NULL DEFAULT 0,
+    sent BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE broadcasts ENABLE ROW LEVEL SECURITY;
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status);
+
+INSERT INTO schema_version (version, name) VALUES (20251211090000, 'broadcasts')
+ON CONFLICT (version) DO NOTHING;
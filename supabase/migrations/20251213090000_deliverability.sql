@@ -0,0 +1,7 @@
+-- When the bot was last refused by Telegram for this user (blocked the bot,
+-- deleted account); NULL while they are reachable
+ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS unreachable_since TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_user_settings_unreachable ON user_settings (user_id) WHERE unreachable_since IS NOT NULL;
+
+INSERT INTO schema_version (version, name) VALUES (20251213090000, 'deliverability')
+ON CONFLICT (version) DO NOTHING;
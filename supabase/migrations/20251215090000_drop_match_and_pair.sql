@@ -0,0 +1,6 @@
+-- Matching runs in the bot's memory and pairs through pair_users, so the
+-- match_and_pair function is no longer called
+DROP FUNCTION IF EXISTS match_and_pair(BIGINT, TEXT);
+
+INSERT INTO schema_version (version, name) VALUES (20251215090000, 'drop_match_and_pair')
+ON CONFLICT (version) DO NOTHING;
@@ -2,13 +2,16 @@
 CREATE TABLE IF NOT EXISTS user_settings (
     user_id BIGINT PRIMARY KEY,
     interest TEXT,
-    language TEXT DEFAULT 'en'
+    language TEXT DEFAULT 'en',
+    unreachable_since TIMESTAMPTZ  -- set while Telegram refuses messages to this user
 );
+CREATE INDEX IF NOT EXISTS idx_user_settings_unreachable ON user_settings (user_id) WHERE unreachable_since IS NOT NULL;
 
 -- 2. Waiting Queue
 CREATE TABLE IF NOT EXISTS waiting_queue (
     user_id BIGINT PRIMARY KEY,
-    interest TEXT
+    interest TEXT,
+    joined_at TIMESTAMPTZ DEFAULT NOW()
 );
 
 -- 3. Active Chats
@@ -33,7 +36,7 @@ CREATE TABLE IF NOT EXISTS reports (
     timestamp TIMESTAMPTZ DEFAULT NOW()
 );
 
--- 6. Message Logs (Optional, for debugging)
+-- 6. Message Logs (maps relayed messages for replies, edits and /delete)
 CREATE TABLE IF NOT EXISTS message_logs (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
     sender_id BIGINT,
@@ -42,6 +45,9 @@ CREATE TABLE IF NOT EXISTS message_logs (
     receiver_msg_id BIGINT,
     timestamp TIMESTAMPTZ DEFAULT NOW()
 );
+CREATE INDEX IF NOT EXISTS idx_message_logs_sender ON message_logs (sender_id, sender_msg_id) INCLUDE (receiver_msg_id);
+CREATE INDEX IF NOT EXISTS idx_message_logs_receiver ON message_logs (receiver_id, receiver_msg_id) INCLUDE (sender_msg_id);
+CREATE INDEX IF NOT EXISTS idx_message_logs_timestamp ON message_logs (timestamp);
 
 -- 7. Enable Row Level Security (Optional but recommended)
 ALTER TABLE user_settings ENABLE ROW LEVEL SECURITY;
@@ -54,3 +60,79 @@ ALTER TABLE message_logs ENABLE ROW LEVEL SECURITY;
 -- 8. Create Policies (Allow full access for service_role/bot)
 -- Note: The bot uses the 'service_role' key which bypasses RLS, so these are strictly for if you use the 'anon' key.
 -- For simplicity, we are assuming service_role usage.
+
+-- 9. Matchmaking
+-- Dequeue both users and create the chat in one transaction. The bot picks the
+-- partner from its in-memory queue and calls this through RPC.
+CREATE OR REPLACE FUNCTION pair_users(p_user_id BIGINT, p_partner_id BIGINT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM waiting_queue WHERE user_id IN (p_user_id, p_partner_id);
+    INSERT INTO active_chats (user_id, partner_id)
+    VALUES (p_user_id, p_partner_id), (p_partner_id, p_user_id)
+    ON CONFLICT (user_id) DO UPDATE SET partner_id = EXCLUDED.partner_id;
+    UPDATE stats_counters SET value = value + 1 WHERE name = 'matches_made';
+END;
+$$;
+
+-- Write a batch of message id mappings and count them in one round trip.
+-- p_rows is a JSON array of {sender_id, sender_msg_id, receiver_id, receiver_msg_id}.
+CREATE OR REPLACE FUNCTION log_messages(p_rows JSONB)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id)
+    SELECT sender_id, sender_msg_id, receiver_id, receiver_msg_id
+    FROM jsonb_to_recordset(p_rows) AS r(sender_id BIGINT, sender_msg_id BIGINT, receiver_id BIGINT, receiver_msg_id BIGINT);
+    UPDATE stats_counters SET value = value + jsonb_array_length(p_rows) WHERE name = 'messages_relayed';
+END;
+$$;
+
+-- 10. Schema version (keep in step with supabase/migrations)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version BIGINT PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE schema_version ENABLE ROW LEVEL SECURITY;
+
+INSERT INTO schema_version (version, name) VALUES
+    (20251121212121, 'init'),
+    (20251201090000, 'match_and_pair'),
+    (20251203090000, 'pair_users'),
+    (20251205090000, 'message_logs_indexes'),
+    (20251207090000, 'schema_version'),
+    (20251209090000, 'stats_counters'),
+    (20251211090000, 'broadcasts'),
+    (20251213090000, 'deliverability'),
+    (20251215090000, 'drop_match_and_pair')
+ON CONFLICT (version) DO NOTHING;
+
+-- 11. Stats counters (cumulative totals shown by /stats, bumped by pair_users and log_messages)
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+ALTER TABLE stats_counters ENABLE ROW LEVEL SECURITY;
+INSERT INTO stats_counters (name) VALUES ('matches_made'), ('messages_relayed')
+ON CONFLICT (name) DO NOTHING;
+
+-- 12. Broadcasts (cursor is the last user_id delivered to, so a run can resume)
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    admin_chat_id BIGINT NOT NULL,
+    status_message_id BIGINT,
+    from_chat_id BIGINT,
+    message_id BIGINT,
+    text TEXT,
+    cursor BIGINT NOT NULL DEFAULT 0,
+    sent BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE broadcasts ENABLE ROW LEVEL SECURITY;
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status);
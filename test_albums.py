@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from albums import AlbumAggregator
+
+
+def collect(**options):
+    flushed = []
+
+    async def flush(items, data):
+        flushed.append((list(items), data, time.monotonic()))
+
+    return AlbumAggregator(flush, **options), flushed
+
+
+def test_album_is_flushed_after_a_quiet_period():
+    async def scenario():
+        albums, flushed = collect(quiet=0.05, deadline=1)
+        started = time.monotonic()
+        for item in range(3):
+            albums.add('a', item, data='partner')
+            await asyncio.sleep(0.01)
+        assert flushed == []
+        await asyncio.sleep(0.1)
+        assert [(items, data) for items, data, _ in flushed] == [([0, 1, 2], 'partner')]
+        assert flushed[0][2] - started < 0.5
+        assert len(albums) == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_album_is_flushed_at_once():
+    async def scenario():
+        albums, flushed = collect(quiet=1, deadline=5)
+        for item in range(10):
+            albums.add('a', item)
+        await asyncio.sleep(0)
+        assert [items for items, _, _ in flushed] == [list(range(10))]
+
+    asyncio.run(scenario())
+
+
+def test_deadline_caps_a_steady_trickle():
+    async def scenario():
+        albums, flushed = collect(quiet=0.05, deadline=0.15)
+        started = time.monotonic()
+        item = 0
+        while not flushed:
+            albums.add('a', item)
+            item += 1
+            await asyncio.sleep(0.02)
+        assert flushed[0][2] - started < 0.25
+        assert 1 < len(flushed[0][0]) < 10
+        await albums.close()
+
+    asyncio.run(scenario())
+
+
+def test_oldest_album_is_flushed_when_too_many_are_pending():
+    async def scenario():
+        albums, flushed = collect(quiet=1, deadline=5, max_albums=2)
+        albums.add('a', 1)
+        albums.add('b', 2)
+        albums.add('c', 3)
+        await asyncio.sleep(0)
+        assert [items for items, _, _ in flushed] == [[1]]
+        assert len(albums) == 2
+        await albums.close()
+        assert sorted(items for items, _, _ in flushed) == [[1], [2], [3]]
+
+    asyncio.run(scenario())
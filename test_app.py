@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import app as server
+import database as db
+import health
+
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"}, "text": "hi"}}
+
+
+def test_webhook_checks_the_secret_and_queues_updates(monkeypatch):
+    queue = asyncio.Queue()
+    monkeypatch.setattr(server, "bot_app", SimpleNamespace(bot=None, update_queue=queue))
+    monkeypatch.setattr(server, "MODE", "webhook")
+    client = TestClient(server.app)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": server.SECRET_TOKEN}
+
+    assert client.post(server.WEBHOOK_PATH, json=UPDATE).status_code == 403
+    assert client.post(server.WEBHOOK_PATH, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}).status_code == 403
+    assert client.post(server.WEBHOOK_PATH, content=b"not json", headers=headers).status_code == 400
+    assert queue.empty()
+
+    assert client.post(server.WEBHOOK_PATH, json=UPDATE, headers=headers).status_code == 200
+    assert queue.get_nowait().message.text == "hi"
+
+
+def test_webhook_is_unavailable_while_the_bot_is_not_running():
+    assert TestClient(server.app).post(server.WEBHOOK_PATH, json=UPDATE).status_code == 503
+
+
+def test_health_reports_backlog_and_database_latency(monkeypatch):
+    async def ping():
+        return 0.0042
+
+    queue = asyncio.Queue()
+    queue.put_nowait(object())
+    scheduler = SimpleNamespace(stats=lambda: {'waiting': {'relay': 2}})
+    processor = SimpleNamespace(stats=lambda: {'running': 1, 'waiting': 3})
+    application = SimpleNamespace(running=True, updater=SimpleNamespace(running=True), update_queue=queue,
+                                  update_processor=processor, bot=SimpleNamespace(rate_limiter=scheduler))
+    monkeypatch.setattr(server, "bot_app", application)
+    monkeypatch.setattr(db, "ping", ping)
+    monkeypatch.setattr(health, "_state", dict(health._state))
+    update = SimpleNamespace(update_id=7)
+    asyncio.run(health.record_received(update, None))
+    asyncio.run(health.record_received(update, None))
+    asyncio.run(health.record_processed(update, None))
+
+    response = TestClient(server.app).get("/health")
+    assert response.status_code == 200
+    report = response.json()
+    assert report["status"] == "healthy"
+    assert (report["last_update_id"], report["updates_in_progress"], report["updates_queued"]) == (7, 1, 1)
+    assert (report["updates_waiting"], report["updates_running"], report["updates_backlog"]) == (3, 1, 5)
+    assert report["db_latency_ms"] == 4.2
+    assert report["outbound"]["waiting"]["relay"] == 2
+
+    # Polling stopped: unhealthy
+    application.updater.running = False
+    assert TestClient(server.app).get("/health").status_code == 503
+
+
+def test_stop_bot_relays_albums_before_closing_the_bot(monkeypatch):
+    calls = []
+
+    def step(name):
+        async def record(*args):
+            calls.append(name)
+        return record
+
+    application = SimpleNamespace(
+        updater=SimpleNamespace(running=True, stop=step('updater.stop')),
+        stop=step('stop'), post_stop=step('post_stop'),
+        shutdown=step('shutdown'), post_shutdown=step('post_shutdown'),
+    )
+    monkeypatch.setattr(server, "bot_app", application)
+    asyncio.run(server.stop_bot())
+    assert calls == ['updater.stop', 'stop', 'post_stop', 'shutdown', 'post_shutdown']
+    assert server.bot_app is None
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+import broadcast
+import database as db
+from outbound import SendScheduler
+from ratelimit import TokenBucket
+
+pytestmark = pytest.mark.skipif(db.DB_TYPE != "sqlite", reason="SQLite backend only")
+
+
+class FakeBot:
+    """
+    Records deliveries; raises the queued error for a chat on its next send.
+    Sends go through a SendScheduler, like the real bot's.
+    """
+
+    def __init__(self, errors=None):
+        self.delivered = []
+        self.edits = []
+        self.attempts = []
+        self.errors = dict(errors or {})
+        self.scheduler = SendScheduler(rate=10000, chat_rate=10000, chat_burst=100)
+
+    async def send_message(self, chat_id, text, parse_mode=None, rate_limit_args=None):
+        async def send():
+            self.attempts.append(chat_id)
+            error = self.errors.pop(chat_id, None)
+            if error:
+                raise error
+            self.delivered.append(chat_id)
+
+        await self.scheduler.process_request(send, (), {}, 'sendMessage', {'chat_id': chat_id}, rate_limit_args)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, rate_limit_args=None):
+        await self.send_message(chat_id, None)
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append(text)
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(broadcast, "_bucket", TokenBucket(10000))
+    monkeypatch.setattr(broadcast, "BROADCAST_BATCH_SIZE", 4)
+
+    def runner(coro_fn):
+        async def wrapper():
+            await db.init_db()
+            try:
+                for user_id in range(1, 11):
+                    await db.set_language(user_id, 'en')
+                return await coro_fn()
+            finally:
+                await db.close_db()
+        return asyncio.run(wrapper())
+
+    return runner
+
+
+def test_broadcast_reaches_everyone_and_honours_retry_after(run):
+    bot = FakeBot({3: RetryAfter(0.01), 7: Forbidden("bot was blocked by the user")})
+
+    async def scenario():
+        job = await db.create_broadcast(99, 1, text="hello")
+        assert await broadcast.deliver(bot, job) == (9, 1)
+        assert await db.get_unfinished_broadcasts() == []
+
+        # The user who blocked the bot is left out of the next broadcast
+        assert 7 not in await db.get_user_ids_page(limit=100)
+
+    run(scenario)
+    assert sorted(bot.delivered) == [1, 2, 3, 4, 5, 6, 8, 9, 10]
+    # Retried once by the scheduler, not again by the broadcast
+    assert bot.attempts.count(3) == 2
+    assert bot.attempts.count(7) == 1
+    assert bot.edits[-1].startswith("✅ Broadcast complete!")
+
+
+def test_interrupted_broadcast_resumes_after_its_cursor(run):
+    bot = FakeBot()
+
+    async def scenario():
+        job = await db.create_broadcast(99, 1, from_chat_id=99, message_id=5)
+        await db.update_broadcast(job['id'], 4, 4, 0)
+        [unfinished] = await db.get_unfinished_broadcasts()
+        assert (unfinished['cursor'], unfinished['sent']) == (4, 4)
+        assert await broadcast.deliver(bot, unfinished) == (10, 0)
+
+    run(scenario)
+    assert sorted(bot.delivered) == [5, 6, 7, 8, 9, 10]
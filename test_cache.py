@@ -0,0 +1,38 @@
+from cache import MISSING, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set(1, ("Tech", "en"))
+    assert cache.get(1) == ("Tech", "en")
+    clock.now = 5
+    assert cache.get(1) is MISSING
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(3, "c")
+    assert cache.get(2) is MISSING
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+    assert cache.evictions == 1
+
+
+def test_none_is_a_cacheable_value():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, None)
+    assert cache.get(1) is None
+    cache.invalidate(1)
+    assert cache.get(1) is MISSING
@@ -0,0 +1,334 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import database as db
+import migrations
+from update_processor import ChatOrderedUpdateProcessor
+
+pytestmark = pytest.mark.skipif(db.DB_TYPE != "sqlite", reason="SQLite backend only")
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Run a coroutine against a fresh SQLite database."""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+
+    def runner(coro_fn):
+        async def wrapper():
+            await db.init_db()
+            try:
+                return await coro_fn()
+            finally:
+                await db.close_db()
+        return asyncio.run(wrapper())
+
+    return runner
+
+
+def test_connections_are_reused_and_tuned(run):
+    async def scenario():
+        writer, reader = db._writer, db._reader
+        await db.set_language(1, 'si')
+        assert await db.get_language(1) == 'si'
+        assert (db._writer, db._reader) == (writer, reader)
+
+        async with db._reader.execute("PRAGMA journal_mode") as cursor:
+            assert (await cursor.fetchone())[0] == 'wal'
+
+    run(scenario)
+
+
+def test_chat_lifecycle(run):
+    async def scenario():
+        await db.create_chat(1, 2)
+        assert await db.get_partner(1) == 2
+        assert await db.get_partner(2) == 1
+        assert await db.end_chat(2) == 1
+        assert await db.get_partner(1) is None
+
+    run(scenario)
+
+
+def test_failed_transaction_rolls_back(run):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with db._transaction() as conn:
+                await conn.execute("INSERT INTO active_chats VALUES (1, 2)")
+                raise RuntimeError("boom")
+        assert await db.get_partner(1) is None
+
+    run(scenario)
+
+
+def test_match_and_pair_skips_blocked_and_pairs(run):
+    async def scenario():
+        await db.add_to_queue(1002, "Tech")
+        await db.add_to_queue(1003, "Tech")
+        await db.block_user(1001, 1002)
+
+        assert await db.match_and_pair(1001, "Tech") == 1003
+        assert await db.get_partner(1001) == 1003
+        assert await db.get_partner(1003) == 1001
+        assert await db.is_in_queue(1002)
+        assert not await db.is_in_queue(1003)
+
+    run(scenario)
+
+
+def test_match_and_pair_passes_over_users_with_an_update_in_flight(run):
+    async def scenario():
+        proc = ChatOrderedUpdateProcessor(4)
+        await db.add_to_queue(10, None)
+        await db.add_to_queue(20, None)
+        cancelling = asyncio.Event()
+
+        async def cancel_search():
+            # User 10's update is still running when user 1 searches
+            await cancelling.wait()
+            await db.remove_from_queue(10)
+
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=10))
+        task = asyncio.create_task(proc.process_update(update, cancel_search()))
+        await asyncio.sleep(0)
+        assert await db.match_and_pair(1, None, proc.is_busy) == 20
+        cancelling.set()
+        await task
+        assert await db.get_partner(10) is None and not await db.is_in_queue(10)
+
+    run(scenario)
+
+
+def test_match_and_pair_hands_out_each_waiting_user_once(run):
+    async def scenario():
+        await db.add_to_queue(1, None)
+        results = await asyncio.gather(db.match_and_pair(2), db.match_and_pair(3))
+        assert sorted(results, key=str) == [1, None]
+        stats = await db.get_stats()
+        assert (stats['active_chats'], stats['in_queue'], stats['matches_made']) == (1, 0, 1)
+
+    run(scenario)
+
+
+def test_queue_is_rebuilt_in_arrival_order_after_restart(run):
+    async def fill():
+        for user_id in (30, 10, 20):
+            await db.add_to_queue(user_id, "Tech")
+        await db.remove_from_queue(10)
+
+    async def restart():
+        assert await db.is_in_queue(30) and not await db.is_in_queue(10)
+        assert await db.match_and_pair(1, "Tech") == 30
+        assert await db.match_and_pair(2, "Tech") == 20
+
+    run(fill)
+    run(restart)
+
+
+def test_blocks_survive_restart(run):
+    async def block():
+        await db.block_user(1, 2)
+
+    async def restart():
+        await db.add_to_queue(2, None)
+        await db.add_to_queue(3, None)
+        assert await db.match_and_pair(1) == 3
+
+    run(block)
+    run(restart)
+
+
+def test_settings_are_served_from_cache_and_kept_fresh_on_write(run):
+    async def scenario():
+        await db.set_interest(1, "Tech")
+        before = db.get_cache_stats()
+        assert await db.get_language(1) == 'en'
+        assert await db.get_interest(1) == "Tech"
+        await db.set_language(1, 'si')
+        assert await db.get_language(1) == 'si'
+        assert await db.get_interest(1) == "Tech"
+        after = db.get_cache_stats()
+        assert after['hits'] - before['hits'] == 4
+        assert after['misses'] == before['misses']
+
+    run(scenario)
+
+
+def test_active_chats_are_reloaded_after_restart(run):
+    async def pair():
+        await db.create_chat(1, 2)
+        await db.create_chat(3, 4)
+        await db.end_chat(3)
+
+    async def restart():
+        assert await db.get_partner(2) == 1
+        assert await db.get_partner(4) is None
+        assert (await db.get_stats())['active_chats'] == 1
+
+    run(pair)
+    run(restart)
+
+
+def test_logged_messages_resolve_before_and_after_flush(run):
+    async def log():
+        await db.log_messages([(1, 10, 2, 20), (1, 11, 2, 21)])
+        assert await db.get_partner_message_id(1, 11) == 21
+        assert await db.get_original_message_id(2, 20) == 10
+
+    async def restart():
+        assert await db.get_partner_message_id(1, 10) == 20
+        assert await db.get_original_message_id(2, 21) == 11
+
+    run(log)
+    run(restart)
+
+
+def test_message_id_lookups_use_an_index(run):
+    async def plan(query):
+        async with db._reader.execute("EXPLAIN QUERY PLAN " + query, (1, 2)) as cursor:
+            return " ".join(row[-1] for row in await cursor.fetchall())
+
+    async def scenario():
+        by_sender = await plan("SELECT receiver_msg_id FROM message_logs WHERE sender_id = ? AND sender_msg_id = ?")
+        by_receiver = await plan("SELECT sender_msg_id FROM message_logs WHERE receiver_id = ? AND receiver_msg_id = ?")
+        assert "USING PRIMARY KEY (sender_id=? AND sender_msg_id=?)" in by_sender
+        assert "USING COVERING INDEX idx_message_logs_receiver (receiver_id=? AND receiver_msg_id=?)" in by_receiver
+
+    run(scenario)
+
+
+def test_unversioned_database_is_migrated(run):
+    # A database created by the original bot: no schema_version, no language or
+    # joined_at columns and the old rowid message_logs
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.executescript("""
+        CREATE TABLE waiting_queue (user_id INTEGER PRIMARY KEY, interest TEXT);
+        CREATE TABLE user_settings (user_id INTEGER PRIMARY KEY, interest TEXT);
+        CREATE TABLE message_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id INTEGER, sender_msg_id INTEGER, receiver_id INTEGER, receiver_msg_id INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO waiting_queue VALUES (5, 'Tech');
+        INSERT INTO user_settings VALUES (5, 'Tech');
+        INSERT INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id) VALUES (1, 10, 2, 20);
+    """)
+    conn.close()
+
+    async def scenario():
+        assert await db.get_partner_message_id(1, 10) == 20
+        assert await db.get_language(5) == 'en'
+        assert await db.is_in_queue(5)
+        row = await db._fetchone("SELECT sql FROM sqlite_master WHERE name = 'message_logs'")
+        assert "WITHOUT ROWID" in row[0]
+        versions = [row[0] for row in await db._fetchall("SELECT version FROM schema_version ORDER BY version")]
+        assert versions == [version for version, _, _ in migrations.list_migrations(migrations.SQLITE_MIGRATIONS_DIR)]
+
+    run(scenario)
+    # Already-applied migrations are not run again
+    run(scenario)
+
+
+def test_sqlite_migrations_share_the_supabase_version_sequence():
+    sqlite_versions = {version for version, _, _ in migrations.list_migrations(migrations.SQLITE_MIGRATIONS_DIR)}
+    supabase_versions = {version for version, _, _ in migrations.list_migrations(migrations.SUPABASE_MIGRATIONS_DIR)}
+    assert sqlite_versions <= supabase_versions
+
+
+def test_prune_message_logs_drops_only_old_mappings(run):
+    async def scenario():
+        await db._write("INSERT INTO message_logs VALUES (1, 10, 2, 20, 0)")
+        await db._write("INSERT INTO message_logs (sender_id, sender_msg_id, receiver_id, receiver_msg_id) VALUES (1, 11, 2, 21)")
+        assert await db.prune_message_logs(3600) == 1
+        assert await db.get_partner_message_id(1, 10) is None
+        assert await db.get_partner_message_id(1, 11) == 21
+
+    run(scenario)
+
+
+def test_stats_counters_track_writes_and_survive_restart(run):
+    async def activity():
+        await db.set_language(1, 'si')
+        await db.set_interest(1, "Tech")
+        await db.set_interest(2, "Tech")
+        await db.add_to_queue(2, "Tech")
+        await db.add_to_queue(3, None)
+        assert await db.match_and_pair(1, "Tech") == 2
+        await db.log_messages([(1, 10, 2, 20), (1, 11, 2, 21)])
+        assert await db.get_stats() == {
+            'total_users': 2, 'reachable_users': 2, 'unreachable_users': 0,
+            'active_chats': 1, 'in_queue': 1, 'matches_made': 1, 'messages_relayed': 2}
+
+    async def restart():
+        assert await db.get_stats() == {
+            'total_users': 2, 'reachable_users': 2, 'unreachable_users': 0,
+            'active_chats': 1, 'in_queue': 1, 'matches_made': 1, 'messages_relayed': 2}
+
+    run(activity)
+    run(restart)
+
+
+def test_reconcile_stats_corrects_drift(run):
+    async def scenario():
+        await db.set_interest(1, "Tech")
+        await db._write("INSERT INTO user_settings (user_id) VALUES (2)")
+        await db._write("UPDATE stats_counters SET value = 5 WHERE name = 'matches_made'")
+        await db.log_message(1, 10, 2, 20)
+        stats = await db.reconcile_stats()
+        assert (stats['total_users'], stats['matches_made'], stats['messages_relayed']) == (2, 5, 1)
+
+    run(scenario)
+
+
+def test_unreachable_users_are_dequeued_skipped_and_revived(run):
+    async def flag():
+        for user_id in (1, 2, 3):
+            await db.set_language(user_id, 'en')
+        await db.add_to_queue(2, None)
+        await db.mark_unreachable(2)
+        assert not await db.is_in_queue(2)
+        assert await db.get_user_ids_page() == [1, 3]
+        stats = await db.get_stats()
+        assert (stats['reachable_users'], stats['unreachable_users']) == (2, 1)
+
+    async def restart():
+        # Still flagged after a restart, so never handed out as a partner
+        db._matchmaker.add(2, None)
+        assert await db.match_and_pair(1) is None
+        await db.mark_reachable(2)
+        assert await db.match_and_pair(1) == 2
+        assert await db.get_user_ids_page() == [1, 2, 3]
+
+    run(flag)
+    run(restart)
+
+
+def test_session_context_reads_both_users_in_one_query(run):
+    async def setup():
+        await db.set_language(1, 'si')
+        await db.set_interest(1, 'Music')
+        await db.set_language(2, 'ta')
+        await db.create_chat(1, 2)
+        await db.add_to_queue(3, None)
+
+    async def scenario():
+        queries = []
+        fetchall = db._fetchall
+
+        async def counting_fetchall(query, params=()):
+            queries.append(query)
+            return await fetchall(query, params)
+
+        db._fetchall = counting_fetchall
+        try:
+            session = await db.get_session_context(1)
+            assert (session.language, session.interest, session.partner_id, session.partner_language, session.in_queue) == ('si', 'Music', 2, 'ta', False)
+            assert len(queries) == 1
+            # Cached now
+            assert (await db.get_session_context(2)).partner_language == 'si'
+            assert len(queries) == 1
+            session = await db.get_session_context(3)
+            assert (session.language, session.partner_id, session.partner_language, session.in_queue) == ('en', None, None, True)
+        finally:
+            db._fetchall = fetchall
+
+    run(setup)
+    run(scenario)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from telegram.error import TimedOut
+
+from http_pool import PooledRequest, PoolWaits, pool_stats
+from metrics import HTTP_POOL_WAIT_SECONDS
+
+
+async def slow_server(delay):
+    """A keep-alive HTTP server answering every request after `delay` seconds; returns (server, url)."""
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                await reader.readexactly(length)
+                await asyncio.sleep(delay)
+                body = b'{"ok":true,"result":true}'
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+
+
+def test_requests_waiting_for_a_connection_are_recorded():
+    async def scenario():
+        server, url = await slow_server(0.05)
+        request = PooledRequest('test-wait', pool_size=1, keepalive=1, keepalive_expiry=5)
+        await request.initialize()
+        try:
+            # The first request of a client pays one-off setup costs
+            await request.do_request(url, 'POST')
+            request.waits = PoolWaits()
+            await asyncio.gather(*(request.do_request(url, 'POST') for _ in range(3)))
+        finally:
+            await request.shutdown()
+            server.close()
+        return request.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['requests'] == 3
+    # The first got the connection straight away, the others queued behind it
+    assert stats['waited'] >= 2
+    assert 40 <= stats['avg_wait_ms'] < 150
+    assert 90 <= stats['max_wait_ms'] < 300
+    assert pool_stats()['test-wait'] == stats
+    # The warm-up request too
+    assert sum(HTTP_POOL_WAIT_SECONDS.labels('test-wait')[:-1]) == 4
+
+
+def test_pool_timeouts_are_counted():
+    async def scenario():
+        server, url = await slow_server(0.2)
+        request = PooledRequest('test-timeout', pool_size=1, keepalive=1, keepalive_expiry=5, pool_timeout=0.05)
+        await request.initialize()
+        try:
+            results = await asyncio.gather(*(request.do_request(url, 'POST') for _ in range(2)), return_exceptions=True)
+        finally:
+            await request.shutdown()
+            server.close()
+        return results, request.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert sum(isinstance(r, TimedOut) for r in results) == 1
+    assert stats['timeouts'] == 1
+
+
+def test_pool_settings_reach_the_client():
+    request = PooledRequest('test-limits', pool_size=8, keepalive=20, keepalive_expiry=7, http_version='2')
+    pool = request._client._transport._pool
+    assert pool._max_connections == 8
+    # Never more idle connections than the pool holds
+    assert pool._max_keepalive_connections == 8
+    assert pool._keepalive_expiry == 7
+    assert pool._http2 and request.http_version == '2'
+
+
+def test_unknown_http_version_is_rejected():
+    with pytest.raises(ValueError):
+        PooledRequest('test-bad', pool_size=1, keepalive=1, keepalive_expiry=5, http_version='3')
@@ -0,0 +1,63 @@
+from matchmaker import BlockIndex, Matchmaker
+
+
+def test_pop_is_fifo_within_an_interest():
+    mm = Matchmaker()
+    for user_id in (1, 2, 3):
+        mm.add(user_id, "Tech")
+    assert mm.pop(99, "Tech") == 1
+    assert mm.pop(99, "Tech") == 2
+    assert 3 in mm and len(mm) == 1
+
+
+def test_pop_without_interest_takes_oldest_across_interests():
+    mm = Matchmaker()
+    mm.add(1, "Music")
+    mm.add(2, None)
+    mm.add(3, "Tech")
+    assert mm.pop(99) == 1
+    # Users without an interest are only matched by searchers without one
+    assert mm.pop(98, "Tech") == 3
+    assert mm.pop(97, "Tech") is None
+    assert mm.pop(96) == 2
+
+
+def test_pop_skips_self_and_ineligible_users_without_losing_their_place():
+    mm = Matchmaker()
+    mm.add(1, "Tech")
+    mm.add(2, "Tech")
+    mm.add(3, "Tech")
+    assert mm.pop(1, "Tech", is_eligible=lambda uid: uid != 2) == 3
+    assert mm.pop(4, "Tech") == 1
+    assert mm.pop(4, "Tech") == 2
+
+
+def test_removed_and_requeued_users_go_to_the_back():
+    mm = Matchmaker()
+    mm.add(1, None)
+    mm.add(2, None)
+    assert not mm.add(1, None)
+    assert mm.remove(1)
+    assert not mm.remove(1)
+    mm.add(1, None)
+    assert [mm.pop(99), mm.pop(99), mm.pop(99)] == [2, 1, None]
+
+
+def test_stale_entries_are_compacted():
+    mm = Matchmaker()
+    mm.add(0, "Tech")
+    for user_id in range(1, 5000):
+        mm.add(user_id, "Tech")
+        mm.remove(user_id)
+    assert len(mm._queues["Tech"]) < 2000
+    assert mm.pop(99, "Tech") == 0
+
+
+def test_block_index_checks_both_directions():
+    blocks = BlockIndex()
+    blocks.load([(1, 2)])
+    blocks.add(3, 1)
+    assert blocks.is_blocked(1, 2) and blocks.is_blocked(2, 1)
+    assert blocks.is_blocked(1, 3) and blocks.is_blocked(3, 1)
+    assert not blocks.is_blocked(2, 3)
+    assert len(blocks) == 2
@@ -0,0 +1,78 @@
+import asyncio
+
+from message_log import MessageLogWriter
+
+
+def make_writer(**kwargs):
+    batches = []
+
+    async def flush_rows(rows):
+        batches.append(list(rows))
+
+    return MessageLogWriter(flush_rows, **kwargs), batches
+
+
+def test_rows_are_visible_before_they_are_written():
+    async def scenario():
+        writer, batches = make_writer(max_batch=10, max_delay=60)
+        writer.add([(1, 100, 2, 200)])
+        assert writer.get_receiver_msg_id(1, 100) == 200
+        assert writer.get_sender_msg_id(2, 200) == 100
+        assert batches == []
+        await writer.close()
+        assert batches == [[(1, 100, 2, 200)]]
+        assert writer.get_receiver_msg_id(1, 100) is None
+
+    asyncio.run(scenario())
+
+
+def test_flushes_on_size_and_on_time():
+    async def scenario():
+        writer, batches = make_writer(max_batch=3, max_delay=0.05)
+        writer.add([(1, n, 2, n + 1000) for n in range(3)])
+        await asyncio.sleep(0)
+        assert [len(batch) for batch in batches] == [3]
+
+        writer.add([(1, 50, 2, 1050)])
+        await asyncio.sleep(0.1)
+        assert [len(batch) for batch in batches] == [3, 1]
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batches_are_retried():
+    async def scenario():
+        attempts = []
+
+        async def flaky(rows):
+            attempts.append(list(rows))
+            if len(attempts) == 1:
+                raise RuntimeError("database unavailable")
+
+        writer = MessageLogWriter(flaky, max_batch=10, max_delay=60)
+        writer.add([(1, 100, 2, 200)])
+        await writer.flush()
+        assert len(writer) == 1 and writer.get_receiver_msg_id(1, 100) == 200
+        await writer.close()
+        assert attempts == [[(1, 100, 2, 200)]] * 2
+        assert len(writer) == 0
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_flushes_in_flight():
+    async def scenario():
+        written = []
+
+        async def slow_flush(rows):
+            await asyncio.sleep(0.05)
+            written.extend(rows)
+
+        writer = MessageLogWriter(slow_flush, max_batch=2, max_delay=60)
+        writer.add([(1, 1, 2, 1001), (1, 2, 2, 1002)])
+        assert len(writer._tasks) == 1
+        await writer.close()
+        assert len(written) == 2 and not writer._tasks
+
+    asyncio.run(scenario())
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as server
+import database as db
+import handlers  # noqa: F401  (its handlers register their series on import)
+import metrics
+from metrics import CallbackMetric, Counter, Histogram, timed
+
+
+def fresh(monkeypatch):
+    """An empty registry for the metrics created by the test."""
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_histogram_buckets_are_cumulative_in_the_exposition(monkeypatch):
+    fresh(monkeypatch)
+    histogram = Histogram('test_seconds', 'Test latencies.', ('op',), buckets=(0.1, 1))
+    series = histogram.labels('read')
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(series, value)
+
+    assert metrics.render().splitlines() == [
+        '# HELP test_seconds Test latencies.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{op="read",le="0.1"} 2',
+        'test_seconds_bucket{op="read",le="1"} 3',
+        'test_seconds_bucket{op="read",le="+Inf"} 4',
+        'test_seconds_sum{op="read"} 3.65',
+        'test_seconds_count{op="read"} 4',
+    ]
+
+
+def test_counter_escapes_label_values(monkeypatch):
+    fresh(monkeypatch)
+    counter = Counter('test_total', 'Test events.', ('reason',))
+    counter.inc('say "hi"\n')
+    counter.inc('say "hi"\n', amount=2)
+    assert metrics.render().splitlines()[-1] == 'test_total{reason="say \\"hi\\"\\n"} 3'
+
+
+def test_callback_metrics_are_read_at_scrape_time(monkeypatch):
+    fresh(monkeypatch)
+    totals = {'hit': 1}
+    CallbackMetric('test_lookups_total', 'Test lookups.', 'counter', ('result',), lambda: {(key,): value for key, value in totals.items()})
+    totals['hit'] += 2
+    assert metrics.render().splitlines() == [
+        '# HELP test_lookups_total Test lookups.',
+        '# TYPE test_lookups_total counter',
+        'test_lookups_total{result="hit"} 3',
+    ]
+
+
+def test_timed_counts_calls_and_errors(monkeypatch):
+    fresh(monkeypatch)
+    histogram = Histogram('test_seconds', 'Test latencies.', ('function',))
+    errors = Counter('test_errors_total', 'Test errors.', ('function', 'error'))
+
+    @timed(histogram, errors, 'work')
+    async def work(fail=False):
+        await asyncio.sleep(0.01)
+        if fail:
+            raise KeyError('missing')
+        return 'done'
+
+    assert asyncio.run(work()) == 'done'
+    with pytest.raises(KeyError):
+        asyncio.run(work(fail=True))
+
+    series = histogram.labels('work')
+    assert sum(series[:-1]) == 2
+    assert 0.02 <= series[-1] < 0.2
+    assert errors._values == {('work', 'KeyError'): 1}
+    assert work.__name__ == 'work'
+
+
+def test_database_functions_are_timed():
+    before = sum(metrics.DB_SECONDS.labels('get_partner')[:-1])
+    asyncio.run(db.get_partner(1))
+    assert sum(metrics.DB_SECONDS.labels('get_partner')[:-1]) == before + 1
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    response = TestClient(server.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert '# TYPE slomegle_handler_seconds histogram' in response.text
+    assert 'slomegle_handler_seconds_count{handler="handle_message"}' in response.text
+    assert 'slomegle_db_seconds_bucket{function="get_partner",le="+Inf"}' in response.text
+    hits = db.get_cache_stats()['hits']
+    assert f'slomegle_settings_cache_lookups_total{{result="hit"}} {hits}' in response.text
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import moderation
+from moderation import WordFilter, normalize
+
+
+@pytest.mark.parametrize("text", [
+    "this is spam",
+    "THIS IS SPAM",
+    "this is sраm",  # Cyrillic р and а
+    "ＳＰＡＭ",  # fullwidth
+    "𝐬𝐩𝐚𝐦",  # mathematical bold
+    "s p a m",
+    "s.p.a.m!",
+    "spaaaaam",
+    "5p4m",
+    "scám",
+    "totally a scammer",
+])
+def test_evasions_are_caught(text):
+    assert WordFilter(["spam", "scam"]).find(text) is not None
+
+
+@pytest.mark.parametrize("text", ["this pam", "ok sc am", "hello there", "පණිවිඩය"])
+def test_clean_text_passes(text):
+    assert WordFilter(["spam", "scam"]).find(text) is None
+
+
+@pytest.mark.parametrize("text", ["I was there", "he has a cat", "as soon as", "last time", "help me"])
+def test_words_with_doubled_letters_are_not_shortened(text):
+    assert WordFilter(["ass", "hell", "sex"]).find(text) is None
+
+
+@pytest.mark.parametrize("text", ["ass", "aasss", "a s s", "hheeelll no"])
+def test_words_with_doubled_letters_are_still_caught(text):
+    assert WordFilter(["ass", "hell"]).find(text) is not None
+
+
+def test_overlapping_words_and_phrases_are_found():
+    words = WordFilter(["he", "she", "hers", "his", "kill yourself"])
+    assert words.find("ushers") == "she"
+    assert words.find("ahis") == "his"
+    assert words.find("just kill   yourself") == normalize("kill yourself")
+    assert words.find("skill your self") is None
+
+
+def test_normalize_keeps_combining_marks_of_other_scripts():
+    assert normalize("ස්පෑම්") == "ස්පෑම්"
+
+
+def test_word_list_file_is_hot_reloaded(tmp_path, monkeypatch):
+    path = tmp_path / "bad_words.txt"
+    monkeypatch.setattr(moderation, "_loaded_mtime", None)
+    monkeypatch.setattr(moderation, "_filter", moderation._filter)
+    assert not moderation.reload_if_changed(str(path))
+
+    path.write_text("# custom list\nfoo\n\nbar baz\n", encoding="utf-8")
+    assert moderation.reload_if_changed(str(path))
+    assert moderation.find_bad_word("some FOO here") == normalize("foo")
+    assert moderation.find_bad_word("spam") is None
+    assert not moderation.reload_if_changed(str(path))
+
+    path.write_text("qux\n", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert moderation.reload_if_changed(str(path))
+    assert moderation.find_bad_word("foo") is None
+    assert moderation.find_bad_word("bar baz") is None
+    assert moderation.find_bad_word("q u x") == "qux"
+
+    path.unlink()
+    assert moderation.reload_if_changed(str(path))
+    assert moderation.find_bad_word("spam") == "spam"
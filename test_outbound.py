@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import outbound
+from outbound import PRIORITY_BULK, PRIORITY_RELAY, SendScheduler
+
+
+def send(scheduler, chat_id, log=None, errors=None, endpoint='sendMessage', priority=None):
+    """One call through the scheduler; errors are raised by the first attempts, in order."""
+    errors = list(errors or [])
+    attempts = []
+
+    async def callback():
+        attempts.append(time.perf_counter())
+        if errors:
+            raise errors.pop(0)
+        if log is not None:
+            log.append(chat_id)
+        return chat_id
+
+    async def call():
+        await scheduler.process_request(callback, (), {}, endpoint, {'chat_id': chat_id}, priority)
+        return attempts
+
+    return call()
+
+
+def caused_by(error, cause):
+    """error raised from an httpx error, the way PTB raises it."""
+    error.__cause__ = cause
+    return error
+
+
+def test_relays_overtake_queued_broadcasts():
+    async def scenario():
+        scheduler = SendScheduler(rate=50, chat_burst=100)
+        log = []
+        # Use up the burst, then queue broadcasts before a relay
+        await asyncio.gather(*(send(scheduler, 'warmup') for _ in range(50)))
+        calls = [send(scheduler, f'bulk{i}', log, priority=PRIORITY_BULK) for i in range(3)]
+        calls.append(send(scheduler, 'relay', log, priority=PRIORITY_RELAY))
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        await asyncio.sleep(0)
+        assert scheduler.stats()['waiting'] == {'relay': 1, 'pin': 0, 'bulk': 3}
+        await asyncio.gather(*tasks)
+        return log
+
+    assert asyncio.run(scenario())[0] == 'relay'
+
+
+def test_each_chat_is_paced_without_holding_up_others():
+    async def scenario():
+        scheduler = SendScheduler(rate=1000, chat_rate=20, chat_burst=2)
+        started = time.perf_counter()
+        finished = {}
+
+        async def timed(chat_id):
+            await send(scheduler, chat_id)
+            finished.setdefault(chat_id, []).append(time.perf_counter() - started)
+
+        await asyncio.gather(*(timed(1) for _ in range(3)), timed(2))
+        return finished
+
+    finished = asyncio.run(scenario())
+    assert finished[1][2] >= 0.04  # third message in chat 1 waited for its token
+    assert finished[2][0] < 0.02
+
+
+def test_flood_control_and_unsent_requests_are_retried(monkeypatch):
+    monkeypatch.setattr(outbound, "RETRY_BACKOFF", 0.01)
+
+    async def scenario():
+        scheduler = SendScheduler(rate=1000, chat_burst=10)
+        pool_timeout = caused_by(TimedOut(), httpx.PoolTimeout('no free connection'))
+        attempts = await send(scheduler, 1, errors=[RetryAfter(0.05), pool_timeout])
+        return scheduler, attempts
+
+    scheduler, attempts = asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05
+    stats = scheduler.stats()
+    assert (stats['sent'], stats['retried'], stats['flood_waits'], stats['failed']) == (1, 2, 1, 0)
+
+
+def test_sends_that_may_have_arrived_are_not_retried():
+    async def scenario():
+        scheduler = SendScheduler(rate=1000, chat_burst=10)
+        read_timeout = caused_by(TimedOut(), httpx.ReadTimeout('no answer'))
+        with pytest.raises(TimedOut):
+            await send(scheduler, 1, errors=[read_timeout])
+        with pytest.raises(NetworkError):
+            await send(scheduler, 1, errors=[NetworkError('Bad Gateway')], endpoint='copyMessage')
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats['retried'], stats['failed']) == (0, 2)
+
+
+def test_edits_and_pins_are_retried_after_any_network_error(monkeypatch):
+    monkeypatch.setattr(outbound, "RETRY_BACKOFF", 0.01)
+
+    async def scenario():
+        scheduler = SendScheduler(rate=1000, chat_burst=10)
+        for endpoint in ('editMessageText', 'pinChatMessage'):
+            read_timeout = caused_by(TimedOut(), httpx.ReadTimeout('no answer'))
+            assert len(await send(scheduler, 1, errors=[read_timeout], endpoint=endpoint)) == 2
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats['sent'], stats['retried'], stats['failed']) == (2, 2, 0)
+
+
+@pytest.mark.parametrize("error", [BadRequest("Message is too long"), Forbidden("bot was blocked by the user")])
+def test_permanent_errors_are_not_retried(error):
+    async def scenario():
+        scheduler = SendScheduler(rate=1000)
+        with pytest.raises(type(error)):
+            await send(scheduler, 1, errors=[error])
+        return scheduler.stats()['failed']
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_calls_outside_the_message_limits_pass_straight_through():
+    async def scenario():
+        scheduler = SendScheduler(rate=1, chat_burst=1)
+        started = time.perf_counter()
+        for _ in range(5):
+            await send(scheduler, 1, endpoint='answerCallbackQuery')
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) < 0.05
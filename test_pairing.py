@@ -0,0 +1,94 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden
+
+import database as db
+from metrics import PAIRING_SECONDS
+from pairing import connect_pair
+
+pytestmark = pytest.mark.skipif(db.DB_TYPE != "sqlite", reason="SQLite backend only")
+
+ROUND_TRIP = 0.05
+
+
+class SlowBot:
+    """Every call takes one round trip; records calls in the order they finish."""
+
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = dict(errors or {})
+        self._next_id = 100
+
+    async def _call(self, method, chat_id):
+        await asyncio.sleep(ROUND_TRIP)
+        error = self.errors.pop((method, chat_id), None)
+        if error:
+            raise error
+        self.calls.append((method, chat_id))
+        self._next_id += 1
+        return SimpleNamespace(message_id=self._next_id)
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        return await self._call('send', chat_id)
+
+    async def pin_chat_message(self, chat_id, message_id):
+        return await self._call('pin', chat_id)
+
+    async def delete_message(self, chat_id, message_id):
+        return await self._call('delete', chat_id)
+
+
+def run(tmp_path, monkeypatch, scenario):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def wrapper():
+        await db.init_db()
+        try:
+            await db.set_language(2, 'si')
+            return await scenario()
+        finally:
+            await db.close_db()
+    return asyncio.run(wrapper())
+
+
+def test_both_sides_are_connected_concurrently(tmp_path, monkeypatch):
+    bot = SlowBot()
+    shown = []
+
+    async def show(text, reply_markup=None):
+        shown.append(text)
+        return await bot._call('show', 1)
+
+    connected_before = sum(PAIRING_SECONDS.labels('total')[:-1])
+
+    async def scenario():
+        started = time.perf_counter()
+        timings = await connect_pair(bot, 1, 2, 'en', 'Music', show, searching_msg_id=7)
+        return time.perf_counter() - started, timings
+
+    elapsed, timings = run(tmp_path, monkeypatch, scenario)
+    # Message then pin on each side, everything else alongside: two round trips, not five
+    assert elapsed < 3.5 * ROUND_TRIP
+    assert sorted(bot.calls[:3]) == [('delete', 1), ('send', 2), ('show', 1)]
+    assert sorted(bot.calls[3:]) == [('pin', 1), ('pin', 2)]
+    assert 'Music' in shown[0]
+    assert {'show_user', 'pin_user', 'send_partner', 'pin_partner', 'delete_searching', 'total'} <= set(timings)
+    assert sum(PAIRING_SECONDS.labels('total')[:-1]) == connected_before + 1
+    assert PAIRING_SECONDS.labels('send_partner')[-1] >= ROUND_TRIP
+
+
+def test_unreachable_partner_does_not_hold_up_the_user(tmp_path, monkeypatch):
+    bot = SlowBot({('send', 2): Forbidden("bot was blocked by the user")})
+
+    async def show(text, reply_markup=None):
+        return await bot._call('show', 1)
+
+    async def scenario():
+        await connect_pair(bot, 1, 2, 'en', None, show)
+        return (await db.get_stats())['unreachable_users']
+
+    assert run(tmp_path, monkeypatch, scenario) == 1
+    assert bot.calls == [('show', 1), ('pin', 1)]
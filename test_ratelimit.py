@@ -0,0 +1,226 @@
+import asyncio
+import time
+
+from middleware import RateLimiter, RedisBackend, SQLiteBackend
+from ratelimit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_bursts_up_to_capacity_then_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=3, clock=clock)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert abs(bucket.delay() - 0.1) < 1e-9
+    clock.now += 0.1
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_pause_holds_every_caller_back():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock)
+    bucket.pause(2)
+    assert not bucket.try_acquire()
+    assert bucket.delay() == 2
+    clock.now += 2
+    assert not bucket.try_acquire()  # the bucket was emptied
+    clock.now += 0.1
+    assert bucket.try_acquire()
+
+
+def test_acquire_paces_callers_to_the_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=200, capacity=1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(bucket.acquire() for _ in range(21)))
+        return loop.time() - started
+
+    # One token up front, then 20 more at 200/s
+    assert asyncio.run(scenario()) >= 0.09
+
+
+def test_rate_limiter_mutes_after_the_limit_within_the_window():
+    clock = FakeClock()
+    limiter = RateLimiter(limit=3, window=2, mute=60, clock=clock)
+    assert [limiter.check(1)[0] for _ in range(3)] == [True, True, True]
+    allowed, error = limiter.check(1)
+    assert not allowed and "Muted for 60s" in error
+    clock.now += 30
+    allowed, error = limiter.check(1)
+    assert not allowed and "muted for 30s" in error
+    clock.now += 30
+    assert limiter.check(1) == (True, None)
+
+
+def test_rate_limiter_window_slides():
+    clock = FakeClock()
+    limiter = RateLimiter(limit=3, window=2, mute=60, clock=clock)
+    for _ in range(10):
+        assert limiter.check(1) == (True, None)
+        clock.now += 0.7
+
+
+def test_sweep_forgets_idle_users_but_keeps_muted_ones():
+    clock = FakeClock()
+    limiter = RateLimiter(limit=1, window=2, mute=60, clock=clock)
+    limiter.check(1)
+    limiter.check(2)
+    limiter.check(2)  # muted
+    clock.now += 1
+    limiter.check(3)
+    clock.now += 1.5
+    assert limiter.sweep() == 1
+    assert len(limiter) == 2
+    assert not limiter.check(2)[0]
+
+
+def counting_batches(backend):
+    """Wrap backend._check_batch to count round trips to the store."""
+    calls = []
+    check_batch = backend._check_batch
+
+    async def wrapper(user_ids, now):
+        calls.append(list(user_ids))
+        return await check_batch(user_ids, now)
+
+    backend._check_batch = wrapper
+    return calls
+
+
+def test_sqlite_backend_batches_checks_and_shares_mutes(tmp_path):
+    clock = FakeClock()
+    clock.now = 1000.0
+    path = str(tmp_path / "ratelimit.db")
+
+    async def scenario():
+        worker_a = SQLiteBackend(path, limit=3, window=2, mute=60, clock=clock)
+        worker_b = SQLiteBackend(path, limit=3, window=2, mute=60, clock=clock)
+        calls = counting_batches(worker_a)
+        results = await asyncio.gather(*(worker_a.check(user_id) for user_id in (1, 1, 1, 2, 1)))
+        # RETURNING order is arbitrary, so a repeated user waits for the next batch
+        assert calls == [[1, 2], [1], [1], [1]]
+        assert [allowed for allowed, _ in results] == [True, True, True, True, False]
+        assert "Muted for 60s" in results[-1][1]
+
+        # Another worker sees the mute
+        clock.now += 10
+        allowed, error = await worker_b.check(1)
+        assert not allowed and "muted for 50s" in error
+        assert await worker_b.check(2) == (True, None)
+
+        clock.now += 60
+        assert await worker_b.check(1) == (True, None)
+        clock.now += 10
+        assert await worker_a.sweep() == 2
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+
+class RedisStandIn:
+    """Just enough of a Redis server for RedisBackend: INCR, PEXPIRE, GET, PTTL, SET."""
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at)
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None, None
+        return value, expires_at
+
+    def run(self, command, *args):
+        if command == b'INCR':
+            value, expires_at = self._get(args[0])
+            value = int(value or 0) + 1
+            self.data[args[0]] = (str(value).encode(), expires_at)
+            return b':%d\r\n' % value
+        if command == b'PEXPIRE':
+            value, _ = self._get(args[0])
+            if value is None:
+                return b':0\r\n'
+            self.data[args[0]] = (value, time.monotonic() + int(args[1]) / 1000)
+            return b':1\r\n'
+        if command == b'GET':
+            value, _ = self._get(args[0])
+            return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if command == b'PTTL':
+            value, expires_at = self._get(args[0])
+            if value is None:
+                return b':-2\r\n'
+            return b':%d\r\n' % (-1 if expires_at is None else int((expires_at - time.monotonic()) * 1000))
+        if command == b'SET':
+            self.data[args[0]] = (args[1], time.monotonic() + int(args[3]) / 1000 if len(args) > 3 else None)
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+    async def serve(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = []
+            for _ in range(int(line[1:])):
+                length = int((await reader.readline())[1:])
+                command.append((await reader.readexactly(length + 2))[:-2])
+            writer.write(self.run(*command))
+            await writer.drain()
+        writer.close()
+
+
+def test_redis_backend_uses_one_pipeline_per_batch_and_shares_mutes():
+    async def scenario():
+        store = RedisStandIn()
+        server = await asyncio.start_server(store.serve, "127.0.0.1", 0)
+        url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+        worker_a = RedisBackend(url, limit=3, window=2, mute=60)
+        worker_b = RedisBackend(url, limit=3, window=2, mute=60)
+        calls = counting_batches(worker_a)
+
+        results = await asyncio.gather(*(worker_a.check(user_id) for user_id in (1, 1, 1, 2, 1)))
+        assert len(calls) == 1
+        assert [allowed for allowed, _ in results] == [True, True, True, True, False]
+        # This worker answers from the mute it remembers until the write lands...
+        assert not (await worker_a.check(1))[0]
+        await asyncio.sleep(0.05)
+        # ...after which every worker sees it
+        allowed, error = await worker_b.check(1)
+        assert not allowed and "muted for" in error
+        assert await worker_b.check(2) == (True, None)
+
+        await worker_a.close()
+        await worker_b.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend_close_waits_for_mute_writes():
+    async def scenario():
+        store = RedisStandIn()
+        server = await asyncio.start_server(store.serve, "127.0.0.1", 0)
+        url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+        worker = RedisBackend(url, limit=1, window=2, mute=60)
+        results = await asyncio.gather(worker.check(1), worker.check(1))
+        assert [allowed for allowed, _ in results] == [True, False]
+        # The mute is still being written; closing right away must not lose it
+        await worker.close()
+
+        other = RedisBackend(url, limit=1, window=2, mute=60)
+        assert not (await other.check(1))[0]
+        await other.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
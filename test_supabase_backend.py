@@ -0,0 +1,96 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+import config
+
+pytest.importorskip("postgrest")
+
+QUERY_DELAY = 0.3
+
+
+class FakePostgrest(BaseHTTPRequestHandler):
+    """Stand-in for Supabase's REST API that takes QUERY_DELAY to answer every request."""
+
+    def do_GET(self):
+        time.sleep(QUERY_DELAY)
+        if self.path.startswith("/rest/v1/user_settings"):
+            body = [{"user_id": 1, "language": "si"}]
+        else:
+            body = []
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Content-Range", f"0-{len(body) - 1}/{len(body)}" if body else "*/0")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def supabase_db(monkeypatch):
+    """A fresh copy of database.py loaded with the Supabase backend, pointed at FakePostgrest."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePostgrest)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(config, "DB_TYPE", "supabase")
+    monkeypatch.setattr(config, "SUPABASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(config, "SUPABASE_KEY", "test-key")
+    spec = importlib.util.spec_from_file_location("database_supabase", Path(__file__).with_name("database.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    yield module
+    server.shutdown()
+    server.server_close()
+
+
+def test_queries_do_not_block_the_event_loop(supabase_db):
+    async def scenario():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker_task = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        languages = await asyncio.gather(*(supabase_db.get_language(user_id) for user_id in range(5)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ticker_task
+        await supabase_db.close_db()
+        return languages, elapsed, ticks
+
+    languages, elapsed, ticks = asyncio.run(scenario())
+    assert languages == ["si"] * 5
+    # The five queries overlapped instead of running back to back...
+    assert elapsed < 5 * QUERY_DELAY
+    # ...and the loop kept running other coroutines while they were in flight
+    assert ticks >= 10
+
+
+def test_stats_are_loaded_once_and_read_from_memory(supabase_db):
+    async def scenario():
+        await supabase_db.init_db()
+        started = time.perf_counter()
+        stats = await supabase_db.get_stats()
+        elapsed = time.perf_counter() - started
+        await supabase_db.close_db()
+        return stats, elapsed
+
+    stats, elapsed = asyncio.run(scenario())
+    assert stats['total_users'] == 1
+    assert elapsed < QUERY_DELAY
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def update_from(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+
+
+def processor(concurrency, partners=None):
+    partners = partners or {}
+
+    async def partner_of(user_id):
+        return partners.get(user_id)
+
+    return ChatOrderedUpdateProcessor(concurrency, partner_of=partner_of)
+
+
+async def replay(proc, updates, handle):
+    """Feed (user_id, seq) updates in order, like the Application does, and wait for all."""
+    await asyncio.gather(*(proc.process_update(update_from(user_id), handle(user_id, seq)) for user_id, seq in updates))
+
+
+def test_users_run_concurrently_and_each_stays_in_order():
+    updates = [(user_id, seq) for seq in range(5) for user_id in range(20)]
+
+    async def run(concurrency):
+        proc = processor(concurrency)
+        seen = {}
+
+        async def handle(user_id, seq):
+            await asyncio.sleep(0.005)
+            seen.setdefault(user_id, []).append(seq)
+
+        started = time.perf_counter()
+        await replay(proc, updates, handle)
+        assert all(seqs == list(range(5)) for seqs in seen.values())
+        assert len(proc._queues) == 0
+        return time.perf_counter() - started
+
+    sequential, concurrent = asyncio.run(run(1)), asyncio.run(run(16))
+    assert sequential / concurrent > 4
+
+
+def test_partners_never_run_at_the_same_time():
+    async def scenario():
+        proc = processor(8, {1: 2, 2: 1})
+        running, overlaps = set(), []
+
+        async def handle(user_id, seq):
+            if running:
+                overlaps.append((user_id, seq))
+            running.add(user_id)
+            await asyncio.sleep(0.002)
+            running.discard(user_id)
+
+        await replay(proc, [(user_id, seq) for seq in range(10) for user_id in (1, 2)], handle)
+        return overlaps
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_updates_keep_their_order_when_the_chat_changes_while_they_wait():
+    async def scenario():
+        partners = {1: 2, 2: 1}
+        proc = processor(8, partners)
+        started = []
+
+        async def handle(user_id, seq):
+            started.append(seq)
+            if seq == '/next':
+                # User 1 leaves user 2 and is matched with user 3
+                await asyncio.sleep(0.01)
+                partners.clear()
+                partners.update({1: 3, 3: 1})
+            await asyncio.sleep(0.001)
+
+        await replay(proc, [(1, '/next'), (1, 'msg-A'), (2, 'msg-B')], handle)
+        return started, proc
+
+    started, proc = asyncio.run(scenario())
+    assert started == ['/next', 'msg-A', 'msg-B']
+    assert len(proc._queues) == 0 and not proc._busy
+
+
+def test_a_flood_from_one_chat_does_not_hold_up_others():
+    async def scenario():
+        proc = processor(2)
+        finished = []
+
+        async def handle(user_id, seq):
+            await asyncio.sleep(0.01)
+            finished.append(user_id)
+
+        await replay(proc, [(1, seq) for seq in range(20)] + [(2, 0)], handle)
+        return finished.index(2)
+
+    # Waiting updates of user 1 take no running slot, so user 2 gets one straight away
+    assert asyncio.run(scenario()) < 3
+
+
+def test_stats_count_running_and_waiting_updates():
+    async def scenario():
+        proc = processor(2)
+        release = asyncio.Event()
+
+        async def handle(user_id, seq):
+            await release.wait()
+
+        task = asyncio.ensure_future(replay(proc, [(1, 0), (1, 1), (2, 0), (3, 0)], handle))
+        await asyncio.sleep(0.01)
+        during = proc.stats()
+        release.set()
+        await task
+        return during, proc.stats()
+
+    # User 1's second update waits for its chat, user 3's for a running slot
+    assert asyncio.run(scenario()) == ({'running': 2, 'waiting': 2}, {'running': 0, 'waiting': 0})
+
+
+def test_updates_without_a_user_are_not_serialized():
+    async def scenario():
+        proc = processor(4)
+        done = []
+
+        async def handle():
+            await asyncio.sleep(0.01)
+            done.append(1)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(proc.process_update(SimpleNamespace(effective_user=None), handle()) for _ in range(4)))
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) < 0.035
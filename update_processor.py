@@ -0,0 +1,141 @@
+"""
+Concurrent update processing that keeps every conversation in order.
+
+Updates from different users run at the same time, up to
+max_concurrent_updates at once. Updates of one conversation, meaning a user
+and whoever they are chatting with, run one after another in arrival order,
+so relayed messages keep their order and /next, /stop and a message from the
+partner cannot interleave. An update waiting for its conversation does not
+take a running slot, so a flood from one chat cannot hold up everyone else.
+
+Each user has a queue of their updates in arrival order. The update at its
+head starts once neither the user nor their partner is busy with another
+update and the partner has no older update waiting; it then claims both in
+one step. Nothing is held while waiting, so two partners can never deadlock,
+and a user's later updates stay behind the head even when the chat changes
+while it waits.
+"""
+import asyncio
+import itertools
+from collections import deque
+from telegram.ext import BaseUpdateProcessor
+import database as db
+
+# Updates allowed to wait for their conversation on top of the running ones
+MAX_WAITING_UPDATES = 1000
+
+
+class _Pending:
+    """An update waiting for, or holding, its conversation."""
+
+    __slots__ = ('seq', 'claimed', 'wakeup')
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.claimed = ()
+        self.wakeup = None
+
+
+def _user_id(update):
+    user = getattr(update, 'effective_user', None)
+    return user.id if user else None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs up to max_concurrent_updates updates at once, serialized per
+    conversation. partner_of(user_id) returns the user's current partner; it
+    must answer without waiting on I/O (db.get_partner reads memory), so the
+    partner cannot change between the check and the claim.
+    """
+
+    def __init__(self, max_concurrent_updates, max_waiting_updates=MAX_WAITING_UPDATES, partner_of=db.get_partner):
+        # PTB's own semaphore bounds running and waiting updates together
+        super().__init__(max_concurrent_updates + max_waiting_updates)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._partner_of = partner_of
+        self._seq = itertools.count()
+        self._queues = {}  # user_id -> deque of _Pending, oldest (possibly running) first
+        self._busy = set()  # users claimed by a running update
+        self._blocked = set()  # queue heads waiting for a busy user or an older partner update
+        self._updates = 0  # updates waiting or running
+        self._active = 0  # updates holding a running slot
+
+    def is_busy(self, user_id):
+        """Whether an update of this user is waiting or running; find_partner does not pair such users."""
+        return user_id in self._queues
+
+    def stats(self):
+        """Updates running, and waiting for their conversation or a running slot; /health reports both."""
+        return {'running': self._active, 'waiting': self._updates - self._active}
+
+    async def _run(self, coroutine):
+        async with self._running:
+            self._active += 1
+            try:
+                await coroutine
+            finally:
+                self._active -= 1
+
+    def _can_start(self, user_id, partner_id, pending):
+        if self._queues[user_id][0] is not pending or user_id in self._busy:
+            return False
+        if partner_id is None:
+            return True
+        if partner_id in self._busy:
+            return False
+        partner_queue = self._queues.get(partner_id)
+        return not partner_queue or partner_queue[0].seq > pending.seq
+
+    def _wake(self, pending):
+        if pending.wakeup is not None and not pending.wakeup.done():
+            pending.wakeup.set_result(None)
+
+    async def do_process_update(self, update, coroutine):
+        self._updates += 1
+        try:
+            user_id = _user_id(update)
+            if user_id is None:
+                # Not from a user (channel posts, polls, ...): nothing to keep in order
+                await self._run(coroutine)
+            else:
+                await self._process_in_order(user_id, coroutine)
+        finally:
+            self._updates -= 1
+
+    async def _process_in_order(self, user_id, coroutine):
+        pending = _Pending(next(self._seq))
+        queue = self._queues.setdefault(user_id, deque())
+        queue.append(pending)
+        try:
+            while True:
+                # The chat may change while waiting, so look the partner up on every try
+                partner_id = await self._partner_of(user_id)
+                if self._can_start(user_id, partner_id, pending):
+                    break
+                pending.wakeup = asyncio.get_running_loop().create_future()
+                if queue[0] is pending:
+                    self._blocked.add(pending)
+                try:
+                    await pending.wakeup
+                finally:
+                    self._blocked.discard(pending)
+                    pending.wakeup = None
+            pending.claimed = (user_id,) if partner_id is None else (user_id, partner_id)
+            self._busy.update(pending.claimed)
+            await self._run(coroutine)
+        finally:
+            queue.remove(pending)
+            if queue:
+                self._wake(queue[0])
+            else:
+                del self._queues[user_id]
+            self._busy.difference_update(pending.claimed)
+            for blocked in list(self._blocked):
+                self._wake(blocked)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass